@@ -4,10 +4,22 @@ Backend principal con FastAPI
 """
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any
 from pydantic import BaseModel
 from services.code_generator import CodeGenerator, get_file_extension
-from services.backtest_engine import BacktestEngine
+from services.bar_series import datetime_to_ns
+from services.batch import expand_runs, stream_batch
+from services.equity_curve import DEFAULT_EQUITY_POINTS, equity_store
+from services.job_manager import job_manager
+from services.optimizer import Optimizer, run_optimization_chunk
+from services.portfolio_engine import run_portfolio_job
+from services.result_cache import cached_backtest, result_cache
+from services.streaming import stream_backtest
+from services.walk_forward import WalkForwardAnalysis, run_walk_forward_window
+import asyncio
+import json
+import time
 import random
 from datetime import datetime, timedelta
 
@@ -45,6 +57,12 @@ app.add_middleware(
 # ENDPOINTS
 # ============================================
 
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """Detiene el pool de procesos de backtesting"""
+    job_manager.shutdown()
+
+
 @app.get("/")
 async def root():
     """Endpoint raíz de bienvenida"""
@@ -219,6 +237,19 @@ class BacktestRequest(BaseModel):
     config: Dict[str, Any]
 
 
+class BacktestJobResponse(BaseModel):
+    """Modelo para el estado de un trabajo de backtesting"""
+    jobId: str
+    status: str  # 'queued', 'running', 'completed', 'failed', 'cancelled'
+    submittedAt: float
+    finishedAt: float | None = None
+    elapsedSeconds: float
+    strategyName: str | None = None
+    symbol: str | None = None
+    timeframe: str | None = None
+    error: str | None = None
+
+
 class BacktestResponse(BaseModel):
     """Modelo para la respuesta de backtesting"""
     success: bool
@@ -229,7 +260,12 @@ class BacktestResponse(BaseModel):
     endDate: str
     metrics: Dict[str, Any]
     trades: List[Dict[str, Any]]
-    equityCurve: List[Dict[str, Any]]
+    equityCurve: List[Dict[str, Any]]  # Equity por barra reducida a config.equityPoints puntos
+    equityId: str | None = None  # Curva completa en /api/v1/backtest/equity/{equityId}
+    monteCarlo: Dict[str, Any] | None = None  # Distribuciones Monte Carlo (None si hay < 2 trades)
+    stopReason: str | None = None  # 'cancelled', 'max_bars', 'max_seconds', 'max_trades' (resultado parcial)
+    barsProcessed: int | None = None
+    cached: bool = False  # Resultado servido desde la caché de resultados
     error: str | None = None
 
 
@@ -465,11 +501,45 @@ def generate_mock_backtest_data(strategy: Dict[str, Any], config: Dict[str, Any]
     }
 
 
+def validate_backtest_request(strategy: Dict[str, Any]):
+    """Valida que la estrategia se pueda ejecutar"""
+    # Validar que haya estrategia
+    if not strategy:
+        raise HTTPException(status_code=400, detail="Estrategia no proporcionada")
+    
+    # Validar que haya bloques de entrada
+    if not strategy.get('entryBlocks') or len(strategy.get('entryBlocks', [])) == 0:
+        raise HTTPException(
+            status_code=400, 
+            detail="La estrategia debe tener al menos un bloque de entrada"
+        )
+
+
+def backtest_error_response(strategy: Dict[str, Any], config: Dict[str, Any], error: str) -> BacktestResponse:
+    """Respuesta de backtest fallido"""
+    return BacktestResponse(
+        success=False,
+        strategyName=strategy.get('name', '') if strategy else '',
+        symbol=config.get('symbol', '') if config else '',
+        timeframe=config.get('timeframe', '') if config else '',
+        startDate=config.get('startDate', '') if config else '',
+        endDate=config.get('endDate', '') if config else '',
+        metrics={},
+        trades=[],
+        equityCurve=[],
+        error=error
+    )
+
+
 @app.post("/api/v1/backtest", response_model=BacktestResponse)
 async def run_backtest(request: BacktestRequest):
     """
     Ejecuta un backtest de una estrategia con configuración específica
     
+    El backtest corre en el pool de procesos, así que no bloquea el resto de peticiones.
+    Una petición idéntica a otra anterior (misma estrategia, configuración y barras) se
+    sirve desde la caché de resultados.
+    
     Parámetros:
     - strategy: Objeto de estrategia con todas las reglas
     - config: Configuración del backtest (símbolo, fechas, balance inicial, etc.)
@@ -482,22 +552,11 @@ async def run_backtest(request: BacktestRequest):
         config = request.config
         
         print(f">> Ejecutando backtest para: {strategy.get('name', 'Unknown')}")
+        validate_backtest_request(strategy)
         
-        # Validar que haya estrategia
-        if not strategy:
-            raise HTTPException(status_code=400, detail="Estrategia no proporcionada")
-        
-        # Validar que haya bloques de entrada
-        if not strategy.get('entryBlocks') or len(strategy.get('entryBlocks', [])) == 0:
-            raise HTTPException(
-                status_code=400, 
-                detail="La estrategia debe tener al menos un bloque de entrada"
-            )
-        
-        # Ejecutar backtest con el motor real
+        # Ejecutar backtest con el motor real en el pool de procesos
         print(f">> Iniciando motor de backtest...")
-        engine = BacktestEngine(strategy, config)
-        result = engine.run()
+        result = await cached_backtest(strategy, config, job_manager)
         
         print(f">> Backtest completado: {result.get('metrics', {}).get('totalTrades', 0)} trades")
         
@@ -512,20 +571,359 @@ async def run_backtest(request: BacktestRequest):
         print(f">> Error en backtest: {str(e)}")
         print(f"Traceback:\n{error_detail}")
         
-        return BacktestResponse(
-            success=False,
-            strategyName=strategy.get('name', '') if strategy else '',
-            symbol=config.get('symbol', '') if config else '',
-            timeframe=config.get('timeframe', '') if config else '',
-            startDate=config.get('startDate', '') if config else '',
-            endDate=config.get('endDate', '') if config else '',
-            metrics={},
-            trades=[],
-            equityCurve=[],
-            error=f"{str(e)}\n\nVer logs del servidor para más detalles."
+        return backtest_error_response(
+            request.strategy, request.config,
+            f"{str(e)}\n\nVer logs del servidor para más detalles."
         )
 
 
+@app.get("/api/v1/backtest/cache")
+async def get_result_cache_stats():
+    """Estado de la caché de resultados (entradas, memoria, aciertos)"""
+    return result_cache.stats()
+
+
+@app.delete("/api/v1/backtest/cache")
+async def clear_result_cache():
+    """Vacía la caché de resultados"""
+    result_cache.clear()
+    return result_cache.stats()
+
+
+@app.get("/api/v1/backtest/equity/{equity_id}")
+async def get_equity_range(equity_id: str, start: str | None = None, end: str | None = None,
+                           points: int = DEFAULT_EQUITY_POINTS, method: str = 'minmax'):
+    """
+    Tramo de la curva de equity por barra de un backtest (zoom)
+    
+    - start/end: fechas ISO del tramo (por defecto, toda la curva)
+    - points: puntos máximos; si el tramo tiene menos barras se devuelve a resolución completa
+    - method: 'minmax' o 'lttb'
+    
+    Las curvas se guardan en memoria para los últimos backtests (KUMO_EQUITY_STORE_MAX_MB).
+    """
+    try:
+        start_ns = datetime_to_ns(start) if start else None
+        end_ns = datetime_to_ns(end) if end else None
+        equity_range = equity_store.range(equity_id, start_ns, end_ns, points, method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if equity_range is None:
+        raise HTTPException(status_code=404, detail=f"Curva de equity '{equity_id}' no disponible")
+    return equity_range
+
+
+@app.post("/api/v1/backtest/jobs", response_model=BacktestJobResponse, status_code=202)
+async def submit_backtest_job(request: BacktestRequest):
+    """
+    Envía un backtest al pool de procesos y retorna inmediatamente su id
+    
+    Consultar el estado en /api/v1/backtest/jobs/{jobId} y el resultado en
+    /api/v1/backtest/jobs/{jobId}/result
+    """
+    validate_backtest_request(request.strategy)
+    job = job_manager.submit_backtest(request.strategy, request.config)
+    print(f">> Backtest encolado: {job.id} ({request.strategy.get('name', 'Unknown')})")
+    return BacktestJobResponse(**job.to_dict())
+
+
+@app.get("/api/v1/backtest/jobs", response_model=List[BacktestJobResponse])
+async def list_backtest_jobs():
+    """Trabajos en curso y últimos terminados (incluye los backtests en streaming)"""
+    return [BacktestJobResponse(**job.to_dict()) for job in job_manager.jobs()]
+
+
+@app.get("/api/v1/backtest/jobs/{job_id}", response_model=BacktestJobResponse)
+async def get_backtest_job(job_id: str):
+    """Estado de un trabajo de backtesting"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo '{job_id}' no encontrado")
+    return BacktestJobResponse(**job.to_dict())
+
+
+@app.post("/api/v1/backtest/jobs/{job_id}/cancel", response_model=BacktestJobResponse)
+async def cancel_backtest_job(job_id: str):
+    """
+    Cancela un trabajo de backtesting
+    
+    Un trabajo en cola no llega a ejecutarse; uno en curso se detiene en su siguiente
+    comprobación y su resultado (parcial, con stopReason 'cancelled') sigue disponible.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo '{job_id}' no encontrado")
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"El trabajo está en estado '{job.status}'")
+    return BacktestJobResponse(**job.to_dict())
+
+
+@app.get("/api/v1/backtest/jobs/{job_id}/result", response_model=BacktestResponse)
+async def get_backtest_job_result(job_id: str):
+    """Resultado de un trabajo de backtesting terminado"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo '{job_id}' no encontrado")
+    if not job.done:
+        raise HTTPException(status_code=409, detail=f"El trabajo está en estado '{job.status}'")
+    if job.result is None:
+        return backtest_error_response({'name': job.metadata.get('strategyName', '')}, job.metadata, job.error or job.status)
+    return BacktestResponse(**job.result)
+
+
+@app.post("/api/v1/backtest/stream")
+async def stream_backtest_events(request: BacktestRequest):
+    """
+    Ejecuta un backtest emitiendo progreso y resultados parciales (Server-Sent Events)
+
+    Eventos (campo 'event' de SSE, datos en JSON):
+    - start: {symbol, timeframe, totalBars, jobId}
+    - progress: {barsProcessed, totalBars, trades, equity} cada config['progressInterval'] barras
+    - trade: {trade} en cada cierre
+    - equity: {point} con cada punto de la curva de equity
+    - complete: resultado final sin trades ni curva (ya enviados): metrics, monteCarlo...
+    - error: {error}
+
+    El backtest es un trabajo más del pool: jobId permite consultarlo o cancelarlo en
+    /api/v1/backtest/jobs/{jobId}. Si el cliente cierra la conexión, el backtest se detiene.
+    """
+    validate_backtest_request(request.strategy)
+    print(f">> Backtest en streaming para: {request.strategy.get('name', 'Unknown')}")
+
+    async def events():
+        async for event in stream_backtest(request.strategy, request.config, job_manager):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+class BatchBacktestRequest(BaseModel):
+    """Modelo para la solicitud de backtests por lotes"""
+    strategy: Dict[str, Any]
+    config: Dict[str, Any]  # Configuración base (fechas, balance, comisiones...)
+    runs: List[Dict[str, str]] = []  # [{'symbol': 'EURUSD', 'timeframe': '1h'}, ...]
+    symbols: List[str] = []  # Alternativa: producto symbols x timeframes
+    timeframes: List[str] = []
+
+
+@app.post("/api/v1/backtest/batch")
+async def run_backtest_batch(request: BatchBacktestRequest):
+    """
+    Ejecuta la estrategia sobre varias combinaciones de símbolo/temporalidad en paralelo
+    
+    Respuesta en streaming NDJSON (una línea JSON por evento):
+    - {"type": "result", "index", "symbol", "timeframe", "success", "metrics", ...}
+      en cuanto termina cada ejecución (en orden de finalización)
+    - {"type": "summary", "totalRuns", "totalNetProfit", "bestRun", ...} al final
+    """
+    validate_backtest_request(request.strategy)
+    try:
+        configs = expand_runs(request.config, request.runs, request.symbols, request.timeframes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    print(f">> Lote de {len(configs)} backtests para: {request.strategy.get('name', 'Unknown')}")
+    
+    async def events():
+        async for event in stream_batch(request.strategy, configs, job_manager):
+            yield json.dumps(event) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+class PortfolioBacktestRequest(BaseModel):
+    """Modelo para la solicitud de backtest de cartera"""
+    strategy: Dict[str, Any]
+    config: Dict[str, Any]  # Configuración con 'symbols' y, opcionalmente, 'maxOpenPositions'
+
+
+class PortfolioBacktestResponse(BaseModel):
+    """Modelo para la respuesta de backtest de cartera"""
+    success: bool
+    strategyName: str
+    symbols: List[str]
+    timeframe: str
+    startDate: str | None = None
+    endDate: str | None = None
+    metrics: Dict[str, Any]
+    symbolBreakdown: List[Dict[str, Any]]  # Trades y beneficio de cada símbolo
+    trades: List[Dict[str, Any]]  # Trades de todos los símbolos (con 'symbol')
+    equityCurve: List[Dict[str, Any]]  # Equity de la cartera en cada instante (reducida)
+    equityId: str | None = None  # Curva completa en /api/v1/backtest/equity/{equityId}
+    monteCarlo: Dict[str, Any] | None = None
+    stopReason: str | None = None  # 'max_bars', 'max_seconds', 'max_trades' (resultado parcial)
+    barsProcessed: int | None = None
+
+
+@app.post("/api/v1/backtest/portfolio", response_model=PortfolioBacktestResponse)
+async def run_portfolio_backtest(request: PortfolioBacktestRequest):
+    """
+    Ejecuta la estrategia sobre varios símbolos con un único balance y curva de equity
+
+    Las barras de todos los símbolos se recorren en orden temporal; puede haber una
+    posición abierta por símbolo, hasta config['maxOpenPositions'] a la vez.
+    """
+    validate_backtest_request(request.strategy)
+    if not request.config.get('symbols'):
+        raise HTTPException(status_code=400, detail="La cartera necesita al menos un símbolo (config.symbols)")
+
+    print(f">> Backtest de cartera ({', '.join(request.config['symbols'])}) para: "
+          f"{request.strategy.get('name', 'Unknown')}")
+    try:
+        result = equity_store.attach(await job_manager.run(run_portfolio_job, request.strategy, request.config))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback
+        print(f">> Error en backtest de cartera: {str(e)}")
+        print(f"Traceback:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=str(e))
+    print(f">> Cartera completada: {result['metrics'].get('totalTrades', 0)} trades")
+    return PortfolioBacktestResponse(**result)
+
+
+# ============================================
+# OPTIMIZACIÓN
+# ============================================
+
+class OptimizationRequest(BaseModel):
+    """Modelo para la solicitud de optimización por rejilla"""
+    strategy: Dict[str, Any]
+    config: Dict[str, Any]
+    parameters: List[Dict[str, Any]]  # [{'path': 'stopLoss.value', 'start': 10, 'stop': 50, 'step': 10}, ...]
+    sortBy: str = 'netProfit'
+    ascending: bool | None = None
+    limit: int | None = None  # Número de filas a retornar (por defecto, todas)
+
+
+class OptimizationResponse(BaseModel):
+    """Modelo para la respuesta de optimización"""
+    success: bool
+    strategyName: str
+    symbol: str
+    timeframe: str
+    startDate: str | None = None
+    endDate: str | None = None
+    totalCombinations: int
+    sortBy: str
+    elapsedSeconds: float
+    results: List[Dict[str, Any]]
+    error: str | None = None
+
+
+@app.post("/api/v1/optimize", response_model=OptimizationResponse)
+async def run_optimization(request: OptimizationRequest):
+    """
+    Optimiza los parámetros de una estrategia probando todas las combinaciones
+    
+    Las barras se cargan una vez y cada serie de indicador distinta se calcula una vez;
+    los backtests se reparten en lotes entre los procesos del pool.
+    
+    Parámetros:
+    - parameters: rutas de la estrategia con sus valores ('values') o rango ('start', 'stop', 'step')
+    - sortBy: métrica por la que ordenar (por defecto netProfit)
+    
+    Retorna:
+    - Tabla de métricas por combinación, ordenada por la métrica elegida
+    """
+    validate_backtest_request(request.strategy)
+    try:
+        optimizer = Optimizer(request.strategy, request.config, request.parameters,
+                              sort_by=request.sortBy, ascending=request.ascending)
+        
+        print(f">> Optimizando {request.strategy.get('name', 'Unknown')}: {len(optimizer.combinations)} combinaciones")
+        started = time.time()
+        
+        # Cargar datos e indicadores fuera del event loop
+        await asyncio.to_thread(optimizer.prepare)
+        chunk_results = await asyncio.gather(*(
+            job_manager.run(run_optimization_chunk, *args)
+            for args in optimizer.chunks(job_manager.max_workers)
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback
+        print(f">> Error en optimización: {str(e)}")
+        print(f"Traceback:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    result = optimizer.response(chunk_results, time.time() - started)
+    if request.limit:
+        result['results'] = result['results'][:request.limit]
+    print(f">> Optimización completada en {result['elapsedSeconds']}s")
+    return OptimizationResponse(**result)
+
+
+class WalkForwardRequest(OptimizationRequest):
+    """Modelo para la solicitud de walk-forward"""
+    trainDays: float = 90
+    testDays: float = 30
+    stepDays: float | None = None  # Por defecto, testDays (ventanas de prueba consecutivas)
+    anchored: bool = False  # True: el entrenamiento empieza siempre al inicio del rango
+
+
+class WalkForwardResponse(BaseModel):
+    """Modelo para la respuesta de walk-forward"""
+    success: bool
+    strategyName: str
+    symbol: str
+    timeframe: str
+    startDate: str | None = None
+    endDate: str | None = None
+    totalCombinations: int
+    sortBy: str
+    elapsedSeconds: float
+    windows: List[Dict[str, Any]]
+    metrics: Dict[str, Any]
+    trades: List[Dict[str, Any]]
+    equityCurve: List[Dict[str, Any]]
+    monteCarlo: Dict[str, Any] | None = None
+    error: str | None = None
+
+
+@app.post("/api/v1/walk-forward", response_model=WalkForwardResponse)
+async def run_walk_forward(request: WalkForwardRequest):
+    """
+    Validación walk-forward de una estrategia
+    
+    Divide el rango en ventanas de entrenamiento (trainDays) y prueba (testDays), optimiza la
+    rejilla de parámetros en cada entrenamiento y repite la mejor combinación en la prueba.
+    Las ventanas corren en paralelo sobre las mismas barras e indicadores precalculados.
+    
+    Retorna:
+    - Ventanas con sus parámetros ganadores y métricas dentro/fuera de muestra
+    - Trades, métricas y curva de equity fuera de muestra encadenadas
+    """
+    validate_backtest_request(request.strategy)
+    try:
+        optimizer = Optimizer(request.strategy, request.config, request.parameters,
+                              sort_by=request.sortBy, ascending=request.ascending)
+        analysis = WalkForwardAnalysis(optimizer, request.trainDays, request.testDays,
+                                       request.stepDays, request.anchored)
+        await asyncio.to_thread(analysis.prepare)
+        
+        print(f">> Walk-forward {request.strategy.get('name', 'Unknown')}: {len(analysis.windows)} ventanas "
+              f"x {len(optimizer.combinations)} combinaciones")
+        started = time.time()
+        window_results = await asyncio.gather(*(
+            job_manager.run(run_walk_forward_window, *args)
+            for args in analysis.window_args()
+        ))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback
+        print(f">> Error en walk-forward: {str(e)}")
+        print(f"Traceback:\n{traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    result = analysis.response(window_results, time.time() - started)
+    print(f">> Walk-forward completado en {result['elapsedSeconds']}s")
+    return WalkForwardResponse(**result)
+
+
 if __name__ == "__main__":
     import uvicorn
     # Ejecutar el servidor en el puerto 8000
@@ -3,65 +3,48 @@ Motor de Backtesting para Kumo
 Ejecuta estrategias de trading con datos históricos
 """
 import numpy as np
+import os
+import time
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Tuple
-import random
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union
 
+from .bar_archive import ArchiveRange
+from .bar_series import BarSeries, datetime_to_ns, ns_to_datetime
+from .indicator_cache import indicator_cache
+from .jit import JIT_ENABLED, position_loop
+from .indicators import spec_key
+from .vector_indicators import precompute_indicators
+from .equity_curve import DEFAULT_EQUITY_POINTS, downsample_curve
+from .metrics import bar_equity, compute_metrics
+from .monte_carlo import DEFAULT_RUIN_THRESHOLD, DEFAULT_SIMULATIONS, monte_carlo
+from .trade_ledger import Trade, TradeLedger
+from .signal_engine import CONDITION_FUNCTIONS, CROSS_CONDITIONS, LONG, block_direction, compile_signals, crossed
 
-class Trade:
-    """Representa una operación de trading"""
-    def __init__(self, trade_id: int, trade_type: str, entry_time: datetime, 
-                 entry_price: float, size: float):
-        self.id = trade_id
-        self.type = trade_type  # 'long' or 'short'
-        self.entry_time = entry_time
-        self.entry_price = entry_price
-        self.size = size
-        self.exit_time = None
-        self.exit_price = None
-        self.profit = 0
-        self.profit_percent = 0
-        self.pips = 0
-        self.duration = 0
-        self.entry_reason = ""
-        self.exit_reason = ""
-        
-    def close(self, exit_time: datetime, exit_price: float, exit_reason: str):
-        """Cierra la operación"""
-        self.exit_time = exit_time
-        self.exit_price = exit_price
-        self.exit_reason = exit_reason
-        
-        # Calcular duración
-        self.duration = int((exit_time - self.entry_time).total_seconds())
-        
-        # Calcular profit
-        if self.type == 'long':
-            self.pips = (exit_price - self.entry_price) * 10000
-            self.profit = (exit_price - self.entry_price) * self.size * 100000  # 1 lote = 100,000 unidades
-        else:
-            self.pips = (self.entry_price - exit_price) * 10000
-            self.profit = (self.entry_price - exit_price) * self.size * 100000
-            
-        self.profit_percent = (self.profit / (self.entry_price * self.size * 100000)) * 100
-        
-    def to_dict(self) -> Dict:
-        """Convierte el trade a diccionario"""
-        return {
-            'id': self.id,
-            'entryTime': self.entry_time.isoformat(),
-            'exitTime': self.exit_time.isoformat() if self.exit_time else None,
-            'type': self.type,
-            'entryPrice': round(self.entry_price, 5),
-            'exitPrice': round(self.exit_price, 5) if self.exit_price else None,
-            'size': self.size,
-            'profit': round(self.profit, 2),
-            'profitPercent': round(self.profit_percent, 2),
-            'pips': round(self.pips, 1),
-            'duration': self.duration,
-            'entryReason': self.entry_reason,
-            'exitReason': self.exit_reason
-        }
+
+# Modelos de ejecución de stop loss / take profit:
+# 'intrabar': niveles contra high/low, ejecución en el nivel (o en la apertura si hay gap)
+# 'close': niveles contra el cierre, ejecución al cierre (comportamiento anterior)
+EXECUTION_MODELS = ('intrabar', 'close')
+
+# Qué nivel se ejecuta cuando una misma barra toca stop loss y take profit
+# 'stop_first': el stop (conservador); 'target_first': el objetivo;
+# 'nearest_open': el nivel más cercano a la apertura de la barra
+SAME_BAR_POLICIES = ('stop_first', 'target_first', 'nearest_open')
+
+# Barras entre dos eventos de progreso (con on_event)
+DEFAULT_PROGRESS_INTERVAL = 500
+
+# Barras entre dos consultas del token de cancelación (consultarlo cruza procesos)
+CANCEL_CHECK_INTERVAL = 1000
+
+
+class BacktestStopped(Exception):
+    """El backtest se detiene antes del final (cancelación o límite alcanzado)"""
+
+    def __init__(self, reason: str, index: int):
+        super().__init__(reason)
+        self.reason = reason  # 'cancelled', 'max_seconds' o 'max_trades'
+        self.index = index  # Última barra procesada
 
 
 class IndicatorCalculator:
@@ -169,25 +152,87 @@ class IndicatorCalculator:
 class BacktestEngine:
     """Motor principal de backtesting"""
     
-    def __init__(self, strategy: Dict[str, Any], config: Dict[str, Any]):
+    def __init__(self, strategy: Dict[str, Any], config: Dict[str, Any],
+                 bars: Optional[Union[BarSeries, ArchiveRange]] = None,
+                 indicator_cache: Optional[Dict[Any, np.ndarray]] = None,
+                 on_event: Optional[Callable[[Dict[str, Any]], Any]] = None,
+                 cancel_token: Optional[Any] = None):
+        """
+        bars: barras ya cargadas o su ArchiveRange (si no se indican, se obtienen del
+            proveedor de datos)
+        indicator_cache: series de indicadores compartidas entre varios backtests sobre
+            las mismas barras; las que falten se calculan y se añaden
+        on_event: callback que recibe los eventos del backtest mientras corre
+            ('start', 'progress', 'trade', 'equity'), para emitir resultados parciales
+        cancel_token: objeto con is_set() (threading/multiprocessing Event); si se activa,
+            el backtest se detiene y retorna los resultados parciales
+        """
         self.strategy = strategy
         self.config = config
-        self.trades: List[Trade] = []
+        self.trades = TradeLedger()
         self.open_trade: Optional[Trade] = None
         self.balance = config.get('initialBalance', 10000)
         self.initial_balance = self.balance
         self.equity_curve = []
+        self.bar_equity: Optional[np.ndarray] = None  # Equity al cierre de cada barra (tras run)
         self.trade_counter = 0
         
         # Parámetros de trading
         self.commission_rate = config.get('commission', 0.02) / 100
         self.slippage_pips = config.get('slippage', 2)
         
-        # Historial de precios para indicadores
-        self.high_history: List[float] = []
-        self.low_history: List[float] = []
-        
-    def generate_price_data(self, num_bars: int = 1000) -> List[Dict[str, Any]]:
+        # 'compiled': señales precalculadas como arrays; 'bar': evaluación barra a barra
+        self.signal_mode = config.get('signalMode', 'compiled')
+        
+        # Ejecución de stop loss / take profit dentro de la barra
+        self.execution_model = config.get('executionModel', 'intrabar')
+        if self.execution_model not in EXECUTION_MODELS:
+            raise ValueError(f"Modelo de ejecución no soportado: {self.execution_model}")
+        self.same_bar_policy = config.get('sameBarPolicy', 'stop_first')
+        if self.same_bar_policy not in SAME_BAR_POLICIES:
+            raise ValueError(f"Política de barra ambigua no soportada: {self.same_bar_policy}")
+        
+        # Barras que tocan stop loss y take profit: repetirlas en una temporalidad menor
+        # (M1 por defecto) para saber qué nivel se tocó primero
+        self.drill_down = config.get('intrabarDrillDown', False)
+        self.drill_down_timeframe = config.get('drillDownTimeframe', '1')
+        self._drill_down_bars: Optional[BarSeries] = None
+        self.ambiguous_bars = 0
+        self.drill_down_resolved = 0
+        
+        # Series de indicadores precalculadas (una por indicador/parámetros distintos)
+        self.indicator_values: Dict[Any, np.ndarray] = {}
+        self._indicator_keys: Dict[Tuple[str, int, Optional[str]], Any] = {}
+        self._bar_index = 0
+        self._event_index = 0  # Barra del último evento emitido
+        self.bars: BarSeries = BarSeries.empty()
+        self._max_balance = self.balance
+        self._preloaded_bars = bars
+        self._indicator_cache = indicator_cache
+        # Identidad de las barras para la caché de indicadores: la huella del ArchiveRange
+        # si vienen del archivo .kbar (sin leerlas); None = huella del contenido
+        self._dataset_id: Optional[str] = None
+        
+        # Sin logs por operación (optimizaciones con cientos de backtests)
+        self.verbose = config.get('verbose', True)
+        
+        # Eventos de progreso y resultados parciales
+        self.on_event = on_event
+        self.progress_interval = max(1, int(config.get('progressInterval', DEFAULT_PROGRESS_INTERVAL)))
+        self._last_progress = -1
+        
+        # Cancelación cooperativa y límites por ejecución (maxBars, maxSeconds, maxTrades).
+        # KUMO_BACKTEST_MAX_SECONDS fija un máximo de segundos para todas las ejecuciones
+        self.cancel_token = cancel_token
+        self.max_bars = config.get('maxBars') or 0
+        self.max_trades = config.get('maxTrades') or 0
+        limits = [float(v) for v in (config.get('maxSeconds'), os.getenv('KUMO_BACKTEST_MAX_SECONDS')) if v and float(v) > 0]
+        self.max_seconds = min(limits) if limits else 0
+        self.stop_reason: Optional[str] = None
+        self._started = 0.0
+        self._last_cancel_check = 0
+        
+    def generate_price_data(self, num_bars: int = 1000) -> BarSeries:
         """
         Obtiene datos de precios reales o simulados
         """
@@ -202,10 +247,11 @@ class BacktestEngine:
             
             print(f"[BACKTEST] Obteniendo datos reales: {symbol} {timeframe} {start_date} - {end_date}")
             
-            bars = data_provider.get_forex_data(symbol, timeframe, start_date, end_date)
+            bars, archive = data_provider.get_forex_source(symbol, timeframe, start_date, end_date)
             
-            if bars and len(bars) > 50:  # Necesitamos al menos 50 barras para indicadores
+            if len(bars) > 50:  # Necesitamos al menos 50 barras para indicadores
                 print(f"[BACKTEST] Datos reales obtenidos: {len(bars)} barras")
+                self._dataset_id = archive.fingerprint() if archive is not None else None
                 return bars
             else:
                 print(f"[BACKTEST] Datos reales insuficientes, usando fallback")
@@ -216,11 +262,9 @@ class BacktestEngine:
             print(f"[BACKTEST] Usando datos simulados como fallback")
             return self._generate_fallback_data(num_bars)
     
-    def _generate_fallback_data(self, num_bars: int = 1000) -> List[Dict[str, Any]]:
+    def _generate_fallback_data(self, num_bars: int = 1000) -> BarSeries:
         """Genera datos simulados como fallback"""
-        bars = []
         base_price = 1.1000  # Para EURUSD
-        current_price = base_price
         start_date = datetime.fromisoformat(self.config.get('startDate', '2024-01-01'))
         
         # Timeframe en minutos
@@ -231,44 +275,35 @@ class BacktestEngine:
         }
         tf_minutes = timeframe_map.get(self.config.get('timeframe', '60'), 60)
         
-        for i in range(num_bars):
-            # Simular movimiento de precio (random walk con tendencia)
-            change = np.random.normal(0, 0.0005)  # Volatilidad
-            trend = 0.00001 if i % 100 < 60 else -0.00001  # Tendencia periódica
-            current_price += change + trend
-            
-            # Generar OHLC
-            high = current_price + abs(np.random.normal(0, 0.0003))
-            low = current_price - abs(np.random.normal(0, 0.0003))
-            open_price = current_price + np.random.normal(0, 0.0002)
-            close = current_price
-            
-            bar_time = start_date + timedelta(minutes=i * tf_minutes)
-            
-            bars.append({
-                'time': bar_time,
-                'open': open_price,
-                'high': high,
-                'low': low,
-                'close': close,
-                'volume': random.randint(100, 1000)
-            })
-            
-        return bars
+        # Simular movimiento de precio (random walk con tendencia periódica)
+        i = np.arange(num_bars)
+        change = np.random.normal(0, 0.0005, num_bars)  # Volatilidad
+        trend = np.where(i % 100 < 60, 0.00001, -0.00001)
+        close = base_price + np.cumsum(change + trend)
+        
+        # Generar OHLC
+        return BarSeries(
+            datetime_to_ns(start_date) + i * (tf_minutes * 60 * 10**9),
+            close + np.random.normal(0, 0.0002, num_bars),
+            close + np.abs(np.random.normal(0, 0.0003, num_bars)),
+            close - np.abs(np.random.normal(0, 0.0003, num_bars)),
+            close,
+            np.random.randint(100, 1001, num_bars)
+        )
     
-    def evaluate_condition(self, condition: Dict[str, Any], bar: Dict[str, Any], 
-                          price_history: List[float]) -> bool:
+    def evaluate_condition(self, condition: Dict[str, Any], bar: Dict[str, Any]) -> bool:
         """
         Evalúa una condición individual
         """
         indicator_type = condition['indicator']['indicator']
         parameters = condition['indicator']['parameters']
+        timeframe = condition['indicator'].get('timeframe')
         condition_type = condition['condition']
         comparison_value = condition['comparisonValue']
         
         # Calcular valor del indicador
         indicator_value = self.calculate_indicator_value(
-            indicator_type, parameters, bar, price_history
+            indicator_type, parameters, bar, timeframe
         )
         
         if indicator_value is None:
@@ -281,7 +316,8 @@ class BacktestEngine:
             compare_to = self.calculate_indicator_value(
                 comparison_value['indicatorValue']['indicator'],
                 comparison_value['indicatorValue']['parameters'],
-                bar, price_history
+                bar,
+                comparison_value['indicatorValue'].get('timeframe')
             )
         else:
             compare_to = 0  # Variables no implementadas aún
@@ -290,55 +326,73 @@ class BacktestEngine:
             return False
         
         # Evaluar condición
-        conditions_map = {
-            'greater_than': lambda a, b: a > b,
-            'less_than': lambda a, b: a < b,
-            'equal': lambda a, b: abs(a - b) < 0.0001,
-            'greater_equal': lambda a, b: a >= b,
-            'less_equal': lambda a, b: a <= b,
-            'crosses_above': lambda a, b: a > b,  # Simplificado
-            'crosses_below': lambda a, b: a < b,  # Simplificado
-        }
+        if condition_type in CROSS_CONDITIONS:
+            # Cruce real: comparar también con los valores de la barra anterior
+            prev_index = self._bar_index - 1
+            if prev_index < 0:
+                return False
+            prev_value = self._value_at(indicator_type, parameters, prev_index, timeframe)
+            if comparison_value['type'] == 'indicator':
+                prev_compare_to = self._value_at(
+                    comparison_value['indicatorValue']['indicator'],
+                    comparison_value['indicatorValue']['parameters'],
+                    prev_index,
+                    comparison_value['indicatorValue'].get('timeframe')
+                )
+            else:
+                prev_compare_to = compare_to
+            return crossed(condition_type, indicator_value, compare_to, prev_value, prev_compare_to)
         
-        condition_func = conditions_map.get(condition_type)
+        condition_func = CONDITION_FUNCTIONS.get(condition_type)
         if condition_func:
             return condition_func(indicator_value, compare_to)
         
         return False
     
     def calculate_indicator_value(self, indicator_type: str, parameters: Dict[str, Any],
-                                  bar: Dict[str, Any], price_history: List[float]) -> Optional[float]:
-        """Calcula el valor de un indicador"""
-        period = parameters.get('period', 14)
-        
-        if indicator_type == 'close':
-            return bar['close']
-        elif indicator_type == 'open':
-            return bar['open']
-        elif indicator_type == 'high':
-            return bar['high']
-        elif indicator_type == 'low':
-            return bar['low']
-        elif indicator_type == 'sma':
-            return IndicatorCalculator.calculate_sma(price_history, period)
-        elif indicator_type == 'ema':
-            return IndicatorCalculator.calculate_ema(price_history, period)
-        elif indicator_type == 'rsi':
-            return IndicatorCalculator.calculate_rsi(price_history, period)
-        elif indicator_type == 'macd':
-            result = IndicatorCalculator.calculate_macd(price_history)
-            return result[0] if result else None
-        elif indicator_type == 'stochastic':
-            result = IndicatorCalculator.calculate_stochastic(
-                self.high_history, self.low_history, price_history, period
-            )
-            return result[0] if result else None  # Retorna %K
-        elif indicator_type == 'ma':  # Alias para SMA
-            return IndicatorCalculator.calculate_sma(price_history, period)
-        
-        return None
+                                  bar: Dict[str, Any], timeframe: Optional[str] = None) -> Optional[float]:
+        """
+        Calcula el valor de un indicador
+
+        Los indicadores se leen de las series precalculadas antes del bucle
+        (ver precompute_indicators), indexadas por la barra actual. Con 'timeframe'
+        el indicador es el de esa temporalidad (última barra mayor ya cerrada).
+        """
+        return self._value_at(indicator_type, parameters, self._bar_index, timeframe)
+    
+    def _value_at(self, indicator_type: str, parameters: Dict[str, Any], index: int,
+                  timeframe: Optional[str] = None) -> Optional[float]:
+        """Valor de un indicador en una barra concreta (None si no está disponible)"""
+        # Cachear la clave normalizada por objeto de parámetros de la regla
+        cache_id = (indicator_type, id(parameters), timeframe)
+        key = self._indicator_keys.get(cache_id)
+        if key is None:
+            key = spec_key({'indicator': indicator_type, 'parameters': parameters, 'timeframe': timeframe})
+            if key is None:
+                return None
+            self._indicator_keys[cache_id] = key
+        
+        if key[0] in ('close', 'open', 'high', 'low'):
+            series = self.bars.column(key[0])
+        else:
+            series = self.indicator_values.get(key)
+        if series is None:
+            return None
+        value = series[index]
+        if value != value:  # NaN: periodo de calentamiento
+            return None
+        return float(value)
     
-    def check_entry_conditions(self, bar: Dict[str, Any], price_history: List[float]) -> Optional[str]:
+    def precompute_indicators(self, bars: BarSeries):
+        """Calcula una sola vez la serie completa de cada indicador de la estrategia"""
+        self.bars = bars
+        cache = self._indicator_cache
+        if cache is None:
+            # Caché del proceso: series ya calculadas por otras peticiones sobre estas barras
+            cache = indicator_cache.view(bars, dataset_id=self._dataset_id)
+        self.indicator_values = precompute_indicators(self.strategy, bars, cache)
+    
+    def check_entry_conditions(self, bar: Dict[str, Any]) -> Optional[str]:
         """Verifica si se cumplen condiciones de entrada"""
         entry_blocks = self.strategy.get('entryBlocks', [])
         
@@ -356,26 +410,28 @@ class BacktestEngine:
             
             # Evaluar todas las reglas (AND lógico)
             all_conditions_met = True
-            should_log = len(price_history) == 51 or len(price_history) == 100  # Log en barras específicas
+            bar_number = self._bar_index + 1
+            should_log = bar_number == 51 or bar_number == 100  # Log en barras específicas
             
             if should_log and self._debug_log_count < 5:
-                print(f"\n>> Evaluando reglas en barra {len(price_history)}:")
+                print(f"\n>> Evaluando reglas en barra {bar_number}:")
                 self._debug_log_count += 1
             
             for rule_idx, rule in enumerate(rules):
-                result = self.evaluate_condition(rule, bar, price_history)
+                result = self.evaluate_condition(rule, bar)
                 
                 # Debug: imprimir valores de indicadores (solo en las primeras barras)
                 if should_log and self._debug_log_count <= 5:
                     ind = rule['indicator']['indicator']
                     params = rule['indicator']['parameters']
-                    val = self.calculate_indicator_value(ind, params, bar, price_history)
+                    val = self.calculate_indicator_value(ind, params, bar, rule['indicator'].get('timeframe'))
                     
                     comp_val = rule.get('comparisonValue', {})
                     if comp_val.get('type') == 'indicator':
                         comp_ind = comp_val['indicatorValue']['indicator']
                         comp_params = comp_val['indicatorValue']['parameters']
-                        comp_to = self.calculate_indicator_value(comp_ind, comp_params, bar, price_history)
+                        comp_to = self.calculate_indicator_value(comp_ind, comp_params, bar,
+                                                                 comp_val['indicatorValue'].get('timeframe'))
                         
                         # Formatear valores, manejando None
                         val_str = f"{val:.5f}" if val is not None else "None (indicador no implementado)"
@@ -393,18 +449,13 @@ class BacktestEngine:
             if all_conditions_met:
                 # print(f">> SEÑAL DE ENTRADA DETECTADA en bloque {block_idx}")  # Comentado para evitar spam
                 # Determinar tipo de entrada de las acciones
-                actions = block.get('actions', [])
-                for action in actions:
-                    action_type = action.get('type', '')
-                    # Mapear acciones del Designer a tipos de entrada
-                    if action_type in ['open_long', 'buy_market']:
-                        return 'long'
-                    elif action_type in ['open_short', 'sell_market']:
-                        return 'short'
+                entry_type = block_direction(block)
+                if entry_type:
+                    return entry_type
         
         return None
     
-    def check_exit_conditions(self, bar: Dict[str, Any], price_history: List[float]) -> Optional[str]:
+    def check_exit_conditions(self, bar: Dict[str, Any]) -> Optional[str]:
         """Verifica si se cumplen condiciones de salida"""
         exit_blocks = self.strategy.get('exitBlocks', [])
         
@@ -419,7 +470,7 @@ class BacktestEngine:
             # Evaluar todas las reglas (AND lógico)
             all_conditions_met = True
             for rule in rules:
-                if not self.evaluate_condition(rule, bar, price_history):
+                if not self.evaluate_condition(rule, bar):
                     all_conditions_met = False
                     break
             
@@ -428,162 +479,524 @@ class BacktestEngine:
         
         return None
     
-    def check_stop_loss_take_profit(self, bar: Dict[str, Any]) -> Optional[str]:
-        """Verifica stop loss y take profit"""
-        if not self.open_trade:
-            return None
-        
-        current_price = bar['close']
+    def stop_distances(self) -> Tuple[Optional[float], Optional[float]]:
+        """Distancia en precio del stop loss y del take profit a la entrada (None si están desactivados)"""
+        sl_distance = None
+        tp_distance = None
         
         # Stop Loss
         stop_loss = self.strategy.get('stopLoss')
         if stop_loss and stop_loss.get('enabled'):
             sl_value = stop_loss.get('value', 50)
             sl_pips = sl_value if stop_loss.get('type') == 'pips' else sl_value * 10
-            
-            if self.open_trade.type == 'long':
-                sl_price = self.open_trade.entry_price - (sl_pips * 0.0001)
-                if current_price <= sl_price:
-                    return 'stop_loss'
-            else:
-                sl_price = self.open_trade.entry_price + (sl_pips * 0.0001)
-                if current_price >= sl_price:
-                    return 'stop_loss'
+            sl_distance = sl_pips * 0.0001
         
         # Take Profit
         take_profit = self.strategy.get('takeProfit')
         if take_profit and take_profit.get('enabled'):
             tp_value = take_profit.get('value', 100)
             tp_pips = tp_value if take_profit.get('type') == 'pips' else tp_value * 10
+            tp_distance = tp_pips * 0.0001
+        
+        return sl_distance, tp_distance
+    
+    def stop_levels(self, trade: Trade) -> Tuple[Optional[float], Optional[float]]:
+        """Precios de stop loss y take profit de un trade (None si están desactivados)"""
+        direction = 1 if trade.type == 'long' else -1
+        sl_distance, tp_distance = self.stop_distances()
+        sl_price = trade.entry_price - direction * sl_distance if sl_distance is not None else None
+        tp_price = trade.entry_price + direction * tp_distance if tp_distance is not None else None
+        return sl_price, tp_price
+    
+    def check_stop_loss_take_profit(self, bar: Dict[str, Any]) -> Tuple[Optional[str], Optional[float]]:
+        """Verifica stop loss y take profit: retorna (motivo, precio de ejecución)"""
+        if not self.open_trade:
+            return None, None
+        sl_price, tp_price = self.stop_levels(self.open_trade)
+        return self.resolve_stop_exit(sl_price, tp_price, bar['open'], bar['high'], bar['low'], bar['close'],
+                                      self._bar_index)
+    
+    def resolve_stop_exit(self, sl_price: Optional[float], tp_price: Optional[float],
+                          open_price: float, high: float, low: float, close: float,
+                          index: Optional[int] = None) -> Tuple[Optional[str], Optional[float]]:
+        """
+        Decide si el trade abierto sale por stop loss o take profit en una barra
+
+        En el modelo 'intrabar' los niveles se comparan con high/low y se ejecutan en el
+        propio nivel, o en la apertura si la barra abre más allá del nivel (gap). Si la
+        barra toca ambos niveles, se repite en la temporalidad menor (con 'intrabarDrillDown'
+        y el índice de la barra) y, si no se puede, decide 'same_bar_policy'.
+        """
+        is_long = self.open_trade.type == 'long'
+        
+        if self.execution_model == 'close':
+            if sl_price is not None and (close <= sl_price if is_long else close >= sl_price):
+                return 'stop_loss', close
+            if tp_price is not None and (close >= tp_price if is_long else close <= tp_price):
+                return 'take_profit', close
+            return None, None
+        
+        # Precio adverso / favorable de la barra según la dirección
+        adverse, favorable = (low, high) if is_long else (high, low)
+        sl_hit = sl_price is not None and (adverse <= sl_price if is_long else adverse >= sl_price)
+        tp_hit = tp_price is not None and (favorable >= tp_price if is_long else favorable <= tp_price)
+        if not sl_hit and not tp_hit:
+            return None, None
+        
+        sl_gap = sl_hit and (open_price <= sl_price if is_long else open_price >= sl_price)
+        tp_gap = tp_hit and (open_price >= tp_price if is_long else open_price <= tp_price)
+        
+        if sl_hit and tp_hit:
+            drilled = None
+            if not (sl_gap or tp_gap) and self.drill_down and index is not None:
+                self.ambiguous_bars += 1
+                drilled = self.drill_down_first_level(index, sl_price, tp_price, is_long)
             
-            if self.open_trade.type == 'long':
-                tp_price = self.open_trade.entry_price + (tp_pips * 0.0001)
-                if current_price >= tp_price:
-                    return 'take_profit'
+            if sl_gap or tp_gap:
+                # La apertura ya está más allá de un nivel: ese se ejecuta primero
+                reason = 'stop_loss' if sl_gap else 'take_profit'
+            elif drilled is not None:
+                self.drill_down_resolved += 1
+                reason = drilled
+            elif self.same_bar_policy == 'target_first':
+                reason = 'take_profit'
+            elif self.same_bar_policy == 'nearest_open':
+                reason = 'stop_loss' if abs(open_price - sl_price) <= abs(tp_price - open_price) else 'take_profit'
             else:
-                tp_price = self.open_trade.entry_price - (tp_pips * 0.0001)
-                if current_price <= tp_price:
-                    return 'take_profit'
+                reason = 'stop_loss'
+        else:
+            reason = 'stop_loss' if sl_hit else 'take_profit'
         
-        return None
+        if reason == 'stop_loss':
+            return reason, open_price if sl_gap else sl_price
+        return reason, open_price if tp_gap else tp_price
     
-    def run(self) -> Dict[str, Any]:
-        """Ejecuta el backtest completo"""
-        # Debug: info de la estrategia
-        print(f"\n>> ESTRATEGIA: {self.strategy.get('name', 'Unknown')}")
-        print(f">> Entry Blocks: {len(self.strategy.get('entryBlocks', []))}")
-        print(f">> Exit Blocks: {len(self.strategy.get('exitBlocks', []))}")
-        
-        # Debug: mostrar reglas de entrada
-        for idx, block in enumerate(self.strategy.get('entryBlocks', [])):
-            print(f">> Entry Block {idx}: {len(block.get('rules', []))} reglas, {len(block.get('actions', []))} acciones")
-            if block.get('rules'):
-                for rule_idx, rule in enumerate(block['rules']):
-                    ind = rule.get('indicator', {}).get('indicator', 'unknown')
-                    cond = rule.get('condition', 'unknown')
-                    print(f"   - Regla {rule_idx}: {ind} {cond}")
-        
-        # Generar datos de precio
-        bars = self.generate_price_data()
-        print(f">> Barras generadas: {len(bars)}")
-        price_history = []
-        
-        max_balance = self.initial_balance
-        max_drawdown = 0
-        max_drawdown_percent = 0
+    def drill_down_bars(self) -> BarSeries:
+        """
+        Barras de la temporalidad menor para todo el rango del backtest
+
+        Se cargan una sola vez, en la primera barra ambigua, desde el almacén de datos
+        (caché en disco mapeada en memoria). Nunca se usan datos simulados: sin datos
+        reales la serie queda vacía y se aplica 'same_bar_policy'.
+        """
+        if self._drill_down_bars is None:
+            from .data_provider import data_provider
+            
+            start = ns_to_datetime(self.bars.time[0])
+            end = ns_to_datetime(self.bars.time[-1] + self._bar_duration())
+            self._drill_down_bars = data_provider.get_forex_data(
+                self.config.get('symbol', 'EURUSD'), self.drill_down_timeframe,
+                start.isoformat(), end.isoformat(), fallback=False
+            )
+            if self.verbose:
+                print(f">> Drill-down: {len(self._drill_down_bars)} barras de {self.drill_down_timeframe}")
+        return self._drill_down_bars
+    
+    def _bar_duration(self) -> int:
+        """Duración de una barra en ns (mediana de la separación entre barras)"""
+        if len(self.bars) < 2:
+            return 60 * 10**9
+        return int(np.median(np.diff(self.bars.time[:1000])))
+    
+    def drill_down_first_level(self, index: int, sl_price: float, tp_price: float,
+                               is_long: bool) -> Optional[str]:
+        """
+        Repite una barra ambigua con las barras de la temporalidad menor que contiene
+
+        Retorna el nivel que se tocó primero ('stop_loss' / 'take_profit') o None si no hay
+        datos de la temporalidad menor para esa barra.
+        """
+        bar_start = int(self.bars.time[index])
+        if index + 1 < len(self.bars):
+            bar_end = int(self.bars.time[index + 1]) - 1
+        else:
+            bar_end = bar_start + self._bar_duration() - 1
+        sub = self.drill_down_bars().between(bar_start, bar_end)
+        if len(sub) == 0:
+            return None
         
-        # Punto inicial de equity
-        self.equity_curve.append({
-            'time': bars[0]['time'].isoformat(),
-            'equity': self.balance,
-            'drawdown': 0
-        })
+        adverse, favorable = (sub.low, sub.high) if is_long else (sub.high, sub.low)
+        sl_hit = adverse <= sl_price if is_long else adverse >= sl_price
+        tp_hit = favorable >= tp_price if is_long else favorable <= tp_price
+        hits = np.flatnonzero(sl_hit | tp_hit)
+        if not len(hits):
+            return None
+        
+        k = hits[0]
+        if sl_hit[k] and tp_hit[k]:
+            # También ambigua en la temporalidad menor: decide la apertura o la política
+            sub_open = sub.open[k]
+            if sub_open <= sl_price if is_long else sub_open >= sl_price:
+                return 'stop_loss'
+            if sub_open >= tp_price if is_long else sub_open <= tp_price:
+                return 'take_profit'
+            return None
+        return 'stop_loss' if sl_hit[k] else 'take_profit'
+    
+    def find_exit(self, start: int, exit_mask: np.ndarray) -> Tuple[Optional[int], Optional[str], Optional[float]]:
+        """
+        Busca vectorialmente la primera barra >= start en la que se cierra el trade abierto
+
+        Retorna (barra, motivo, precio de ejecución). Mantiene la prioridad barra a barra:
+        stop loss / take profit (dentro de la barra) antes que la señal de salida (al cierre).
+        Escanea por tramos crecientes para no recorrer toda la serie en trades cortos.
+        """
+        bars = self.bars
+        n = len(bars)
+        sl_price, tp_price = self.stop_levels(self.open_trade)
+        is_long = self.open_trade.type == 'long'
+        
+        if self.execution_model == 'intrabar':
+            adverse, favorable = (bars.low, bars.high) if is_long else (bars.high, bars.low)
+        else:
+            adverse = favorable = bars.close
+        
+        chunk = 256
+        while start < n:
+            end = min(n, start + chunk)
+            no_hit = np.zeros(end - start, dtype=bool)
+            
+            if sl_price is None:
+                sl_hit = no_hit
+            else:
+                window = adverse[start:end]
+                sl_hit = window <= sl_price if is_long else window >= sl_price
+            if tp_price is None:
+                tp_hit = no_hit
+            else:
+                window = favorable[start:end]
+                tp_hit = window >= tp_price if is_long else window <= tp_price
+            exit_hit = exit_mask[start:end]
+            
+            hits = np.flatnonzero(sl_hit | tp_hit | exit_hit)
+            if len(hits):
+                i = start + int(hits[0])
+                if sl_hit[hits[0]] or tp_hit[hits[0]]:
+                    reason, price = self.resolve_stop_exit(
+                        sl_price, tp_price, float(bars.open[i]), float(bars.high[i]),
+                        float(bars.low[i]), float(bars.close[i]), i
+                    )
+                    return i, reason, price
+                return i, 'exit_signal', float(bars.close[i])
+            
+            self.report_progress(end - 1)
+            self.check_limits(end - 1)
+            start = end
+            chunk *= 2
         
-        # Iterar sobre cada barra
-        for i, bar in enumerate(bars):
-            price_history.append(bar['close'])
-            self.high_history.append(bar['high'])
-            self.low_history.append(bar['low'])
+        return None, None, None
+    
+    def emit(self, event_type: str, **data):
+        """
+        Envía un evento al callback on_event (si lo hay)
+
+        El callback puede lanzar BacktestStopped para detener el backtest (ej. StreamClosed
+        cuando el cliente deja de leer): se relanza con la barra del evento y ya no se
+        envían más eventos.
+        """
+        if self.on_event is None:
+            return
+        try:
+            self.on_event({'type': event_type, **data})
+        except BacktestStopped as stop:
+            self.on_event = None
+            raise BacktestStopped(stop.reason, self._event_index) from stop
+    
+    def report_progress(self, index: int, force: bool = False):
+        """Evento 'progress' cada progress_interval barras: barras procesadas, trades y equity"""
+        if self.on_event is None or (not force and index - self._last_progress < self.progress_interval):
+            return
+        self._last_progress = index
+        self._event_index = index
+        equity = self.balance
+        trade = self.open_trade
+        if trade is not None:
+            direction = 1 if trade.type == 'long' else -1
+            equity += direction * (float(self.bars.close[index]) - trade.entry_price) * trade.size * 100000
+        self.emit('progress', barsProcessed=index + 1, totalBars=len(self.bars),
+                  trades=len(self.trades), equity=round(equity, 2))
+    
+    def check_limits(self, index: int):
+        """Lanza BacktestStopped si se pidió cancelar o se agotó algún límite (barra 'index' procesada)"""
+        if self.max_trades and len(self.trades) >= self.max_trades:
+            raise BacktestStopped('max_trades', index)
+        if self.max_seconds and time.monotonic() - self._started > self.max_seconds:
+            raise BacktestStopped('max_seconds', index)
+        if self.cancel_token is not None and index - self._last_cancel_check >= CANCEL_CHECK_INTERVAL:
+            self._last_cancel_check = index
+            if self.cancel_token.is_set():
+                raise BacktestStopped('cancelled', index)
+    
+    def open_position(self, index: int, entry_type: str):
+        """Abre un trade al cierre de la barra aplicando slippage"""
+        self.trade_counter += 1
+        entry_price = float(self.bars.close[index])
+        
+        # Aplicar slippage
+        slippage_adjustment = self.slippage_pips * 0.0001
+        if entry_type == 'long':
+            entry_price += slippage_adjustment
+        else:
+            entry_price -= slippage_adjustment
+        
+        # Calcular tamaño de posición
+        position_sizing = self.strategy.get('positionSizing', {})
+        size = self.calculate_position_size(position_sizing)
+        
+        if self.verbose:
+            print(f"\n>> ABRIENDO TRADE #{self.trade_counter} - {entry_type.upper()} @ {entry_price:.5f} | Size: {size} lots")
+        
+        # Crear trade
+        self.open_trade = Trade(
+            self.trade_counter,
+            entry_type,
+            self.bars.time_at(index),
+            entry_price,
+            size,
+            index
+        )
+        self.open_trade.entry_reason = 'Entry Signal'
+    
+    def close_position(self, index: int, exit_reason: str, exit_price: Optional[float] = None):
+        """
+        Cierra el trade abierto en la barra y actualiza balance y equity
+
+        Sin precio explícito se cierra al cierre de la barra.
+        """
+        exit_time = self.bars.time_at(index)
+        if exit_price is None:
+            exit_price = float(self.bars.close[index])
+        trade = self.open_trade
+        trade.close(exit_time, exit_price, exit_reason, index)
+        
+        # Aplicar comisión
+        commission = abs(trade.profit) * self.commission_rate
+        trade.profit -= commission
+        
+        # Actualizar balance
+        self.balance += trade.profit
+        self.trades.append(trade)
+        self.open_trade = None
+        
+        point = self.record_equity(index)
+        if self.on_event is not None:
+            self._event_index = index
+            self.emit('trade', trade=trade.to_dict())
+            self.emit('equity', point=point)
+    
+    def record_equity(self, index: int) -> Dict[str, Any]:
+        """Añade a equity_curve el balance en la barra 'index' con su drawdown"""
+        self._max_balance = max(self._max_balance, self.balance)
+        drawdown = self._max_balance - self.balance
+        drawdown_percent = (drawdown / self._max_balance * 100) if self._max_balance > 0 else 0
+        point = {
+            'time': self.bars.time_at(index).isoformat(),
+            'equity': round(self.balance, 2),
+            'drawdown': round(drawdown_percent, 2)
+        }
+        self.equity_curve.append(point)
+        return point
+    
+    def run_bar_by_bar(self, bars: BarSeries):
+        """Bucle clásico: evalúa las reglas en cada barra"""
+        for i in range(len(bars)):
+            bar = bars.bar(i)
+            self._bar_index = i
+            self.report_progress(i)
             
             # Si hay trade abierto, verificar salidas
             if self.open_trade:
                 # Verificar stop loss / take profit
-                exit_reason = self.check_stop_loss_take_profit(bar)
+                exit_reason, exit_price = self.check_stop_loss_take_profit(bar)
                 
                 # Si no, verificar condiciones de salida
                 if not exit_reason:
-                    exit_signal = self.check_exit_conditions(bar, price_history)
+                    exit_signal = self.check_exit_conditions(bar)
                     if exit_signal:
                         exit_reason = 'exit_signal'
                 
                 # Cerrar trade si hay razón
                 if exit_reason:
-                    self.open_trade.close(bar['time'], bar['close'], exit_reason)
-                    
-                    # Aplicar comisión
-                    commission = abs(self.open_trade.profit) * self.commission_rate
-                    self.open_trade.profit -= commission
-                    
-                    # Actualizar balance
-                    self.balance += self.open_trade.profit
-                    self.trades.append(self.open_trade)
-                    self.open_trade = None
-                    
-                    # Actualizar drawdown
-                    max_balance = max(max_balance, self.balance)
-                    drawdown = max_balance - self.balance
-                    drawdown_percent = (drawdown / max_balance * 100) if max_balance > 0 else 0
-                    max_drawdown = max(max_drawdown, drawdown)
-                    max_drawdown_percent = max(max_drawdown_percent, drawdown_percent)
-                    
-                    # Añadir punto a equity curve
-                    self.equity_curve.append({
-                        'time': bar['time'].isoformat(),
-                        'equity': round(self.balance, 2),
-                        'drawdown': round(drawdown_percent, 2)
-                    })
+                    self.close_position(i, exit_reason, exit_price)
             
             # Si no hay trade abierto, verificar entradas
             else:
-                entry_type = self.check_entry_conditions(bar, price_history)
+                entry_type = self.check_entry_conditions(bar)
                 
                 if entry_type:
-                    self.trade_counter += 1
-                    entry_price = bar['close']
-                    
-                    # Aplicar slippage
-                    slippage_adjustment = self.slippage_pips * 0.0001
-                    if entry_type == 'long':
-                        entry_price += slippage_adjustment
-                    else:
-                        entry_price -= slippage_adjustment
-                    
-                    # Calcular tamaño de posición
-                    position_sizing = self.strategy.get('positionSizing', {})
-                    size = self.calculate_position_size(position_sizing)
-                    
-                    print(f"\n>> ABRIENDO TRADE #{self.trade_counter} - {entry_type.upper()} @ {entry_price:.5f} | Size: {size} lots")
-                    
-                    # Crear trade
-                    self.open_trade = Trade(
-                        self.trade_counter,
-                        entry_type,
-                        bar['time'],
-                        entry_price,
-                        size
-                    )
-                    self.open_trade.entry_reason = 'Entry Signal'
+                    self.open_position(i, entry_type)
+            
+            self.check_limits(i)
+    
+    def run_compiled(self, bars: BarSeries):
+        """
+        Bucle con señales compiladas
+
+        Las máscaras de entrada/salida se calculan una vez para toda la serie y el bucle
+        solo salta entre las barras en las que cambia el estado de la posición.
+        """
+        entry_direction, exit_mask = compile_signals(self.strategy, self.indicator_values, bars)
+        entry_bars = np.flatnonzero(entry_direction)
+        if self.verbose:
+            print(f">> Señales compiladas: {len(entry_bars)} barras con entrada, {int(exit_mask.sum())} con salida")
+        if JIT_ENABLED:
+            self.run_position_kernel(bars, entry_direction, exit_mask)
+            return
+        
+        i = 0
+        while True:
+            # Siguiente barra con señal de entrada
+            pos = np.searchsorted(entry_bars, i)
+            if pos >= len(entry_bars):
+                break
+            i = int(entry_bars[pos])
+            self._bar_index = i
+            self.report_progress(i)
+            if i > 0:
+                self.check_limits(i - 1)
+            self.open_position(i, 'long' if entry_direction[i] == LONG else 'short')
+            
+            # Primera barra posterior en la que se cierra el trade
+            exit_index, exit_reason, exit_price = self.find_exit(i + 1, exit_mask)
+            if exit_index is None:
+                break
+            self._bar_index = exit_index
+            self.close_position(exit_index, exit_reason, exit_price)
+            self.check_limits(exit_index)
+            i = exit_index + 1
+    
+    def run_position_kernel(self, bars: BarSeries, entry_direction: np.ndarray, exit_mask: np.ndarray):
+        """
+        Bucle de posiciones compilado (numba): mismo recorrido que run_compiled en una pasada
+
+        El núcleo solo decide en qué barras se abre y se cierra cada trade; después se
+        reproducen aquí en orden (tamaño, slippage, motivo y precio del stop con
+        resolve_stop_exit, comisión, eventos y límites), así que los trades son los mismos.
+        """
+        sl_distance, tp_distance = self.stop_distances()
+        entries, exits, stops = position_loop(
+            entry_direction, exit_mask, bars.low, bars.high, bars.close,
+            self.slippage_pips * 0.0001,
+            np.nan if sl_distance is None else sl_distance,
+            np.nan if tp_distance is None else tp_distance,
+            self.execution_model == 'intrabar'
+        )
+        
+        for i, exit_index, stop_exit in zip(entries.tolist(), exits.tolist(), stops.tolist()):
+            self._bar_index = i
+            self.report_progress(i)
+            if i > 0:
+                self.check_limits(i - 1)
+            self.open_position(i, 'long' if entry_direction[i] == LONG else 'short')
+            if exit_index < 0:
+                break
+            
+            self._bar_index = exit_index
+            if stop_exit:
+                sl_price, tp_price = self.stop_levels(self.open_trade)
+                exit_reason, exit_price = self.resolve_stop_exit(
+                    sl_price, tp_price, float(bars.open[exit_index]), float(bars.high[exit_index]),
+                    float(bars.low[exit_index]), float(bars.close[exit_index]), exit_index
+                )
+            else:
+                exit_reason, exit_price = 'exit_signal', float(bars.close[exit_index])
+            self.report_progress(exit_index)
+            self.close_position(exit_index, exit_reason, exit_price)
+            self.check_limits(exit_index)
+    
+    def run(self) -> Dict[str, Any]:
+        """Ejecuta el backtest completo"""
+        if self.verbose:
+            # Debug: info de la estrategia
+            print(f"\n>> ESTRATEGIA: {self.strategy.get('name', 'Unknown')}")
+            print(f">> Entry Blocks: {len(self.strategy.get('entryBlocks', []))}")
+            print(f">> Exit Blocks: {len(self.strategy.get('exitBlocks', []))}")
+            
+            # Debug: mostrar reglas de entrada
+            for idx, block in enumerate(self.strategy.get('entryBlocks', [])):
+                print(f">> Entry Block {idx}: {len(block.get('rules', []))} reglas, {len(block.get('actions', []))} acciones")
+                if block.get('rules'):
+                    for rule_idx, rule in enumerate(block['rules']):
+                        ind = rule.get('indicator', {}).get('indicator', 'unknown')
+                        cond = rule.get('condition', 'unknown')
+                        print(f"   - Regla {rule_idx}: {ind} {cond}")
+        
+        # Generar datos de precio (o usar las barras recibidas)
+        bars = self._preloaded_bars
+        if isinstance(bars, ArchiveRange):
+            archive = bars
+            bars = archive.load()
+            # Después de cargar: si el fichero cambió, la huella es la de la versión leída
+            self._dataset_id = archive.fingerprint()
+        elif bars is None:
+            bars = self.generate_price_data()
+        if self.verbose:
+            print(f">> Barras generadas: {len(bars)}")
+        if self.max_bars and len(bars) > self.max_bars:
+            bars = bars.slice(0, self.max_bars)
+            self.stop_reason = 'max_bars'
+            if self._dataset_id is not None:
+                self._dataset_id += f":{self.max_bars}"
+        
+        # Precalcular indicadores antes del bucle: el bucle solo indexa arrays
+        self.precompute_indicators(bars)
+        if self.verbose:
+            print(f">> Indicadores precalculados: {len(self.indicator_values)}")
+        
+        # Punto inicial de equity
+        self.equity_curve.append({
+            'time': bars.time_at(0).isoformat(),
+            'equity': self.balance,
+            'drawdown': 0
+        })
+        
+        self._started = time.monotonic()
+        last_index = len(bars) - 1
+        try:
+            self.emit('start', symbol=self.config.get('symbol', 'EURUSD'),
+                      timeframe=self.config.get('timeframe', '1h'), totalBars=len(bars))
+            self.emit('equity', point=self.equity_curve[0])
+            if self.signal_mode == 'bar':
+                self.run_bar_by_bar(bars)
+            else:
+                self.run_compiled(bars)
+        except BacktestStopped as stop:
+            # Resultados parciales hasta la última barra procesada
+            self.stop_reason = stop.reason
+            last_index = stop.index
+            print(f"[BACKTEST] Detenido ({stop.reason}) en la barra {last_index + 1} de {len(bars)}")
         
         # Cerrar trade abierto al final
-        if self.open_trade and len(bars) > 0:
-            last_bar = bars[-1]
-            self.open_trade.close(last_bar['time'], last_bar['close'], 'Backtest End')
-            self.balance += self.open_trade.profit
-            self.trades.append(self.open_trade)
+        final_trade = self.open_trade
+        if final_trade and len(bars) > 0:
+            exit_reason = 'Backtest Stopped' if self.stop_reason else 'Backtest End'
+            final_trade.close(bars.time_at(last_index), float(bars.close[last_index]), exit_reason, last_index)
+            self.balance += final_trade.profit
+            self.trades.append(final_trade)
             self.open_trade = None
+        # Punto de equity en la última barra: la curva emitida acaba como la del resultado
+        final_point = None
+        if len(bars) > 0 and self.equity_curve[-1]['time'] != bars.time_at(last_index).isoformat():
+            final_point = self.record_equity(last_index)
+        try:
+            self._event_index = last_index
+            if final_trade:
+                self.emit('trade', trade=final_trade.to_dict())
+            if final_point:
+                self.emit('equity', point=final_point)
+            self.report_progress(last_index, force=True)
+        except BacktestStopped:
+            # El consumidor de eventos se fue al final: el resultado ya está completo
+            pass
+        self.bar_equity = bar_equity(bars.close[:last_index + 1], self.trades, self.initial_balance)
+        
+        if self.drill_down and self.verbose:
+            print(f">> Barras ambiguas: {self.ambiguous_bars}, resueltas con {self.drill_down_timeframe}: "
+                  f"{self.drill_down_resolved}")
         
         # Calcular métricas
         metrics = self.calculate_metrics()
+        monte_carlo_result = self.run_monte_carlo()
         
         return {
             'success': True,
@@ -593,10 +1006,58 @@ class BacktestEngine:
             'startDate': self.config.get('startDate'),
             'endDate': self.config.get('endDate'),
             'metrics': metrics,
-            'trades': [t.to_dict() for t in self.trades],
-            'equityCurve': self.equity_curve
+            'trades': self.trades.to_dicts(),
+            'equityCurve': self.equity_points(),
+            'monteCarlo': monte_carlo_result,
+            'stopReason': self.stop_reason,
+            'barsProcessed': last_index + 1
         }
     
+    def equity_points(self) -> List[Dict[str, Any]]:
+        """
+        Curva de equity por barra reducida para la respuesta
+
+        config['equityPoints']: puntos máximos (1000 por defecto; 0 = todas las barras)
+        config['equityDownsample']: 'minmax' (por defecto) o 'lttb'
+        """
+        if self.bar_equity is None:
+            return self.equity_curve
+        return downsample_curve(
+            self.bars.time[:len(self.bar_equity)], self.bar_equity, self.initial_balance,
+            points=int(self.config.get('equityPoints', DEFAULT_EQUITY_POINTS)),
+            method=self.config.get('equityDownsample', 'minmax')
+        )
+    
+    def bar_equity_series(self) -> Optional[Dict[str, Any]]:
+        """Equity por barra completa con sus tiempos (para EquityStore)"""
+        if self.bar_equity is None:
+            return None
+        return {
+            'time': self.bars.time[:len(self.bar_equity)].copy(),
+            'equity': self.bar_equity,
+            'initialBalance': self.initial_balance,
+        }
+    
+    def run_monte_carlo(self) -> Optional[Dict[str, Any]]:
+        """
+        Distribuciones Monte Carlo de los trades cerrados
+
+        Configurable con config['monteCarlo']: {enabled, simulations, method, ruinThreshold, seed}
+        """
+        settings = self.config.get('monteCarlo', {})
+        if isinstance(settings, bool):
+            settings = {'enabled': settings}
+        if not settings.get('enabled', True):
+            return None
+        return monte_carlo(
+            self.trades.profit,
+            self.initial_balance,
+            simulations=settings.get('simulations', DEFAULT_SIMULATIONS),
+            method=settings.get('method', 'bootstrap'),
+            ruin_threshold=settings.get('ruinThreshold', DEFAULT_RUIN_THRESHOLD),
+            seed=settings.get('seed')
+        )
+    
     def calculate_position_size(self, position_sizing: Dict[str, Any]) -> float:
         """Calcula el tamaño de la posición"""
         ps_type = position_sizing.get('type', 'fixed_lots')
@@ -616,109 +1077,25 @@ class BacktestEngine:
         return 0.1
     
     def calculate_metrics(self) -> Dict[str, Any]:
-        """Calcula todas las métricas del backtest"""
+        """
+        Calcula todas las métricas del backtest (services/metrics.py)
+
+        Tras run() se usa la equity por barra; si el motor solo se usa para resumir trades
+        de otro origen (cartera, walk-forward), la curva de equity que se le asigne.
+        """
         if not self.trades:
             return self.get_empty_metrics()
         
-        winning_trades = [t for t in self.trades if t.profit > 0]
-        losing_trades = [t for t in self.trades if t.profit <= 0]
-        
-        total_trades = len(self.trades)
-        num_winning = len(winning_trades)
-        num_losing = len(losing_trades)
-        
-        win_rate = (num_winning / total_trades * 100) if total_trades > 0 else 0
-        
-        total_profit = sum(t.profit for t in winning_trades)
-        total_loss = abs(sum(t.profit for t in losing_trades))
-        net_profit = self.balance - self.initial_balance
-        
-        profit_factor = (total_profit / total_loss) if total_loss > 0 else 0
-        average_win = total_profit / num_winning if num_winning > 0 else 0
-        average_loss = -total_loss / num_losing if num_losing > 0 else 0
-        
-        largest_win = max((t.profit for t in winning_trades), default=0)
-        largest_loss = min((t.profit for t in losing_trades), default=0)
-        
-        # Calcular drawdown máximo
-        max_balance = self.initial_balance
-        max_dd = 0
-        max_dd_percent = 0
-        
-        for point in self.equity_curve:
-            equity = point['equity']
-            max_balance = max(max_balance, equity)
-            dd = max_balance - equity
-            dd_percent = (dd / max_balance * 100) if max_balance > 0 else 0
-            max_dd = max(max_dd, dd)
-            max_dd_percent = max(max_dd_percent, dd_percent)
-        
-        # Métricas de ratio
-        returns = [t.profit_percent for t in self.trades]
-        avg_return = sum(returns) / len(returns) if returns else 0
-        std_return = np.std(returns) if len(returns) > 1 else 0
-        sharpe_ratio = (avg_return / std_return * np.sqrt(252)) if std_return > 0 else 0
-        
-        # Sortino Ratio
-        negative_returns = [r for r in returns if r < 0]
-        downside_std = np.std(negative_returns) if len(negative_returns) > 1 else 0
-        sortino_ratio = (avg_return / downside_std * np.sqrt(252)) if downside_std > 0 else sharpe_ratio
-        
-        # Calmar Ratio
-        return_percent = (net_profit / self.initial_balance * 100)
-        calmar_ratio = abs(return_percent / max_dd_percent) if max_dd_percent > 0 else 0
-        
-        # Rachas
-        consecutive_wins = 0
-        consecutive_losses = 0
-        max_consecutive_wins = 0
-        max_consecutive_losses = 0
-        
-        for trade in self.trades:
-            if trade.profit > 0:
-                consecutive_wins += 1
-                consecutive_losses = 0
-                max_consecutive_wins = max(max_consecutive_wins, consecutive_wins)
-            else:
-                consecutive_losses += 1
-                consecutive_wins = 0
-                max_consecutive_losses = max(max_consecutive_losses, consecutive_losses)
-        
-        # Expectancy
-        expectancy = (win_rate / 100 * average_win) + ((1 - win_rate / 100) * average_loss)
-        
-        # Time in market
-        total_duration = sum(t.duration for t in self.trades)
-        avg_duration_hours = (total_duration / total_trades / 3600) if total_trades > 0 else 0
-        
-        return {
-            'totalTrades': total_trades,
-            'winningTrades': num_winning,
-            'losingTrades': num_losing,
-            'winRate': round(win_rate, 2),
-            'totalProfit': round(total_profit, 2),
-            'totalLoss': round(total_loss, 2),
-            'netProfit': round(net_profit, 2),
-            'profitFactor': round(profit_factor, 2),
-            'averageWin': round(average_win, 2),
-            'averageLoss': round(average_loss, 2),
-            'largestWin': round(largest_win, 2),
-            'largestLoss': round(largest_loss, 2),
-            'sharpeRatio': round(sharpe_ratio, 2),
-            'sortinoRatio': round(sortino_ratio, 2),
-            'calmarRatio': round(calmar_ratio, 2),
-            'maxDrawdown': round(max_dd, 2),
-            'maxDrawdownPercent': round(max_dd_percent, 2),
-            'maxDrawdownDuration': random.randint(5, 30),
-            'timeInMarket': round(50, 2),  # Simplificado
-            'averageTradeDuration': round(avg_duration_hours, 2),
-            'consecutiveWins': max_consecutive_wins,
-            'consecutiveLosses': max_consecutive_losses,
-            'expectancy': round(expectancy, 2),
-            'initialBalance': self.initial_balance,
-            'finalBalance': round(self.balance, 2),
-            'returnPercent': round(return_percent, 2)
-        }
+        if self.bar_equity is not None:
+            equity = self.bar_equity
+            times = self.bars.time[:len(equity)]
+            total_bars = len(equity)
+        else:
+            equity = np.fromiter((point['equity'] for point in self.equity_curve), dtype=np.float64,
+                                 count=len(self.equity_curve))
+            times = np.array([datetime_to_ns(point['time']) for point in self.equity_curve], dtype=np.int64)
+            total_bars = None
+        return compute_metrics(self.trades, self.initial_balance, self.balance, equity, times, total_bars)
     
     def get_empty_metrics(self) -> Dict[str, Any]:
         """Retorna métricas vacías si no hay trades"""
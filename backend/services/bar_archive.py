@@ -0,0 +1,182 @@
+"""
+Formato binario nativo de Kumo para barras (.kbar)
+Pensado para abrirse con np.memmap: cargar años de barras M1 no copia datos y
+varios procesos comparten la misma page cache del sistema operativo
+
+Estructura del fichero (little-endian):
+    Cabecera de 64 bytes: magic 'KUMOBAR1', versión, nº de barras, primer y último timestamp
+    Índice de tiempo:     int64[n]   (ns desde epoch, ordenado)
+    Columnas:             float64[n] por campo: open, high, low, close, volume
+"""
+import hashlib
+import os
+import struct
+import tempfile
+import weakref
+import numpy as np
+from pathlib import Path
+from typing import Optional, Set, Tuple, Union
+
+from .bar_series import BarSeries, FIELDS
+
+
+MAGIC = b'KUMOBAR1'
+VERSION = 1
+HEADER_SIZE = 64
+# magic, versión, nº de barras, primer timestamp, último timestamp
+HEADER_FORMAT = '<8sIxxxxQqq'
+
+TIME_DTYPE = np.dtype('<i8')
+VALUE_DTYPE = np.dtype('<f8')
+
+# Lecturas de un rango si el fichero se reemplaza mientras se lee
+LOAD_ATTEMPTS = 3
+
+
+class ArchiveError(Exception):
+    """Fichero .kbar inválido o corrupto"""
+
+
+def read_header(path: Union[str, Path]) -> Tuple[int, int, int]:
+    """Lee la cabecera: (nº de barras, primer timestamp, último timestamp)"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ArchiveError(f"Cabecera incompleta en {path}")
+    magic, version, count, first_time, last_time = struct.unpack_from(HEADER_FORMAT, raw)
+    if magic != MAGIC:
+        raise ArchiveError(f"{path} no es un fichero .kbar")
+    if version != VERSION:
+        raise ArchiveError(f"Versión .kbar no soportada: {version}")
+    return count, first_time, last_time
+
+
+def write_archive(path: Union[str, Path], bars: BarSeries):
+    """Escribe la serie en formato .kbar (escritura atómica: temporal + rename)"""
+    path = Path(path)
+    bars = bars.sorted()
+    count = len(bars)
+    first_time = int(bars.time[0]) if count else 0
+    last_time = int(bars.time[-1]) if count else 0
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, count, first_time, last_time)
+    # Temporal propio de cada escritor: dos procesos pueden guardar la misma entrada a la vez
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header.ljust(HEADER_SIZE, b'\0'))
+            f.write(bars.time.astype(TIME_DTYPE, copy=False).tobytes())
+            for field in FIELDS:
+                f.write(bars.column(field).astype(VALUE_DTYPE, copy=False).tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def open_archive(path: Union[str, Path]) -> BarSeries:
+    """
+    Abre un fichero .kbar como BarSeries respaldada por np.memmap (sin copiar datos)
+
+    Las páginas solo se leen de disco al acceder a ellas.
+    """
+    count, _, _ = read_header(path)
+    expected_size = HEADER_SIZE + count * (TIME_DTYPE.itemsize + len(FIELDS) * VALUE_DTYPE.itemsize)
+    if os.path.getsize(path) < expected_size:
+        raise ArchiveError(f"Fichero .kbar truncado: {path}")
+    if count == 0:
+        return BarSeries.empty()
+
+    time = np.memmap(path, dtype=TIME_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+    offset = HEADER_SIZE + count * TIME_DTYPE.itemsize
+    columns = []
+    for _ in FIELDS:
+        columns.append(np.memmap(path, dtype=VALUE_DTYPE, mode='r', offset=offset, shape=(count,)))
+        offset += count * VALUE_DTYPE.itemsize
+    return BarSeries(time, *columns)
+
+
+def read_range(path: Union[str, Path], start_ns: int, end_ns: int) -> BarSeries:
+    """Barras con start_ns <= time <= end_ns (búsqueda binaria sobre el índice de tiempo)"""
+    count, first_time, last_time = read_header(path)
+    if count == 0 or end_ns < first_time or start_ns > last_time:
+        return BarSeries.empty()
+    return open_archive(path).between(start_ns, end_ns)
+
+
+class ArchiveRange:
+    """
+    Referencia a las barras de un fichero .kbar entre dos instantes
+
+    Se envía a los procesos del pool en lugar de la serie: cada proceso abre el fichero con
+    np.memmap (read_range) sin serializar ni copiar los arrays. La versión del fichero
+    (tamaño, fecha de modificación e inodo) identifica su contenido sin leerlo.
+    """
+
+    __slots__ = ('path', 'start_ns', 'end_ns', 'version', '__weakref__')
+
+    def __init__(self, path: Union[str, Path], start_ns: int, end_ns: int):
+        self.path = str(path)
+        self.start_ns = int(start_ns)
+        self.end_ns = int(end_ns)
+        self.version = file_version(self.path)
+        _live_ranges.add(self)
+
+    def is_current(self) -> bool:
+        """True si el fichero sigue siendo la versión que se referenció"""
+        try:
+            return file_version(self.path) == self.version
+        except OSError:
+            return False
+
+    def load(self) -> BarSeries:
+        """
+        Barras del rango en el fichero actual
+
+        Si el fichero cambió desde que se creó la referencia (otra descarga lo reescribió),
+        se leen sus barras actuales y se actualiza 'version', de modo que fingerprint()
+        identifica siempre lo leído; quien guardó datos calculados con la versión anterior
+        lo detecta comparando 'version' antes y después.
+        """
+        for _ in range(LOAD_ATTEMPTS):
+            version = file_version(self.path)
+            bars = read_range(self.path, self.start_ns, self.end_ns)
+            # Un reemplazo a mitad de lectura mezclaría cabecera y columnas de dos versiones
+            if file_version(self.path) != version:
+                continue
+            if version != self.version:
+                print(f"[DATA_CACHE] {os.path.basename(self.path)} cambió desde que se localizó: "
+                      f"se leen las barras actuales")
+                self.version = version
+            return bars
+        raise ArchiveError(f"{self.path} cambió mientras se leía")
+
+    def fingerprint(self) -> str:
+        """Huella del fichero y el rango (como BarSeries.fingerprint, sin leer las barras)"""
+        payload = repr((self.path, self.start_ns, self.end_ns, self.version)).encode()
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+# Referencias vivas en este proceso: la caché no desaloja sus ficheros
+_live_ranges: 'weakref.WeakSet[ArchiveRange]' = weakref.WeakSet()
+
+
+def file_version(path: Union[str, Path]) -> Tuple[int, int, int]:
+    """Versión de un fichero: (tamaño, fecha de modificación en ns, inodo)"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+def referenced_paths() -> Set[str]:
+    """Ficheros .kbar con alguna ArchiveRange viva en este proceso"""
+    return {archive.path for archive in list(_live_ranges)}
+
+
+def open_bars(source: Union[BarSeries, ArchiveRange, None]) -> Optional[BarSeries]:
+    """Barras de una serie ya cargada o de una referencia a un fichero .kbar"""
+    if isinstance(source, ArchiveRange):
+        return source.load()
+    return source
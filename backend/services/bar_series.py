@@ -0,0 +1,146 @@
+"""
+Almacenamiento columnar de barras OHLCV
+Cada campo es un array contiguo de NumPy (float64) y el tiempo se guarda como
+int64 en nanosegundos desde epoch (UTC), en lugar de una lista de diccionarios
+"""
+import hashlib
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Sequence, Union
+
+
+EPOCH = datetime(1970, 1, 1)
+NS_PER_US = 1000
+
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def datetime_to_ns(value: Union[datetime, str]) -> int:
+    """Convierte un datetime (naive, UTC) o una fecha ISO a nanosegundos desde epoch"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return ((value - EPOCH) // timedelta(microseconds=1)) * NS_PER_US
+
+
+def ns_to_datetime(value: int) -> datetime:
+    """Convierte nanosegundos desde epoch a datetime naive (UTC)"""
+    return EPOCH + timedelta(microseconds=int(value) // NS_PER_US)
+
+
+class BarRecords(Sequence):
+    """Vista perezosa de una BarSeries como secuencia de diccionarios (solo para serializar)"""
+
+    def __init__(self, series: 'BarSeries'):
+        self._series = series
+
+    def __len__(self) -> int:
+        return len(self._series)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._series.bar(i) for i in range(*index.indices(len(self)))]
+        return self._series.bar(index)
+
+
+class BarSeries:
+    """Serie de barras OHLCV en formato struct-of-arrays"""
+
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, time: np.ndarray, open: np.ndarray, high: np.ndarray,
+                 low: np.ndarray, close: np.ndarray, volume: Optional[np.ndarray] = None):
+        self.time = np.ascontiguousarray(time, dtype=np.int64)
+        self.open = np.ascontiguousarray(open, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        if volume is None:
+            volume = np.zeros(len(self.time))
+        self.volume = np.ascontiguousarray(volume, dtype=np.float64)
+
+    @classmethod
+    def empty(cls) -> 'BarSeries':
+        return cls(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in FIELDS))
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'BarSeries':
+        """Construye la serie a partir de barras en formato diccionario"""
+        if not records:
+            return cls.empty()
+        return cls(
+            np.fromiter((datetime_to_ns(r['time']) for r in records), dtype=np.int64, count=len(records)),
+            *(np.fromiter((r.get(field, 0) for r in records), dtype=np.float64, count=len(records))
+              for field in FIELDS)
+        )
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("BarSeries solo admite slices contiguos")
+            return self.slice(start, stop)
+        return self.bar(index)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def fingerprint(self) -> str:
+        """Huella del contenido (versión de los datos): cambia si cambia cualquier barra"""
+        digest = hashlib.blake2b(digest_size=16)
+        for name in self.__slots__:
+            digest.update(np.ascontiguousarray(getattr(self, name)).data)
+        return digest.hexdigest()
+
+    @property
+    def records(self) -> BarRecords:
+        """Vista perezosa como lista de diccionarios"""
+        return BarRecords(self)
+
+    def column(self, field: str) -> np.ndarray:
+        """Array de un campo ('open', 'high', 'low', 'close', 'volume')"""
+        if field not in FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def time_at(self, index: int) -> datetime:
+        return ns_to_datetime(self.time[index])
+
+    def bar(self, index: int) -> Dict[str, Any]:
+        """Barra individual como diccionario"""
+        return {
+            'time': self.time_at(index),
+            'open': float(self.open[index]),
+            'high': float(self.high[index]),
+            'low': float(self.low[index]),
+            'close': float(self.close[index]),
+            'volume': float(self.volume[index]),
+        }
+
+    def slice(self, start: int, stop: int) -> 'BarSeries':
+        """Sub-serie [start, stop) sin copiar (vistas de los mismos arrays)"""
+        return BarSeries(*(getattr(self, name)[start:stop] for name in self.__slots__))
+
+    def between(self, start: Union[datetime, str, int], end: Union[datetime, str, int]) -> 'BarSeries':
+        """Sub-serie con start <= time <= end (búsqueda binaria sobre la columna de tiempo)"""
+        start_ns = start if isinstance(start, (int, np.integer)) else datetime_to_ns(start)
+        end_ns = end if isinstance(end, (int, np.integer)) else datetime_to_ns(end)
+        lo = int(np.searchsorted(self.time, start_ns, side='left'))
+        hi = int(np.searchsorted(self.time, end_ns, side='right'))
+        return self.slice(lo, hi)
+
+    def sorted(self) -> 'BarSeries':
+        """Copia ordenada por tiempo (solo si hace falta)"""
+        if len(self) < 2 or np.all(self.time[1:] >= self.time[:-1]):
+            return self
+        order = np.argsort(self.time, kind='stable')
+        return BarSeries(*(getattr(self, name)[order] for name in self.__slots__))
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Materializa la serie como lista de diccionarios (borde de la API)"""
+        return [self.bar(i) for i in range(len(self))]
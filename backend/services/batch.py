@@ -0,0 +1,167 @@
+"""
+Backtests por lotes
+Ejecuta una misma estrategia sobre varias combinaciones de símbolo/temporalidad en el
+pool de procesos y emite cada resultado en cuanto termina
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from .bar_archive import ArchiveRange
+from .bar_series import BarSeries
+
+
+# Límite de ejecuciones por lote
+DEFAULT_MAX_RUNS = 200
+
+# Barras mínimas para los indicadores (como BacktestEngine.generate_price_data)
+MIN_RUN_BARS = 50
+
+# Barras de una ejecución tal como se envían al pool
+BarSource = Union[BarSeries, ArchiveRange]
+
+
+def expand_runs(config: Dict[str, Any], runs: Optional[List[Dict[str, Any]]] = None,
+                symbols: Optional[List[str]] = None,
+                timeframes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Configuraciones de cada ejecución del lote (sin duplicados, en orden)
+
+    Las ejecuciones son la lista explícita 'runs' ({symbol, timeframe}) más el producto
+    de 'symbols' x 'timeframes'; lo que falte se toma de la configuración base.
+    """
+    pairs: List[Tuple[str, str]] = []
+    for run in runs or []:
+        pairs.append((run.get('symbol', config.get('symbol', 'EURUSD')),
+                      run.get('timeframe', config.get('timeframe', '1h'))))
+    if symbols or timeframes:
+        for symbol in symbols or [config.get('symbol', 'EURUSD')]:
+            for timeframe in timeframes or [config.get('timeframe', '1h')]:
+                pairs.append((symbol, timeframe))
+
+    unique = list(dict.fromkeys((symbol.upper(), timeframe) for symbol, timeframe in pairs))
+    if not unique:
+        raise ValueError("El lote no tiene ejecuciones (runs, symbols o timeframes)")
+
+    max_runs = int(os.getenv('KUMO_BATCH_MAX_RUNS', DEFAULT_MAX_RUNS))
+    if len(unique) > max_runs:
+        raise ValueError(f"Demasiadas ejecuciones en el lote: {len(unique)} (máximo {max_runs})")
+    return [{**config, 'symbol': symbol, 'timeframe': timeframe} for symbol, timeframe in unique]
+
+
+def load_run_bars(config: Dict[str, Any]) -> Optional[BarSource]:
+    """
+    Carga las barras de una ejecución (caché en disco, API o datos simulados del proveedor)
+
+    Si se sirven directamente de la caché retorna su ArchiveRange, que los procesos del pool
+    abren con np.memmap. None si no hay barras suficientes: el motor genera entonces sus
+    datos simulados.
+    """
+    from .data_provider import data_provider
+
+    bars, archive = data_provider.get_forex_source(
+        config.get('symbol', 'EURUSD'), config.get('timeframe', '1h'),
+        config.get('startDate', '2024-01-01'), config.get('endDate', '2024-12-31'))
+    if len(bars) <= MIN_RUN_BARS:
+        print(f"[BATCH] Datos insuficientes ({len(bars)} barras), el motor usará datos simulados")
+        return None
+    return archive or bars
+
+
+def run_batch_item(strategy: Dict[str, Any], config: Dict[str, Any],
+                   source: Optional[BarSource]) -> Dict[str, Any]:
+    """Ejecuta una ejecución del lote (se llama dentro de un proceso del pool)"""
+    from .backtest_engine import BacktestEngine
+
+    started = time.time()
+    engine = BacktestEngine(strategy, {**config, 'verbose': False}, bars=source)
+    result = engine.run()
+    return {
+        'symbol': config['symbol'],
+        'timeframe': config['timeframe'],
+        'success': True,
+        'bars': len(engine.bars),
+        'metrics': result['metrics'],
+        'monteCarlo': result.get('monteCarlo'),
+        'elapsedSeconds': round(time.time() - started, 3),
+        'error': None,
+    }
+
+
+def summarize(results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """Resumen agregado del lote"""
+    successful = [r for r in results if r['success']]
+    metrics = [r['metrics'] for r in successful]
+    by_profit = sorted(successful, key=lambda r: r['metrics'].get('netProfit', 0))
+
+    def best_worst(run):
+        return {'symbol': run['symbol'], 'timeframe': run['timeframe'],
+                'netProfit': run['metrics'].get('netProfit', 0)} if run else None
+
+    return {
+        'totalRuns': len(results),
+        'successfulRuns': len(successful),
+        'failedRuns': len(results) - len(successful),
+        'profitableRuns': sum(1 for m in metrics if m.get('netProfit', 0) > 0),
+        'totalTrades': sum(m.get('totalTrades', 0) for m in metrics),
+        'totalNetProfit': round(sum(m.get('netProfit', 0) for m in metrics), 2),
+        'averageReturnPercent': round(sum(m.get('returnPercent', 0) for m in metrics) / len(metrics), 2) if metrics else 0,
+        'averageWinRate': round(sum(m.get('winRate', 0) for m in metrics) / len(metrics), 2) if metrics else 0,
+        'worstMaxDrawdownPercent': max((m.get('maxDrawdownPercent', 0) for m in metrics), default=0),
+        'bestRun': best_worst(by_profit[-1] if by_profit else None),
+        'worstRun': best_worst(by_profit[0] if by_profit else None),
+        'elapsedSeconds': round(elapsed, 3),
+    }
+
+
+def failed_result(config: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+    """Resultado de una ejecución que no se pudo completar"""
+    print(f"[BATCH] Error en {config['symbol']} {config['timeframe']}: {error}")
+    return {
+        'symbol': config['symbol'],
+        'timeframe': config['timeframe'],
+        'success': False,
+        'bars': 0,
+        'metrics': {},
+        'monteCarlo': None,
+        'elapsedSeconds': 0,
+        'error': str(error),
+    }
+
+
+async def stream_batch(strategy: Dict[str, Any], configs: List[Dict[str, Any]],
+                       job_manager) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta el lote y emite un evento por ejecución terminada y un resumen final
+
+    Las barras de cada ejecución se cargan una vez en este proceso, de una en una (las
+    descargas de la API van en serie), y cada backtest se envía al pool en cuanto sus
+    barras están listas, de modo que la carga de datos y los backtests se solapan. Al pool
+    solo viaja la referencia al fichero de la caché (o la serie si no está en ella).
+    """
+    started = time.time()
+    results: List[Dict[str, Any]] = []
+    load_lock = asyncio.Semaphore(1)
+
+    async def run(index: int, config: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            async with load_lock:
+                source = await asyncio.to_thread(load_run_bars, config)
+            result = await job_manager.run(run_batch_item, strategy, config, source)
+        except Exception as e:
+            result = failed_result(config, e)
+        return {'index': index, **result}
+
+    tasks = [asyncio.create_task(run(index, config)) for index, config in enumerate(configs)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            results.append(result)
+            yield {'type': 'result', **result}
+    finally:
+        # Si el cliente se desconecta, no se lanzan las ejecuciones pendientes
+        for task in tasks:
+            task.cancel()
+
+    yield {'type': 'summary', **summarize(results, time.time() - started)}
@@ -0,0 +1,232 @@
+"""
+Caché persistente de datos históricos
+Guarda en disco las barras ya descargadas por (símbolo, intervalo), junto con los
+rangos de fechas ya consultados, para servir sub-rangos sin volver a la API
+"""
+import json
+import os
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .bar_archive import ArchiveError, ArchiveRange, open_archive, read_range, referenced_paths, write_archive
+from .bar_series import BarSeries
+
+
+# Rango de tiempo [inicio, fin] en nanosegundos desde epoch
+TimeRange = Tuple[int, int]
+
+# Rango que abarca cualquier entrada
+FULL_RANGE: TimeRange = (int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max))
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / 'data_cache'
+DEFAULT_MAX_MB = 512
+
+
+def merge_ranges(ranges: List[TimeRange]) -> List[TimeRange]:
+    """Une rangos solapados o contiguos"""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def subtract_ranges(requested: TimeRange, covered: List[TimeRange]) -> List[TimeRange]:
+    """Partes del rango solicitado que no están cubiertas"""
+    start, end = requested
+    missing: List[TimeRange] = []
+    cursor = start
+    for cov_start, cov_end in merge_ranges(covered):
+        if cov_end < cursor:
+            continue
+        if cov_start > end:
+            break
+        if cov_start > cursor:
+            missing.append((cursor, cov_start - 1))
+        cursor = max(cursor, cov_end + 1)
+        if cursor > end:
+            break
+    if cursor <= end:
+        missing.append((cursor, end))
+    return missing
+
+
+def merge_bars(existing: BarSeries, new: BarSeries) -> BarSeries:
+    """Combina dos series ordenadas; ante el mismo timestamp prevalece la barra nueva"""
+    if len(existing) == 0:
+        return new
+    if len(new) == 0:
+        return existing
+    keep = ~np.isin(existing.time, new.time)
+    combined = BarSeries(*(
+        np.concatenate((getattr(existing, name)[keep], getattr(new, name)))
+        for name in BarSeries.__slots__
+    ))
+    return combined.sorted()
+
+
+class BarCache:
+    """
+    Caché en disco de barras por (símbolo, intervalo)
+
+    Cada entrada son dos ficheros: las barras en formato binario .kbar (se abren con
+    np.memmap, sin copiar) y sus metadatos (.json) con los rangos cubiertos. El tamaño total se limita desalojando las entradas usadas
+    hace más tiempo (LRU según la fecha de último acceso de los metadatos).
+    """
+
+    def __init__(self, cache_dir: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir or os.getenv('KUMO_DATA_CACHE_DIR', DEFAULT_CACHE_DIR))
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('KUMO_DATA_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def _entry_name(symbol: str, interval: str) -> str:
+        return f"{symbol.upper()}_{interval}"
+
+    def _data_path(self, symbol: str, interval: str) -> Path:
+        return self.cache_dir / f"{self._entry_name(symbol, interval)}.kbar"
+
+    def _meta_path(self, symbol: str, interval: str) -> Path:
+        return self.cache_dir / f"{self._entry_name(symbol, interval)}.json"
+
+    def coverage(self, symbol: str, interval: str) -> List[TimeRange]:
+        """Rangos ya consultados a la API para (símbolo, intervalo)"""
+        meta_path = self._meta_path(symbol, interval)
+        if not meta_path.exists() or not self._data_path(symbol, interval).exists():
+            return []
+        try:
+            meta = json.loads(meta_path.read_text())
+            return [tuple(r) for r in meta.get('coverage', [])]
+        except (OSError, ValueError) as e:
+            print(f"[DATA_CACHE] Metadatos corruptos {meta_path.name}: {e}")
+            return []
+
+    def missing_ranges(self, symbol: str, interval: str, start_ns: int, end_ns: int) -> List[TimeRange]:
+        """Partes de [start_ns, end_ns] que habría que pedir a la API"""
+        return subtract_ranges((start_ns, end_ns), self.coverage(symbol, interval))
+
+    def load(self, symbol: str, interval: str) -> BarSeries:
+        """Todas las barras guardadas, mapeadas en memoria (serie vacía si no hay entrada)"""
+        data_path = self._data_path(symbol, interval)
+        if not data_path.exists():
+            return BarSeries.empty()
+        try:
+            bars = open_archive(data_path)
+        except (OSError, ArchiveError) as e:
+            print(f"[DATA_CACHE] Entrada ilegible {data_path.name}: {e}")
+            return BarSeries.empty()
+        self._touch(symbol, interval)
+        return bars
+
+    def get_range(self, symbol: str, interval: str, start_ns: int, end_ns: int) -> BarSeries:
+        """Barras guardadas con start_ns <= time <= end_ns (vista sobre el fichero mapeado)"""
+        data_path = self._data_path(symbol, interval)
+        if not data_path.exists():
+            return BarSeries.empty()
+        try:
+            bars = read_range(data_path, start_ns, end_ns)
+        except (OSError, ArchiveError) as e:
+            print(f"[DATA_CACHE] Entrada ilegible {data_path.name}: {e}")
+            return BarSeries.empty()
+        self._touch(symbol, interval)
+        return bars
+
+    def archive_range(self, symbol: str, interval: str, start_ns: int, end_ns: int) -> Optional[ArchiveRange]:
+        """
+        Referencia al fichero de la entrada para [start_ns, end_ns] (None si no hay entrada)
+
+        Mientras la referencia viva en este proceso, evict() no borra el fichero.
+        """
+        try:
+            archive = ArchiveRange(self._data_path(symbol, interval), start_ns, end_ns)
+        except OSError:
+            return None
+        self._touch(symbol, interval)
+        return archive
+
+    def archive(self, symbol: str, interval: str) -> Optional[ArchiveRange]:
+        """Referencia a todas las barras de la entrada (None si no hay entrada)"""
+        return self.archive_range(symbol, interval, *FULL_RANGE)
+
+    def store(self, symbol: str, interval: str, bars: BarSeries, covered: List[TimeRange]):
+        """Fusiona nuevas barras con la entrada existente y registra los rangos cubiertos"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        existing = self.load(symbol, interval)
+        merged = merge_bars(existing, bars)
+        # Copiar a memoria y soltar el mapeo antes de reemplazar el fichero
+        merged = BarSeries(*(np.array(getattr(merged, name)) for name in BarSeries.__slots__))
+        del existing
+        coverage = merge_ranges(self.coverage(symbol, interval) + list(covered))
+
+        try:
+            write_archive(self._data_path(symbol, interval), merged)
+        except OSError as e:
+            # En Windows no se puede reemplazar un fichero que otro proceso tiene mapeado
+            print(f"[DATA_CACHE] No se pudo actualizar {self._entry_name(symbol, interval)}: {e}")
+            return
+        self._write_meta(symbol, interval, coverage)
+
+        print(f"[DATA_CACHE] {self._entry_name(symbol, interval)}: {len(merged)} barras en caché")
+        self.evict()
+
+    def _write_meta(self, symbol: str, interval: str, coverage: List[TimeRange]):
+        meta_path = self._meta_path(symbol, interval)
+        tmp_path = meta_path.with_suffix('.tmp.json')
+        tmp_path.write_text(json.dumps({
+            'symbol': symbol.upper(),
+            'interval': interval,
+            'coverage': [list(r) for r in coverage],
+        }))
+        os.replace(tmp_path, meta_path)
+
+    def _touch(self, symbol: str, interval: str):
+        """Marca la entrada como usada ahora (para el LRU)"""
+        try:
+            os.utime(self._meta_path(symbol, interval))
+        except OSError:
+            pass
+
+    def total_bytes(self) -> int:
+        if not self.cache_dir.exists():
+            return 0
+        return sum(path.stat().st_size for path in self.cache_dir.glob('*.kbar'))
+
+    def evict(self):
+        """Desaloja entradas menos usadas hasta respetar el tamaño máximo (salvo las referenciadas)"""
+        if not self.cache_dir.exists():
+            return
+        entries = []
+        for meta_path in self.cache_dir.glob('*.json'):
+            if meta_path.name.endswith('.tmp.json'):
+                continue
+            data_path = meta_path.with_suffix('.kbar')
+            size = data_path.stat().st_size if data_path.exists() else 0
+            entries.append((meta_path.stat().st_mtime, meta_path, data_path, size))
+
+        total = sum(entry[3] for entry in entries)
+        # Ficheros que aún leerán los backtests en curso (ArchiveRange vivas)
+        referenced = referenced_paths()
+        # La entrada usada más recientemente nunca se desaloja
+        for _, meta_path, data_path, size in sorted(entries)[:-1]:
+            if total <= self.max_bytes:
+                break
+            if str(data_path) in referenced:
+                continue
+            print(f"[DATA_CACHE] Desalojando {meta_path.stem} ({size / 1024 / 1024:.1f} MB)")
+            for path in (data_path, meta_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        """Elimina todas las entradas"""
+        if not self.cache_dir.exists():
+            return
+        for path in list(self.cache_dir.glob('*.kbar')) + list(self.cache_dir.glob('*.json')):
+            path.unlink()
@@ -4,124 +4,274 @@ Integración con Alpha Vantage API
 """
 import requests
 import time
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
 import os
 
+from .bar_archive import ArchiveError, ArchiveRange
+from .bar_series import BarSeries, datetime_to_ns
+from .data_cache import BarCache
+from .resampler import NS_PER_MINUTE, resampler
+
+# Mapear timeframe a formato Alpha Vantage
+INTERVAL_MAP = {
+    '1': '1min',
+    '5': '5min', 
+    '15': '15min',
+    '30': '30min',
+    '60': '60min',
+    '1h': '60min',
+    '240': '240min',
+    '4h': '240min',
+    'D': 'daily',
+    '1d': 'daily'
+}
+
+INTERVAL_MINUTES = {
+    '1min': 1, '5min': 5, '15min': 15, '30min': 30,
+    '60min': 60, '240min': 240, 'daily': 1440
+}
+
+# Barras que devuelve Alpha Vantage con outputsize=compact
+COMPACT_BARS = 100
+
+# Para remuestrear desde un intervalo menor, sus barras deben empezar y acabar a menos de
+# BASE_EDGE_TOLERANCE de los extremos del rango y cubrir al menos MIN_BASE_DENSITY de su
+# duración (el forex cotiza ~5/7 del tiempo)
+BASE_EDGE_TOLERANCE = 4 * 24 * 60 * NS_PER_MINUTE
+MIN_BASE_DENSITY = 0.5
+
+
 class DataProvider:
     """Proveedor de datos históricos"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[BarCache] = None):
         self.api_key = os.getenv('ALPHA_VANTAGE_API_KEY', 'demo')
         self.base_url = 'https://www.alphavantage.co/query'
         self.rate_limit_delay = 12  # 5 calls per minute = 12 seconds between calls
         
-    def get_forex_data(self, symbol: str, timeframe: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        # Caché en disco de barras ya descargadas (KUMO_DATA_CACHE=0 para desactivarla)
+        if cache is None and os.getenv('KUMO_DATA_CACHE', '1') != '0':
+            cache = BarCache()
+        self.cache = cache
+        
+        # Intervalo base (ej. '1' = M1): se descarga solo ese y las demás temporalidades se
+        # derivan remuestreando. Sin configurar, se remuestrea cuando la caché ya tiene el
+        # rango en un intervalo menor y si no se descarga la temporalidad pedida
+        self.base_interval = INTERVAL_MAP.get(os.getenv('KUMO_DATA_BASE_TIMEFRAME', ''))
+        
+    def get_forex_data(self, symbol: str, timeframe: str, start_date: str, end_date: str,
+                       fallback: bool = True) -> BarSeries:
         """
         Obtiene datos históricos de forex desde Alpha Vantage
         
+        Los rangos ya descargados se sirven desde la caché en disco y solo se
+        consulta la API para las partes del rango que faltan. Si el rango está guardado
+        en un intervalo menor (o hay un intervalo base configurado), la temporalidad se
+        obtiene remuestreando esas barras en lugar de descargarla.
+        
         Args:
             symbol: Par de divisas (ej: 'EURUSD')
             timeframe: Temporalidad ('1h', '4h', '1d')
             start_date: Fecha inicio (YYYY-MM-DD)
             end_date: Fecha fin (YYYY-MM-DD)
+            fallback: Si la API falla, generar datos simulados (False: serie vacía)
             
         Returns:
-            Lista de barras OHLC
+            Serie columnar de barras OHLC
+        """
+        return self.get_forex_source(symbol, timeframe, start_date, end_date, fallback)[0]
+    
+    def get_forex_source(self, symbol: str, timeframe: str, start_date: str, end_date: str,
+                         fallback: bool = True) -> Tuple[BarSeries, Optional[ArchiveRange]]:
         """
+        Como get_forex_data, y además la referencia al fichero de la caché cuando las
+        barras se sirven directamente de él (None si son remuestreadas, sin caché o de
+        fallback): los procesos del pool la abren con np.memmap en vez de recibir los arrays
+        """
+        archive = None
         try:
-            # Mapear timeframe a formato Alpha Vantage
-            interval_map = {
-                '1': '1min',
-                '5': '5min', 
-                '15': '15min',
-                '30': '30min',
-                '60': '60min',
-                '1h': '60min',
-                '240': '240min',
-                '4h': '240min',
-                'D': 'daily',
-                '1d': 'daily'
-            }
-            
-            interval = interval_map.get(timeframe, '60min')
-            
-            # Construir URL para forex
-            params = {
-                'function': 'FX_INTRADAY' if interval != 'daily' else 'FX_DAILY',
-                'from_symbol': symbol[:3],  # EUR
-                'to_symbol': symbol[3:],    # USD
-                'interval': interval,
-                'apikey': self.api_key,
-                'outputsize': 'full'
-            }
+            interval = INTERVAL_MAP.get(timeframe, '60min')
+            start_ns = datetime_to_ns(start_date)
+            end_ns = datetime_to_ns(end_date)
             
             print(f"[DATA_PROVIDER] Obteniendo datos: {symbol} {timeframe} desde {start_date} hasta {end_date}")
             
-            response = requests.get(self.base_url, params=params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Verificar si hay error en la respuesta
-            if 'Error Message' in data:
-                raise Exception(f"Error Alpha Vantage: {data['Error Message']}")
-            
-            if 'Note' in data:
-                raise Exception(f"Rate limit Alpha Vantage: {data['Note']}")
-            
-            # Extraer datos de la respuesta
-            if interval != 'daily':
-                time_series_key = f'Time Series FX ({interval})'
+            if self.cache is None:
+                bars = self._fetch_series(symbol, interval, 'full').between(start_ns, end_ns)
             else:
-                time_series_key = 'Time Series (FX)'
-                
-            if time_series_key not in data:
-                raise Exception(f"No se encontraron datos en la respuesta: {list(data.keys())}")
-            
-            time_series = data[time_series_key]
-            
-            # Convertir a formato estándar
-            bars = []
-            start_dt = datetime.fromisoformat(start_date)
-            end_dt = datetime.fromisoformat(end_date)
-            
-            for timestamp, ohlc in time_series.items():
-                try:
-                    # Parsear timestamp
-                    if ' ' in timestamp:
-                        bar_time = datetime.fromisoformat(timestamp.replace(' ', 'T'))
-                    else:
-                        bar_time = datetime.fromisoformat(timestamp)
-                    
-                    # Filtrar por rango de fechas
-                    if start_dt <= bar_time <= end_dt:
-                        bars.append({
-                            'time': bar_time,
-                            'open': float(ohlc['1. open']),
-                            'high': float(ohlc['2. high']),
-                            'low': float(ohlc['3. low']),
-                            'close': float(ohlc['4. close']),
-                            'volume': 1000  # Alpha Vantage no proporciona volumen para forex
-                        })
-                except (ValueError, KeyError) as e:
-                    print(f"[DATA_PROVIDER] Error procesando barra {timestamp}: {e}")
-                    continue
-            
-            # Ordenar por tiempo
-            bars.sort(key=lambda x: x['time'])
+                bars = self._get_resampled_range(symbol, interval, start_ns, end_ns)
+                if bars is None:
+                    bars = self._get_cached_range(symbol, interval, start_ns, end_ns)
+                    archive = self.cache.archive_range(symbol, interval, start_ns, end_ns)
             
             print(f"[DATA_PROVIDER] Obtenidos {len(bars)} barras de datos reales")
-            return bars
+            return bars, archive
             
         except requests.exceptions.RequestException as e:
             print(f"[DATA_PROVIDER] Error de red: {e}")
-            return self._generate_fallback_data(symbol, timeframe, start_date, end_date)
         except Exception as e:
             print(f"[DATA_PROVIDER] Error: {e}")
-            return self._generate_fallback_data(symbol, timeframe, start_date, end_date)
+        
+        if not fallback:
+            return BarSeries.empty(), None
+        return self._generate_fallback_data(symbol, timeframe, start_date, end_date), None
+    
+    def _get_cached_range(self, symbol: str, interval: str, start_ns: int, end_ns: int) -> BarSeries:
+        """Sirve el rango desde la caché, descargando solo los bordes que falten"""
+        missing = self.cache.missing_ranges(symbol, interval, start_ns, end_ns)
+        if not missing:
+            print(f"[DATA_PROVIDER] Rango servido desde caché")
+            return self.cache.get_range(symbol, interval, start_ns, end_ns)
+        
+        # Si todos los huecos son recientes basta con la respuesta compacta (últimas barras)
+        now_ns = datetime_to_ns(datetime.now(timezone.utc))
+        compact_window = COMPACT_BARS * INTERVAL_MINUTES.get(interval, 60) * 60 * 10**9
+        first_gap = min(gap_start for gap_start, _ in missing)
+        outputsize = 'compact' if first_gap >= now_ns - compact_window else 'full'
+        print(f"[DATA_PROVIDER] {len(missing)} tramo(s) sin caché, descargando ({outputsize})")
+        
+        fetched = self._fetch_series(symbol, interval, outputsize)
+        if outputsize == 'compact' and (len(fetched) == 0 or fetched.time[0] > first_gap):
+            # La respuesta compacta no llega al principio del hueco: pedir la completa
+            fetched = self._fetch_series(symbol, interval, 'full')
+        
+        # Solo queda cubierto lo que la respuesta contiene de verdad: lo anterior a su
+        # primera barra (historia que la API ya no da) y lo posterior a la última siguen
+        # pendientes y se volverán a pedir
+        covered = []
+        if len(fetched):
+            first, last = int(fetched.time[0]), int(fetched.time[-1])
+            covered = [(max(gap_start, first), min(gap_end, last)) for gap_start, gap_end in missing
+                       if gap_start <= last and gap_end >= first]
+        if covered != missing:
+            print(f"[DATA_PROVIDER] La respuesta solo cubre parte del rango pedido: el resto sigue sin caché")
+        self.cache.store(symbol, interval, fetched, covered)
+        return self.cache.get_range(symbol, interval, start_ns, end_ns)
+    
+    def _base_interval_for(self, symbol: str, interval: str, start_ns: int, end_ns: int) -> Optional[str]:
+        """Intervalo menor (divisor del pedido) desde el que remuestrear, o None"""
+        minutes = INTERVAL_MINUTES.get(interval, 60)
+        candidates = [base for base, base_minutes in INTERVAL_MINUTES.items()
+                      if base_minutes < minutes and minutes % base_minutes == 0]
+        if self.base_interval in candidates:
+            return self.base_interval
+        # El mayor intervalo que ya cubre el rango: menos barras que agrupar, mismo resultado
+        for base in sorted(candidates, key=INTERVAL_MINUTES.get, reverse=True):
+            if not self.cache.missing_ranges(symbol, base, start_ns, end_ns) and \
+                    self._has_bars_for(symbol, base, start_ns, end_ns):
+                return base
+        return None
     
-    def _generate_fallback_data(self, symbol: str, timeframe: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    def _has_bars_for(self, symbol: str, interval: str, start_ns: int, end_ns: int) -> bool:
+        """
+        Si las barras guardadas de 'interval' respaldan de verdad el rango pedido
+
+        La primera y la última barra deben estar cerca de los extremos del rango (como mucho
+        BASE_EDGE_TOLERANCE, para fines de semana y festivos) y la densidad de barras debe
+        llegar a MIN_BASE_DENSITY: así un tramo corto de M1 (drill-down) no sustituye a H1.
+        """
+        bars = self.cache.get_range(symbol, interval, start_ns, end_ns)
+        if len(bars) == 0:
+            return False
+        now_ns = datetime_to_ns(datetime.now(timezone.utc))
+        end_ns = min(end_ns, now_ns)
+        width = INTERVAL_MINUTES[interval] * NS_PER_MINUTE
+        if bars.time[0] - start_ns > BASE_EDGE_TOLERANCE or end_ns - (bars.time[-1] + width) > BASE_EDGE_TOLERANCE:
+            return False
+        return len(bars) * width >= MIN_BASE_DENSITY * (end_ns - start_ns)
+    
+    def _get_resampled_range(self, symbol: str, interval: str, start_ns: int, end_ns: int) -> Optional[BarSeries]:
+        """
+        Rango remuestreado desde un intervalo menor
+
+        None si no hay intervalo base o si sus barras no respaldan el rango (por ejemplo, la
+        API ya no da esa historia en M1): entonces se descarga la temporalidad pedida.
+        """
+        base_interval = self._base_interval_for(symbol, interval, start_ns, end_ns)
+        if base_interval is None:
+            return None
+        if self.cache.missing_ranges(symbol, base_interval, start_ns, end_ns):
+            self._get_cached_range(symbol, base_interval, start_ns, end_ns)
+            if not self._has_bars_for(symbol, base_interval, start_ns, end_ns):
+                print(f"[DATA_PROVIDER] {base_interval} no cubre el rango, se usa {interval} directamente")
+                return None
+        # La referencia al fichero identifica la versión de la base sin leerla
+        base = self.cache.archive(symbol, base_interval)
+        if base is None:
+            return None
+        try:
+            resampled = resampler.get(symbol, base_interval, base, INTERVAL_MINUTES[interval])
+        except (OSError, ArchiveError) as e:
+            print(f"[DATA_PROVIDER] Entrada {base_interval} ilegible, se usa {interval} directamente: {e}")
+            return None
+        print(f"[DATA_PROVIDER] {interval} remuestreado desde {base_interval}")
+        return resampled.between(start_ns, end_ns)
+    
+    def _fetch_series(self, symbol: str, interval: str, outputsize: str) -> BarSeries:
+        """Descarga la serie de Alpha Vantage y la convierte a formato columnar"""
+        # Construir URL para forex
+        params = {
+            'function': 'FX_INTRADAY' if interval != 'daily' else 'FX_DAILY',
+            'from_symbol': symbol[:3],  # EUR
+            'to_symbol': symbol[3:],    # USD
+            'interval': interval,
+            'apikey': self.api_key,
+            'outputsize': outputsize
+        }
+        
+        response = requests.get(self.base_url, params=params, timeout=30)
+        response.raise_for_status()
+        
+        data = response.json()
+        
+        # Verificar si hay error en la respuesta
+        if 'Error Message' in data:
+            raise Exception(f"Error Alpha Vantage: {data['Error Message']}")
+        
+        if 'Note' in data:
+            raise Exception(f"Rate limit Alpha Vantage: {data['Note']}")
+        
+        # Extraer datos de la respuesta
+        if interval != 'daily':
+            time_series_key = f'Time Series FX ({interval})'
+        else:
+            time_series_key = 'Time Series (FX)'
+            
+        if time_series_key not in data:
+            raise Exception(f"No se encontraron datos en la respuesta: {list(data.keys())}")
+        
+        time_series = data[time_series_key]
+        
+        # Convertir a formato columnar
+        count = len(time_series)
+        times = np.empty(count, dtype=np.int64)
+        ohlc_values = np.empty((4, count))
+        valid = 0
+        
+        for timestamp, ohlc in time_series.items():
+            try:
+                # Parsear timestamp
+                times[valid] = datetime_to_ns(timestamp.replace(' ', 'T'))
+                ohlc_values[0, valid] = float(ohlc['1. open'])
+                ohlc_values[1, valid] = float(ohlc['2. high'])
+                ohlc_values[2, valid] = float(ohlc['3. low'])
+                ohlc_values[3, valid] = float(ohlc['4. close'])
+                valid += 1
+            except (ValueError, KeyError) as e:
+                print(f"[DATA_PROVIDER] Error procesando barra {timestamp}: {e}")
+                continue
+        
+        # Alpha Vantage no proporciona volumen para forex
+        bars = BarSeries(
+            times[:valid], *ohlc_values[:, :valid], np.full(valid, 1000.0)
+        )
+        
+        # Ordenar por tiempo
+        return bars.sorted()
+    
+    def _generate_fallback_data(self, symbol: str, timeframe: str, start_date: str, end_date: str) -> BarSeries:
         """Genera datos de fallback si la API falla"""
         print(f"[DATA_PROVIDER] Generando datos de fallback para {symbol}")
         
@@ -136,38 +286,26 @@ class DataProvider:
         start_dt = datetime.fromisoformat(start_date)
         end_dt = datetime.fromisoformat(end_date)
         total_minutes = int((end_dt - start_dt).total_seconds() / 60)
-        num_bars = total_minutes // minutes
+        num_bars = max(total_minutes // minutes, 0)
+        
+        # Movimiento más realista con tendencias y reversiones (alcista 100 barras, bajista 100)
+        i = np.arange(num_bars)
+        step = 0.0001 + (i % 10) * 0.00001
+        change = np.where(i % 200 < 100, step, -step)
         
-        # Generar datos más realistas que el random walk anterior
-        bars = []
         base_price = 1.1000 if 'EUR' in symbol else 1.0000
-        current_price = base_price
-        
-        for i in range(num_bars):
-            # Movimiento más realista con tendencias y reversiones
-            if i % 200 < 100:  # Tendencia alcista
-                change = 0.0001 + (i % 10) * 0.00001
-            else:  # Tendencia bajista
-                change = -0.0001 - (i % 10) * 0.00001
-                
-            current_price += change
-            
-            # Generar OHLC más realista
-            high = current_price + abs(change) * 2
-            low = current_price - abs(change) * 2
-            open_price = current_price - change * 0.5
-            close = current_price
-            
-            bar_time = start_dt + timedelta(minutes=i * minutes)
-            
-            bars.append({
-                'time': bar_time,
-                'open': open_price,
-                'high': high,
-                'low': low,
-                'close': close,
-                'volume': 1000
-            })
+        # Acumular empezando por el precio base para conservar el mismo redondeo que el bucle
+        close = np.cumsum(np.concatenate(([base_price], change)))[1:]
+        
+        # Generar OHLC más realista
+        bars = BarSeries(
+            datetime_to_ns(start_dt) + i * (minutes * 60 * 10**9),
+            close - change * 0.5,
+            close + np.abs(change) * 2,
+            close - np.abs(change) * 2,
+            close,
+            np.full(num_bars, 1000.0)
+        )
         
         print(f"[DATA_PROVIDER] Generados {len(bars)} barras de fallback")
         return bars
@@ -0,0 +1,185 @@
+"""
+Curva de equity por barra
+El motor guarda la equity de cada barra (marcada a mercado) como array; la API recibe una
+versión reducida a un número de puntos y puede pedir cualquier tramo a resolución completa
+"""
+import os
+import threading
+import uuid
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .bar_series import ns_to_datetime
+from .metrics import drawdown_series
+
+
+DEFAULT_EQUITY_POINTS = 1000
+MAX_RANGE_POINTS = 50000
+DEFAULT_STORE_MAX_MB = 128
+
+# 'minmax': mínimo y máximo de cada tramo (conserva los picos de drawdown)
+# 'lttb': Largest-Triangle-Three-Buckets (conserva la forma visual)
+DOWNSAMPLE_METHODS = ('minmax', 'lttb')
+
+
+def minmax_indices(values: np.ndarray, points: int) -> np.ndarray:
+    """Índices del mínimo y el máximo de cada tramo más la primera y la última barra (<= points)"""
+    length = len(values)
+    buckets = max(1, (points - 2) // 2)
+    edges = np.unique(np.linspace(0, length, buckets + 1).astype(np.int64))
+    starts = edges[:-1]
+    bucket_of = np.repeat(np.arange(len(starts)), np.diff(edges))
+
+    selected = [np.array([0, length - 1])]
+    for reduce in (np.minimum, np.maximum):
+        extremes = reduce.reduceat(values, starts)
+        # Primera barra de cada tramo que alcanza su extremo
+        hits = np.flatnonzero(values == extremes[bucket_of])
+        _, first = np.unique(bucket_of[hits], return_index=True)
+        selected.append(hits[first])
+    return np.unique(np.concatenate(selected))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Índices elegidos por Largest-Triangle-Three-Buckets
+
+    En cada tramo se elige el punto que forma el triángulo de mayor área con el punto
+    elegido en el tramo anterior y la media del tramo siguiente.
+    """
+    length = len(y)
+    if points < 3 or length <= points:
+        return np.arange(length)
+    x = x.astype(np.float64)
+    x = x - x[0]  # Tiempos en ns relativos: áreas sin pérdida de precisión
+    edges = np.linspace(1, length - 1, points - 1).astype(np.int64)
+    indices = np.empty(points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = length - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else length
+        mean_x = x[next_start:next_end].mean()
+        mean_y = y[next_start:next_end].mean()
+        areas = np.abs((x[previous] - mean_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (mean_y - y[previous]))
+        previous = start + int(areas.argmax())
+        indices[bucket + 1] = previous
+    return indices
+
+
+def downsample_indices(times: np.ndarray, equity: np.ndarray, points: int,
+                       method: str = 'minmax') -> np.ndarray:
+    """Índices de las barras que representan la curva con como mucho 'points' puntos"""
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Método de reducción no soportado: {method}")
+    if points <= 0 or len(equity) <= points:
+        return np.arange(len(equity))
+    if method == 'lttb':
+        return lttb_indices(times, equity, points)
+    return minmax_indices(equity, points)
+
+
+def curve_points(times: np.ndarray, equity: np.ndarray, drawdown_percents: np.ndarray,
+                 indices: np.ndarray) -> List[Dict[str, Any]]:
+    """Puntos de la curva de equity para la API ({time, equity, drawdown})"""
+    return [
+        {'time': ns_to_datetime(t).isoformat(), 'equity': round(e, 2), 'drawdown': round(d, 2)}
+        for t, e, d in zip(times[indices].tolist(), equity[indices].tolist(), drawdown_percents[indices].tolist())
+    ]
+
+
+def downsample_curve(times: np.ndarray, equity: np.ndarray, initial_balance: float,
+                     points: int = DEFAULT_EQUITY_POINTS, method: str = 'minmax') -> List[Dict[str, Any]]:
+    """Curva reducida a 'points' puntos (todas las barras si points <= 0)"""
+    if not len(equity):
+        return []
+    _, _, drawdown_percents = drawdown_series(equity, initial_balance)
+    return curve_points(times, equity, drawdown_percents, downsample_indices(times, equity, points, method))
+
+
+class EquityStore:
+    """
+    Curvas de equity por barra de los últimos backtests, para el zoom a resolución completa
+
+    Caché LRU por id limitada a KUMO_EQUITY_STORE_MAX_MB. Los backtests del pool devuelven
+    su curva en result['barEquity']; attach() la guarda y la sustituye por 'equityId'.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('KUMO_EQUITY_STORE_MAX_MB', DEFAULT_STORE_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[np.ndarray, np.ndarray, float]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, equity_id: str) -> bool:
+        with self._lock:
+            return equity_id in self._entries
+
+    def put(self, equity_id: str, times: np.ndarray, equity: np.ndarray, initial_balance: float):
+        size = times.nbytes + equity.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(equity_id, None)
+            if previous is not None:
+                self._bytes -= previous[0].nbytes + previous[1].nbytes
+            self._entries[equity_id] = (times, equity, initial_balance)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (old_times, old_equity, _) = self._entries.popitem(last=False)
+                self._bytes -= old_times.nbytes + old_equity.nbytes
+
+    def get(self, equity_id: str) -> Optional[Tuple[np.ndarray, np.ndarray, float]]:
+        with self._lock:
+            entry = self._entries.get(equity_id)
+            if entry is not None:
+                self._entries.move_to_end(equity_id)
+            return entry
+
+    def attach(self, result: Dict[str, Any], equity_id: Optional[str] = None) -> Dict[str, Any]:
+        """Guarda result['barEquity'] (si lo hay) y deja en su lugar result['equityId']"""
+        bar_equity = result.pop('barEquity', None)
+        if bar_equity is not None:
+            equity_id = equity_id or uuid.uuid4().hex
+            self.put(equity_id, bar_equity['time'], bar_equity['equity'], bar_equity['initialBalance'])
+            result['equityId'] = equity_id
+        return result
+
+    def range(self, equity_id: str, start: Optional[int] = None, end: Optional[int] = None,
+              points: int = DEFAULT_EQUITY_POINTS, method: str = 'minmax') -> Optional[Dict[str, Any]]:
+        """
+        Tramo [start, end] (ns) de una curva guardada
+
+        Si el tramo tiene más barras que 'points' se reduce; el drawdown se mide siempre
+        contra el máximo de la curva completa. None si la curva ya no está guardada.
+        """
+        entry = self.get(equity_id)
+        if entry is None:
+            return None
+        times, equity, initial_balance = entry
+        first = int(np.searchsorted(times, start, 'left')) if start is not None else 0
+        last = int(np.searchsorted(times, end, 'right')) if end is not None else len(times)
+        _, _, drawdown_percents = drawdown_series(equity[:last], initial_balance)
+        window_times, window_equity = times[first:last], equity[first:last]
+        points = min(points, MAX_RANGE_POINTS) if points > 0 else MAX_RANGE_POINTS
+        indices = downsample_indices(window_times, window_equity, points, method)
+        return {
+            'equityId': equity_id,
+            'totalBars': len(times),
+            'rangeBars': len(window_times),
+            'downsampled': len(indices) < len(window_times),
+            'points': curve_points(window_times, window_equity, drawdown_percents[first:last], indices),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'maxBytes': self.max_bytes}
+
+
+# Instancia global (en el proceso de la API)
+equity_store = EquityStore()
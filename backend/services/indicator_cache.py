@@ -0,0 +1,265 @@
+"""
+Caché compartida de series de indicadores
+Guarda las series ya calculadas por (datos, indicador, parámetros) para que cualquier
+backtest u optimización sobre las mismas barras las reutilice, aunque venga de otra petición
+"""
+import atexit
+import hashlib
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .bar_series import BarSeries
+from .indicators import IndicatorKey
+
+
+DEFAULT_MAX_MB = 256
+
+# (huella de las barras, clave del indicador)
+CacheKey = Tuple[str, IndicatorKey]
+
+# Cabecera de cada segmento compartido: [marca de listo, nº de valores] (int64) y después
+# los valores. El creador escribe la marca al final: hasta entonces nadie lo usa.
+HEADER_BYTES = 16
+READY = 0x4B554D4F52454459
+
+# Segmentos que no se pudieron cerrar porque aún hay arrays que los usan
+_deferred_close = []
+
+
+def _close_deferred():
+    """Reintenta cerrar los segmentos pendientes (los que ya no tienen vistas)"""
+    for segment in list(_deferred_close):
+        try:
+            segment.close()
+        except BufferError:
+            continue
+        _deferred_close.remove(segment)
+
+
+def segment_name(key: CacheKey) -> str:
+    """Nombre del segmento de memoria compartida de una serie (igual en todos los procesos)"""
+    return 'kumo_' + hashlib.blake2b(repr(key).encode(), digest_size=12).hexdigest()
+
+
+class _Entry:
+    """Serie guardada; con memoria compartida mantiene vivo su segmento"""
+    __slots__ = ('values', 'segment', 'owner')
+
+    def __init__(self, values: np.ndarray, segment: Optional[shared_memory.SharedMemory] = None,
+                 owner: Optional[int] = None):
+        self.values = values
+        self.segment = segment
+        self.owner = owner  # PID del proceso que creó el segmento (lo hereda un fork)
+
+    def release(self):
+        """
+        Suelta el segmento: el creador elimina su nombre (nadie más lo abrirá) y se cierra
+        el mapeo; si alguien conserva todavía la serie, el cierre se aplaza hasta que la suelte
+        """
+        if self.segment is None:
+            return
+        self.values = None
+        if self.owner == os.getpid():
+            try:
+                self.segment.unlink()
+            except OSError:
+                pass
+        try:
+            self.segment.close()
+        except BufferError:
+            _deferred_close.append(self.segment)
+
+
+class IndicatorCache:
+    """
+    Caché LRU de series de indicadores limitada por bytes
+
+    Es por proceso (cada proceso del pool tiene la suya). Con KUMO_INDICATOR_CACHE_SHARED=1
+    las series se publican además en segmentos de memoria compartida con nombre derivado
+    de la clave, de modo que un proceso reutiliza sin copiar las que calculó otro; el
+    proceso que crea un segmento lo elimina al desalojarlo.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, shared: Optional[bool] = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('KUMO_INDICATOR_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        if shared is None:
+            shared = os.getenv('KUMO_INDICATOR_CACHE_SHARED', '0') == '1'
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._entries: 'OrderedDict[CacheKey, _Entry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: CacheKey, length: int) -> Optional[np.ndarray]:
+        """Serie guardada (de este proceso o, si está activada, de la memoria compartida)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.values
+
+        entry = self._attach(key, length) if self.shared else None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._store(key, entry)
+        return entry.values
+
+    def put(self, key: CacheKey, values: np.ndarray):
+        """Guarda una serie calculada"""
+        if values.nbytes > self.max_bytes:
+            return
+        entry = self._publish(key, values) if self.shared else None
+        self._store(key, entry or _Entry(values))
+
+    def _store(self, key: CacheKey, entry: _Entry):
+        with self._lock:
+            _close_deferred()
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.values.nbytes
+                previous.release()
+            self._entries[key] = entry
+            self._bytes += entry.values.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.values.nbytes
+                evicted.release()
+
+    def _publish(self, key: CacheKey, values: np.ndarray) -> Optional[_Entry]:
+        """
+        Copia la serie a un segmento compartido (si otro proceso ya lo creó, lo abre)
+
+        El segmento es visible por su nombre desde que se crea, así que la marca de listo
+        de la cabecera se escribe después de copiar los valores.
+        """
+        try:
+            segment = shared_memory.SharedMemory(name=segment_name(key), create=True,
+                                                 size=HEADER_BYTES + len(values) * 8)
+        except FileExistsError:
+            return self._attach(key, len(values))
+        except OSError as e:
+            print(f"[INDICATOR_CACHE] Sin memoria compartida: {e}")
+            return None
+        shared_values = np.frombuffer(segment.buf, dtype=np.float64, count=len(values), offset=HEADER_BYTES)
+        shared_values[:] = values
+        shared_values.flags.writeable = False
+        header = np.frombuffer(segment.buf, dtype=np.int64, count=2)
+        header[1] = len(values)
+        header[0] = READY
+        del header
+        return _Entry(shared_values, segment, owner=os.getpid())
+
+    def _attach(self, key: CacheKey, length: int) -> Optional[_Entry]:
+        """
+        Abre el segmento de otro proceso
+
+        None si no existe, si su creador aún no terminó de escribirlo o si no cuadra con
+        las barras: la serie se calcula en este proceso.
+        """
+        try:
+            segment = shared_memory.SharedMemory(name=segment_name(key))
+        except (FileNotFoundError, OSError):
+            return None
+        # El segmento es del proceso que lo creó: este no debe eliminarlo al salir
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        ready = False
+        if segment.size >= HEADER_BYTES + length * 8:
+            header = np.frombuffer(segment.buf, dtype=np.int64, count=2)
+            ready = header[0] == READY and header[1] == length
+            del header
+        if not ready:
+            segment.close()
+            return None
+        # frombuffer mantiene el buffer exportado mientras viva la serie (o una vista suya):
+        # así close() no puede desmapear memoria que aún se usa
+        values = np.frombuffer(segment.buf, dtype=np.float64, count=length, offset=HEADER_BYTES)
+        values.flags.writeable = False
+        return _Entry(values, segment)
+
+    def view(self, bars: BarSeries, local: Optional[Dict[IndicatorKey, np.ndarray]] = None,
+             dataset_id: Optional[str] = None) -> 'DatasetView':
+        """
+        Vista tipo diccionario para precompute_indicators sobre unas barras concretas
+
+        'dataset_id' identifica las barras sin leerlas (ArchiveRange.fingerprint() de las que
+        vienen del archivo .kbar); sin él se usa la huella de todo su contenido.
+        """
+        return DatasetView(self, dataset_id or bars.fingerprint(), len(bars), local)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'shared': self.shared,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                entry.release()
+            self._entries.clear()
+            self._bytes = 0
+            _close_deferred()
+
+
+class DatasetView:
+    """
+    Caché de indicadores de un conjunto de barras, con la interfaz de diccionario que
+    espera precompute_indicators (in, [], []=)
+
+    'local' es un diccionario propio opcional (ej. el del Optimizer, que viaja a los
+    procesos del pool): se consulta primero y recibe también las series encontradas.
+    """
+
+    def __init__(self, cache: IndicatorCache, dataset_id: str, length: int,
+                 local: Optional[Dict[IndicatorKey, np.ndarray]] = None):
+        self.cache = cache
+        self.dataset_id = dataset_id
+        self.length = length
+        self.local = local if local is not None else {}
+
+    def __contains__(self, key: IndicatorKey) -> bool:
+        if key in self.local:
+            return True
+        values = self.cache.get((self.dataset_id, key), self.length)
+        if values is None:
+            return False
+        self.local[key] = values
+        return True
+
+    def __getitem__(self, key: IndicatorKey) -> np.ndarray:
+        if key not in self:
+            raise KeyError(key)
+        return self.local[key]
+
+    def __setitem__(self, key: IndicatorKey, values: np.ndarray):
+        self.local[key] = values
+        self.cache.put((self.dataset_id, key), values)
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def __iter__(self) -> Iterator[IndicatorKey]:
+        return iter(self.local)
+
+    def items(self):
+        return self.local.items()
+
+
+# Instancia global (una por proceso)
+indicator_cache = IndicatorCache()
+atexit.register(indicator_cache.clear)
@@ -0,0 +1,410 @@
+"""
+Indicadores incrementales (streaming) para el motor de backtesting
+Cada indicador guarda su propio estado y se actualiza en O(1) por barra,
+en lugar de recalcularse sobre todo el historial de precios
+"""
+from collections import deque
+from typing import Dict, Any, Optional, Tuple, Hashable
+
+from .resampler import timeframe_minutes
+
+
+# Clave normalizada de un indicador: (tipo, parámetros efectivos)
+IndicatorKey = Tuple[str, Tuple[Any, ...]]
+
+# Indicadores que son directamente un campo de la barra
+PRICE_FIELDS = ('close', 'open', 'high', 'low')
+
+# Indicador calculado en otra temporalidad: ('mtf', (minutos, clave del indicador))
+MTF = 'mtf'
+
+# Valor de hace n barras de un indicador: ('shift', (n, clave del indicador))
+SHIFT = 'shift'
+
+# Precio de entrada de los indicadores (parámetro applied_price)
+APPLIED_PRICES = ('close', 'open', 'high', 'low', 'median', 'typical', 'weighted')
+
+# Métodos de media móvil (parámetro ma_method) y tipos que fijan el método
+MA_METHODS = ('SMA', 'EMA', 'SMMA', 'LWMA')
+MA_ALIASES = {'sma': 'SMA', 'ema': 'EMA', 'smma': 'SMMA', 'lwma': 'LWMA'}
+
+# Líneas de los indicadores con varias salidas (parámetro 'component'); la primera es la de defecto
+COMPONENTS = {
+    'macd': ('main', 'signal', 'histogram'),
+    'stochastic': ('main', 'signal'),
+    'rvi': ('main', 'signal'),
+    'bollinger': ('middle', 'upper', 'lower'),
+    'envelopes': ('middle', 'upper', 'lower'),
+    'adx': ('main', 'plus_di', 'minus_di'),
+    'ichimoku': ('tenkan', 'kijun', 'senkou_a', 'senkou_b', 'chikou'),
+    'alligator': ('jaw', 'teeth', 'lips'),
+    'gator': ('upper', 'lower'),
+    'fractals': ('upper', 'lower'),
+}
+
+
+class SMAState:
+    """Simple Moving Average con suma móvil"""
+    def __init__(self, period: int):
+        self.period = period
+        self.window: deque = deque()
+        self.total = 0.0
+        self.value: Optional[float] = None
+
+    def update(self, price: float) -> Optional[float]:
+        self.window.append(price)
+        self.total += price
+        if len(self.window) > self.period:
+            self.total -= self.window.popleft()
+        if len(self.window) == self.period:
+            self.value = self.total / self.period
+        return self.value
+
+
+class EMAState:
+    """Exponential Moving Average (semilla = SMA de las primeras 'period' barras)"""
+    def __init__(self, period: int):
+        self.period = period
+        self.multiplier = 2 / (period + 1)
+        self.count = 0
+        self.seed_total = 0.0
+        self.value: Optional[float] = None
+
+    def update(self, price: float) -> Optional[float]:
+        if self.value is not None:
+            self.value = (price - self.value) * self.multiplier + self.value
+            return self.value
+
+        self.count += 1
+        self.seed_total += price
+        if self.count == self.period:
+            self.value = self.seed_total / self.period
+        return self.value
+
+
+class RSIState:
+    """Relative Strength Index con suavizado de Wilder"""
+    def __init__(self, period: int = 14):
+        self.period = period
+        self.prev_price: Optional[float] = None
+        self.count = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self.value: Optional[float] = None
+
+    def update(self, price: float) -> Optional[float]:
+        if self.prev_price is None:
+            self.prev_price = price
+            return None
+
+        change = price - self.prev_price
+        self.prev_price = price
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+
+        if self.count < self.period:
+            # Periodo de calentamiento: media simple de las primeras ganancias/pérdidas
+            self.count += 1
+            self.avg_gain += gain / self.period
+            self.avg_loss += loss / self.period
+            if self.count < self.period:
+                return None
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+
+        if self.avg_loss == 0:
+            self.value = 100.0
+        else:
+            rs = self.avg_gain / self.avg_loss
+            self.value = 100 - (100 / (1 + rs))
+        return self.value
+
+
+class MACDState:
+    """MACD con línea de señal real (EMA de la línea MACD)"""
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self.fast_ema = EMAState(fast)
+        self.slow_ema = EMAState(slow)
+        self.signal_ema = EMAState(signal)
+        self.value: Optional[Tuple[float, Optional[float], Optional[float]]] = None
+
+    def update(self, price: float) -> Optional[Tuple[float, Optional[float], Optional[float]]]:
+        fast = self.fast_ema.update(price)
+        slow = self.slow_ema.update(price)
+        if fast is None or slow is None:
+            return None
+
+        macd_line = fast - slow
+        signal_line = self.signal_ema.update(macd_line)
+        histogram = macd_line - signal_line if signal_line is not None else None
+        self.value = (macd_line, signal_line, histogram)
+        return self.value
+
+
+class StochasticState:
+    """
+    Stochastic Oscillator (%K, %D)
+    Máximos/mínimos de la ventana con deques monótonas, %K y %D suavizados con SMA
+    """
+    def __init__(self, period: int = 14, smooth_k: int = 3, smooth_d: int = 3):
+        self.period = period
+        self.index = 0
+        self.max_highs: deque = deque()  # (índice, high) decreciente
+        self.min_lows: deque = deque()   # (índice, low) creciente
+        self.k_sma = SMAState(smooth_k)
+        self.d_sma = SMAState(smooth_d)
+        self.value: Optional[Tuple[float, Optional[float]]] = None
+
+    def update(self, high: float, low: float, close: float) -> Optional[Tuple[float, Optional[float]]]:
+        i = self.index
+        self.index += 1
+
+        while self.max_highs and self.max_highs[-1][1] <= high:
+            self.max_highs.pop()
+        self.max_highs.append((i, high))
+        while self.min_lows and self.min_lows[-1][1] >= low:
+            self.min_lows.pop()
+        self.min_lows.append((i, low))
+
+        # Descartar valores fuera de la ventana
+        oldest = i - self.period + 1
+        if self.max_highs[0][0] < oldest:
+            self.max_highs.popleft()
+        if self.min_lows[0][0] < oldest:
+            self.min_lows.popleft()
+
+        if self.index < self.period:
+            return None
+
+        window_high = self.max_highs[0][1]
+        window_low = self.min_lows[0][1]
+        if window_high == window_low:
+            raw_k = 50.0  # Evitar división por cero
+        else:
+            raw_k = (close - window_low) / (window_high - window_low) * 100
+
+        k = self.k_sma.update(raw_k)
+        if k is None:
+            return None
+        d = self.d_sma.update(k)
+        self.value = (k, d)
+        return self.value
+
+
+def _int_param(parameters: Dict[str, Any], names: Tuple[str, ...], default: int) -> int:
+    """Lee el primer parámetro entero disponible (las variables no resueltas usan el defecto)"""
+    for name in names:
+        value = parameters.get(name)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return int(value)
+    return default
+
+
+def _float_param(parameters: Dict[str, Any], names: Tuple[str, ...], default: float) -> float:
+    """Como _int_param, para parámetros decimales (desviación, paso del SAR...)"""
+    for name in names:
+        value = parameters.get(name)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return float(default)
+
+
+def _choice_param(parameters: Dict[str, Any], name: str, options: Tuple[str, ...], default: str) -> str:
+    """Lee un parámetro de lista cerrada sin distinguir mayúsculas; ValueError si no es válido"""
+    value = parameters.get(name)
+    if not isinstance(value, str) or not value:
+        return default
+    for option in options:
+        if option.lower() == value.lower():
+            return option
+    raise ValueError(f"Valor no soportado para '{name}': {value}")
+
+
+def _base_key(indicator_type: str, parameters: Dict[str, Any]) -> Optional[IndicatorKey]:
+    """Clave del indicador sin desplazamiento (None si no está soportado)"""
+    def period(default: int) -> int:
+        return _int_param(parameters, ('period',), default)
+
+    def price(default: str = 'close') -> str:
+        return _choice_param(parameters, 'applied_price', APPLIED_PRICES, default)
+
+    def method(default: str = 'SMA') -> str:
+        return _choice_param(parameters, 'ma_method', MA_METHODS, default)
+
+    def component() -> str:
+        options = COMPONENTS[indicator_type]
+        return _choice_param(parameters, 'component', options, options[0])
+
+    if indicator_type in PRICE_FIELDS:
+        return (indicator_type, ())
+    if indicator_type in MA_ALIASES or indicator_type == 'ma':
+        # 'ma' usa ma_method; 'sma'/'ema'/'smma'/'lwma' fijan el método
+        ma_method = MA_ALIASES.get(indicator_type) or method()
+        return (ma_method.lower(), (period(14), price()))
+    if indicator_type in ('rsi', 'momentum'):
+        return (indicator_type, (period(14), price()))
+    if indicator_type in ('macd', 'osma'):
+        args = (
+            _int_param(parameters, ('fast_period', 'fast'), 12),
+            _int_param(parameters, ('slow_period', 'slow'), 26),
+            _int_param(parameters, ('signal_period', 'signal'), 9),
+            price(),
+        )
+        if indicator_type == 'macd':
+            args += (component(),)
+        return (indicator_type, args)
+    if indicator_type == 'stochastic':
+        return ('stochastic', (
+            _int_param(parameters, ('k_period', 'period'), 14),
+            _int_param(parameters, ('slowing', 'smooth_k'), 3),
+            _int_param(parameters, ('d_period', 'smooth_d'), 3),
+            component(),
+        ))
+    if indicator_type == 'bollinger':
+        return ('bollinger', (period(20), _float_param(parameters, ('deviation',), 2), price(), component()))
+    if indicator_type == 'envelopes':
+        return ('envelopes', (period(14), method(), price(), _float_param(parameters, ('deviation',), 0.1),
+                              component()))
+    if indicator_type == 'stddev':
+        return ('stddev', (period(20), method(), price()))
+    if indicator_type in ('atr', 'wpr', 'mfi', 'demarker'):
+        return (indicator_type, (period(14),))
+    if indicator_type == 'adx':
+        return ('adx', (period(14), component()))
+    if indicator_type == 'cci':
+        return ('cci', (period(14), price('typical')))
+    if indicator_type == 'force':
+        return ('force', (period(13), method(), price()))
+    if indicator_type in ('bears', 'bulls'):
+        return (indicator_type, (period(13), price()))
+    if indicator_type == 'rvi':
+        return ('rvi', (period(10), component()))
+    if indicator_type == 'chaikin':
+        return ('chaikin', (
+            _int_param(parameters, ('fast_period', 'fast'), 3),
+            _int_param(parameters, ('slow_period', 'slow'), 10),
+        ))
+    if indicator_type == 'obv':
+        return ('obv', (price(),))
+    if indicator_type in ('ad', 'volumes', 'ao', 'ac', 'bw_mfi'):
+        return (indicator_type, ())
+    if indicator_type == 'sar':
+        return ('sar', (_float_param(parameters, ('step',), 0.02), _float_param(parameters, ('maximum',), 0.2)))
+    if indicator_type == 'ichimoku':
+        return ('ichimoku', (
+            _int_param(parameters, ('tenkan_period',), 9),
+            _int_param(parameters, ('kijun_period',), 26),
+            _int_param(parameters, ('senkou_period',), 52),
+            component(),
+        ))
+    if indicator_type in ('alligator', 'gator'):
+        return (indicator_type, (
+            _int_param(parameters, ('jaw_period',), 13),
+            _int_param(parameters, ('jaw_shift',), 8),
+            _int_param(parameters, ('teeth_period',), 8),
+            _int_param(parameters, ('teeth_shift',), 5),
+            _int_param(parameters, ('lips_period',), 5),
+            _int_param(parameters, ('lips_shift',), 3),
+            method('SMMA'),
+            price('median'),
+            component(),
+        ))
+    if indicator_type == 'fractals':
+        return ('fractals', (component(),))
+    return None
+
+
+def indicator_key(indicator_type: str, parameters: Optional[Dict[str, Any]]) -> Optional[IndicatorKey]:
+    """
+    Normaliza (indicador, parámetros) a una clave hashable
+
+    Dos reglas que usan el mismo indicador con los mismos parámetros efectivos
+    comparten clave (ej: 'ma' y 'sma' con period=50), así que se calcula una sola vez.
+    Los indicadores con varias líneas llevan la línea elegida ('component') como último
+    parámetro, y un 'shift' > 0 envuelve la clave: valor de hace 'shift' barras.
+    Retorna None si el indicador no está soportado; ValueError si un parámetro de lista
+    (ma_method, applied_price, component) no es válido.
+    """
+    parameters = parameters or {}
+    key = _base_key(indicator_type, parameters)
+    shift = _int_param(parameters, ('shift',), 0)
+    if key is None or shift <= 0:
+        return key
+    return (SHIFT, (shift, key))
+
+
+def spec_key(spec: Dict[str, Any]) -> Optional[IndicatorKey]:
+    """
+    Clave de un indicador tal como aparece en una regla ({indicator, parameters, timeframe})
+
+    Con 'timeframe' (ej. 'D' o '4h') la clave envuelve la del indicador: se calcula sobre
+    las barras remuestreadas a esa temporalidad. ValueError si la temporalidad no existe.
+    """
+    key = indicator_key(spec.get('indicator', ''), spec.get('parameters'))
+    timeframe = spec.get('timeframe')
+    if key is None or not timeframe:
+        return key
+    return (MTF, (timeframe_minutes(timeframe), key))
+
+
+def create_state(key: IndicatorKey):
+    """
+    Crea el objeto de estado incremental para una clave normalizada
+
+    Solo cubre los indicadores originales sobre el cierre (las series completas de todos
+    los indicadores están en vector_indicators); ValueError para el resto.
+    """
+    name, args = key
+    if name in ('sma', 'ema', 'rsi') and args[1] == 'close':
+        return {'sma': SMAState, 'ema': EMAState, 'rsi': RSIState}[name](args[0])
+    if name == 'macd' and args[3] == 'close':
+        return MACDState(*args[:3])
+    if name == 'stochastic':
+        return StochasticState(*args[:3])
+    raise ValueError(f"Indicador no soportado: {name}")
+
+
+class IndicatorSet:
+    """
+    Conjunto de indicadores incrementales de una estrategia
+
+    Cada indicador distinto se registra una vez y se actualiza una única vez por
+    barra, sin importar cuántas reglas lo referencien.
+    """
+
+    def __init__(self):
+        self._states: Dict[Hashable, Any] = {}
+        self._values: Dict[Hashable, Any] = {}
+        self._bar: Optional[Dict[str, Any]] = None
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def register(self, indicator_type: str, parameters: Optional[Dict[str, Any]]) -> Optional[IndicatorKey]:
+        """Registra un indicador y retorna su clave (None si no está soportado)"""
+        key = indicator_key(indicator_type, parameters)
+        if key is None or key[0] in PRICE_FIELDS:
+            return key
+        if key not in self._states:
+            self._states[key] = create_state(key)
+            self._values[key] = None
+        return key
+
+    def update(self, bar: Dict[str, Any]):
+        """Avanza todos los indicadores registrados con una nueva barra"""
+        self._bar = bar
+        close = bar['close']
+        for key, state in self._states.items():
+            if key[0] == 'stochastic':
+                self._values[key] = state.update(bar['high'], bar['low'], close)
+            else:
+                self._values[key] = state.update(close)
+
+    def get(self, key: Optional[IndicatorKey]) -> Any:
+        """Valor actual del indicador (None si no está listo o no está registrado)"""
+        if key is None:
+            return None
+        if key[0] in PRICE_FIELDS:
+            return self._bar[key[0]] if self._bar is not None else None
+        return self._values.get(key)
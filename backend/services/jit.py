@@ -0,0 +1,126 @@
+"""
+Núcleos secuenciales compilados con Numba (opcional)
+La lógica que depende de la barra anterior (estado de la posición, Parabolic SAR) no se
+puede vectorizar: si numba está instalado estos bucles se compilan a código nativo; si no,
+el mismo código corre en Python y los llamadores usan su camino NumPy cuando lo tienen.
+Los bucles hacen las mismas operaciones en coma flotante en ambos casos: mismos resultados.
+"""
+import os
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+NUMBA_AVAILABLE = numba is not None
+
+# KUMO_JIT=0 desactiva los núcleos compilados aunque numba esté instalado
+JIT_ENABLED = NUMBA_AVAILABLE and os.getenv('KUMO_JIT', '1') != '0'
+
+
+def jit(func):
+    """Compila 'func' con numba.njit si está disponible; si no, la retorna tal cual"""
+    if not JIT_ENABLED:
+        return func
+    return numba.njit(cache=True, nogil=True)(func)
+
+
+def kernel_input(values: np.ndarray):
+    """
+    Array tal como lo recibe un núcleo
+
+    Compilado, el array de NumPy; en Python, una lista (indexar listas es mucho más rápido
+    que indexar elemento a elemento un array de NumPy).
+    """
+    return values if JIT_ENABLED else values.tolist()
+
+
+@jit
+def position_loop(direction, exit_mask, low, high, close, slippage, sl_distance, tp_distance, intrabar):
+    """
+    Recorre las señales compiladas y retorna (barras de entrada, barras de salida, salida por stop)
+
+    Abre en cada barra con dirección (1 / -1) si no hay posición y busca la primera barra
+    posterior que toca el stop loss o el take profit (dentro de la barra con 'intrabar', si
+    no al cierre) o tiene señal de salida; el stop tiene prioridad sobre la señal. Una
+    distancia NaN desactiva ese nivel. Salida -1: la posición sigue abierta al final.
+    El motivo y el precio de las salidas por stop los resuelve el motor en esa barra.
+    """
+    n = len(close)
+    entries = np.empty(n, np.int64)
+    exits = np.empty(n, np.int64)
+    stops = np.zeros(n, np.bool_)
+    count = 0
+    i = 0
+    while i < n:
+        if direction[i] == 0:
+            i += 1
+            continue
+        side = 1.0 if direction[i] > 0 else -1.0
+        is_long = side > 0
+        # Mismas operaciones que open_position y stop_levels
+        entry_price = close[i] + slippage if is_long else close[i] - slippage
+        sl_price = entry_price - side * sl_distance
+        tp_price = entry_price + side * tp_distance
+        entries[count] = i
+        exits[count] = -1
+
+        j = i + 1
+        while j < n:
+            if intrabar:
+                adverse = low[j] if is_long else high[j]
+                favorable = high[j] if is_long else low[j]
+            else:
+                adverse = close[j]
+                favorable = close[j]
+            sl_hit = adverse <= sl_price if is_long else adverse >= sl_price
+            tp_hit = favorable >= tp_price if is_long else favorable <= tp_price
+            if sl_hit or tp_hit:
+                stops[count] = True
+                break
+            if exit_mask[j]:
+                break
+            j += 1
+
+        count += 1
+        if j >= n:
+            break
+        exits[count - 1] = j
+        i = j + 1
+    return entries[:count], exits[:count], stops[:count]
+
+
+@jit
+def parabolic_sar_loop(high, low, rising, step, maximum, out):
+    """Parabolic SAR de Wilder desde la barra 1 (tendencia inicial 'rising'); escribe en 'out'"""
+    n = len(out)
+    sar = low[0] if rising else high[0]
+    extreme = high[1] if rising else low[1]
+    factor = step
+    out[1] = sar
+    for i in range(2, n):
+        sar += factor * (extreme - sar)
+        if rising:
+            sar = min(sar, low[i - 1], low[i - 2])
+            if low[i] < sar:
+                rising = False
+                sar = extreme
+                extreme = low[i]
+                factor = step
+            elif high[i] > extreme:
+                extreme = high[i]
+                factor = min(factor + step, maximum)
+        else:
+            sar = max(sar, high[i - 1], high[i - 2])
+            if high[i] > sar:
+                rising = True
+                sar = extreme
+                extreme = high[i]
+                factor = step
+            elif low[i] < extreme:
+                extreme = low[i]
+                factor = min(factor + step, maximum)
+        out[i] = sar
+    return out
@@ -0,0 +1,224 @@
+"""
+Gestor de trabajos de backtesting
+Ejecuta los backtests en un pool de procesos para no bloquear el event loop de la API
+y aprovechar varios núcleos en paralelo
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Trabajos terminados que se conservan para consultar su resultado
+DEFAULT_JOB_HISTORY = 500
+
+
+def run_backtest_job(strategy: Dict[str, Any], config: Dict[str, Any],
+                     cancel_token: Optional[Any] = None, bars: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Ejecuta un backtest completo (se llama dentro de un proceso del pool)
+
+    'bars' son las barras ya cargadas o su ArchiveRange (el motor lo abre con np.memmap); sin
+    barras, el motor las obtiene del proveedor de datos. La equity por barra vuelve en result['barEquity'] para que el proceso de la API la
+    guarde con equity_store.attach.
+    """
+    from .backtest_engine import BacktestEngine
+    engine = BacktestEngine(strategy, config, bars=bars, cancel_token=cancel_token)
+    result = engine.run()
+    result['barEquity'] = engine.bar_equity_series()
+    return result
+
+
+class BacktestJob:
+    """Trabajo enviado al pool"""
+
+    def __init__(self, job_id: str, future: Future, metadata: Optional[Dict[str, Any]] = None,
+                 cancel_token: Optional[Any] = None):
+        self.id = job_id
+        self.future = future
+        self.metadata = metadata or {}
+        self.cancel_token = cancel_token
+        self.cancel_requested = False
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return 'cancelled'
+        if self.future.done() and self.cancel_requested and self.future.exception() is None:
+            # Detenido por el token: el resultado es parcial
+            return 'cancelled'
+        if self.future.done():
+            return 'failed' if self.future.exception() is not None else 'completed'
+        if self.future.running():
+            return 'running'
+        return 'queued'
+
+    @property
+    def done(self) -> bool:
+        return self.future.done()
+
+    @property
+    def result(self) -> Any:
+        """Resultado del trabajo (None si no ha terminado o ha fallado)"""
+        if not self.future.done() or self.future.cancelled() or self.future.exception() is not None:
+            return None
+        from .equity_curve import equity_store
+        return equity_store.attach(self.future.result(), self.id)
+
+    @property
+    def error(self) -> Optional[str]:
+        if self.future.done() and not self.future.cancelled() and self.future.exception() is not None:
+            return str(self.future.exception())
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Estado del trabajo para la API (sin el resultado)"""
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'submittedAt': self.submitted_at,
+            'finishedAt': self.finished_at,
+            'elapsedSeconds': round((self.finished_at or time.time()) - self.submitted_at, 3),
+            'error': self.error,
+            **self.metadata
+        }
+
+
+class JobManager:
+    """
+    Pool de procesos para backtests con registro de trabajos por id
+
+    El tamaño del pool se configura con KUMO_BACKTEST_WORKERS (por defecto, nº de CPUs).
+    El pool se crea de forma perezosa en el primer envío.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, job_history: Optional[int] = None):
+        if max_workers is None:
+            max_workers = int(os.getenv('KUMO_BACKTEST_WORKERS', 0)) or os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.job_history = job_history or int(os.getenv('KUMO_JOB_HISTORY', DEFAULT_JOB_HISTORY))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._jobs: 'OrderedDict[str, BacktestJob]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                print(f"[JOBS] Iniciando pool de {self.max_workers} procesos")
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    @property
+    def manager(self):
+        """Manager compartido para colas y eventos entre procesos (se crea al primer uso)"""
+        with self._lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager
+
+    def channel(self):
+        """Canal de eventos para un backtest en streaming"""
+        from .streaming import EventChannel
+        return EventChannel(self.manager)
+
+    def submit(self, fn: Callable, *args, metadata: Optional[Dict[str, Any]] = None,
+               cancel_token: Optional[Any] = None) -> BacktestJob:
+        """Envía una función al pool y retorna el trabajo registrado"""
+        future = self.executor.submit(fn, *args)
+        job = BacktestJob(uuid.uuid4().hex, future, metadata, cancel_token)
+        future.add_done_callback(lambda _: self._on_done(job))
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    @staticmethod
+    def _backtest_metadata(strategy: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'strategyName': strategy.get('name', 'Strategy'),
+            'symbol': config.get('symbol', 'EURUSD'),
+            'timeframe': config.get('timeframe', '1h'),
+        }
+
+    def submit_backtest(self, strategy: Dict[str, Any], config: Dict[str, Any]) -> BacktestJob:
+        """Envía un backtest al pool"""
+        cancel_token = self.manager.Event()
+        return self.submit(run_backtest_job, strategy, config, cancel_token,
+                           metadata=self._backtest_metadata(strategy, config), cancel_token=cancel_token)
+
+    def submit_streaming_backtest(self, strategy: Dict[str, Any], config: Dict[str, Any],
+                                  channel) -> BacktestJob:
+        """Envía un backtest que emite sus eventos por 'channel' (ver services/streaming.py)"""
+        from .streaming import run_streaming_backtest_job
+        cancel_token = self.manager.Event()
+        return self.submit(run_streaming_backtest_job, strategy, config, channel, cancel_token,
+                           metadata=self._backtest_metadata(strategy, config), cancel_token=cancel_token)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Ejecuta una función en el pool y espera el resultado sin bloquear el event loop"""
+        return await asyncio.wrap_future(self.executor.submit(fn, *args))
+
+    def get(self, job_id: str) -> Optional[BacktestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[BacktestJob]:
+        """Trabajos registrados (en curso y los últimos terminados), del más antiguo al más reciente"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancela un trabajo
+
+        Si todavía no ha empezado se retira de la cola; si está corriendo y tiene token de
+        cancelación, el backtest se detiene en su siguiente comprobación y deja un
+        resultado parcial. Retorna False si el trabajo no existe o ya terminó.
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        if job.future.cancel():
+            return True
+        if job.cancel_token is None:
+            return False
+        job.cancel_requested = True
+        job.cancel_token.set()
+        print(f"[JOBS] Cancelación solicitada: {job.id}")
+        return True
+
+    def _on_done(self, job: BacktestJob):
+        job.finished_at = time.time()
+        if job.error:
+            print(f"[JOBS] Trabajo {job.id} falló: {job.error}")
+
+    def _prune(self):
+        """Olvida los trabajos terminados más antiguos por encima del histórico máximo"""
+        excess = len(self._jobs) - self.job_history
+        if excess <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done][:excess]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+
+
+# Instancia global
+job_manager = JobManager()
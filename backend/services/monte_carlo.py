@@ -0,0 +1,147 @@
+"""
+Simulación Monte Carlo de la secuencia de trades
+Remuestrea los beneficios de los trades cerrados para estimar la distribución del retorno
+y del drawdown máximo, y el riesgo de ruina, en lugar de un único valor por backtest
+"""
+import numpy as np
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+
+DEFAULT_SIMULATIONS = 10000
+DEFAULT_RUIN_THRESHOLD = 50  # % de pérdida del balance inicial que se considera ruina
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Elementos máximos de cada bloque trades x caminos (~8 MB en float64)
+MAX_CHUNK_ELEMENTS = 1_000_000
+
+# Caminos a partir de los cuales se avanza trade a trade en lugar de acumular por columnas
+# (las operaciones por paso amortizan su coste fijo sobre vectores largos)
+MIN_STEP_ROWS = 256
+
+METHODS = ('bootstrap', 'shuffle')
+
+
+def _distribution(values: np.ndarray) -> Dict[str, float]:
+    """Percentiles y media de una métrica simulada"""
+    result = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    result['mean'] = round(float(values.mean()), 2)
+    return result
+
+
+def _walk_paths(blocks: Iterator[np.ndarray], rows: int, initial_balance: float):
+    """
+    Recorre los trades de 'rows' caminos a la vez
+
+    Cada bloque es una matriz (trades x caminos). Con pocos caminos (shuffle con muchos
+    trades) el bloque se procesa entero: la equity es su suma acumulada por columnas más la
+    equity arrastrada, el pico su máximo acumulado (sin bajar del pico arrastrado) y mínimo
+    y drawdowns salen reduciendo por columnas. Con muchos caminos es más rápido avanzar un
+    trade cada vez sobre vectores de tamaño 'rows'. Los bloques se modifican.
+    """
+    equity = np.full(rows, float(initial_balance))
+    peak = equity.copy()
+    min_equity = equity.copy()
+    max_drawdown = np.zeros(rows)
+    max_drawdown_ratio = np.zeros(rows)
+    drawdown = np.empty(rows)
+
+    for block in blocks:
+        if rows >= MIN_STEP_ROWS:
+            for step in block:
+                equity += step
+                np.maximum(peak, equity, out=peak)
+                np.minimum(min_equity, equity, out=min_equity)
+                np.subtract(peak, equity, out=drawdown)
+                np.maximum(max_drawdown, drawdown, out=max_drawdown)
+                # El pico nunca baja del balance inicial (> 0)
+                np.divide(drawdown, peak, out=drawdown)
+                np.maximum(max_drawdown_ratio, drawdown, out=max_drawdown_ratio)
+            continue
+
+        # Sumar la equity arrastrada a la primera fila da las mismas sumas que paso a paso
+        block[0] += equity
+        curve = np.cumsum(block, axis=0, out=block)
+        running_peak = np.maximum.accumulate(curve, axis=0)
+        np.maximum(running_peak, peak, out=running_peak)
+        np.minimum(min_equity, curve.min(axis=0), out=min_equity)
+        equity = curve[-1].copy()
+        peak = running_peak[-1].copy()
+
+        block_drawdown = np.subtract(running_peak, curve, out=curve)
+        np.maximum(max_drawdown, block_drawdown.max(axis=0), out=max_drawdown)
+        np.divide(block_drawdown, running_peak, out=block_drawdown)
+        np.maximum(max_drawdown_ratio, block_drawdown.max(axis=0), out=max_drawdown_ratio)
+
+    return equity, max_drawdown, max_drawdown_ratio * 100, min_equity
+
+
+def simulate_paths(profits: np.ndarray, initial_balance: float, simulations: int,
+                   method: str, rng: np.random.Generator):
+    """
+    Simula 'simulations' secuencias de trades y retorna por camino:
+    (balance final, drawdown máximo, drawdown máximo en %, equity mínima)
+
+    Los trades remuestreados se generan como matrices 2-D (trades x caminos) por bloques
+    de como mucho MAX_CHUNK_ELEMENTS y se recorren para todos los caminos a la vez: no hay
+    bucle por camino.
+    """
+    n = len(profits)
+    if method == 'bootstrap':
+        # Bootstrap: trades elegidos al azar con reemplazo
+        block = max(1, MAX_CHUNK_ELEMENTS // simulations)
+        blocks = (
+            profits[rng.integers(0, n, size=(min(block, n - start), simulations))]
+            for start in range(0, n, block)
+        )
+        return _walk_paths(blocks, simulations, initial_balance)
+
+    # Shuffle: mismos trades en distinto orden (cambia el drawdown, no el retorno final).
+    # Cada camino necesita su permutación completa, así que se trocea por caminos
+    results = [np.empty(simulations) for _ in range(4)]
+    chunk = max(1, MAX_CHUNK_ELEMENTS // n)
+    for start in range(0, simulations, chunk):
+        rows = min(chunk, simulations - start)
+        shuffled = np.repeat(profits[:, None], rows, axis=1)
+        rng.permuted(shuffled, axis=0, out=shuffled)
+        for out, values in zip(results, _walk_paths([shuffled], rows, initial_balance)):
+            out[start:start + rows] = values
+    return tuple(results)
+
+
+def monte_carlo(profits: Sequence[float], initial_balance: float,
+                simulations: int = DEFAULT_SIMULATIONS, method: str = 'bootstrap',
+                ruin_threshold: float = DEFAULT_RUIN_THRESHOLD,
+                seed: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Distribuciones Monte Carlo a partir de los beneficios de los trades cerrados
+
+    method: 'bootstrap' (con reemplazo) o 'shuffle' (permutaciones del orden)
+    ruin_threshold: pérdida (% del balance inicial) a partir de la cual un camino se arruina
+
+    Retorna None si hay menos de 2 trades.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Método Monte Carlo no soportado: {method}")
+    profits = np.asarray(profits, dtype=np.float64)
+    if len(profits) < 2 or simulations <= 0:
+        return None
+
+    rng = np.random.default_rng(seed)
+    final_balance, max_drawdown, max_drawdown_percent, min_equity = simulate_paths(
+        profits, initial_balance, int(simulations), method, rng
+    )
+    return_percent = (final_balance - initial_balance) / initial_balance * 100
+    ruin_level = initial_balance * (1 - ruin_threshold / 100)
+
+    return {
+        'method': method,
+        'simulations': int(simulations),
+        'trades': len(profits),
+        'returnPercent': _distribution(return_percent),
+        'finalBalance': _distribution(final_balance),
+        'maxDrawdown': _distribution(max_drawdown),
+        'maxDrawdownPercent': _distribution(max_drawdown_percent),
+        'probabilityOfProfit': round(float((final_balance > initial_balance).mean() * 100), 2),
+        'riskOfRuin': round(float((min_equity <= ruin_level).mean() * 100), 2),
+        'ruinThreshold': ruin_threshold,
+    }
@@ -0,0 +1,239 @@
+"""
+Optimización de parámetros por rejilla
+Ejecuta un backtest por cada combinación de parámetros cargando las barras una sola vez
+y calculando cada serie de indicador distinta una sola vez para todas las combinaciones
+"""
+import copy
+import itertools
+import os
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from .bar_archive import ArchiveRange, open_bars
+from .bar_series import BarSeries
+from .indicator_cache import indicator_cache
+from .vector_indicators import precompute_indicators
+
+
+# Límite de combinaciones por optimización
+DEFAULT_MAX_COMBINATIONS = 5000
+
+# Métricas en las que un valor menor es mejor
+ASCENDING_METRICS = {'maxDrawdown', 'maxDrawdownPercent', 'maxDrawdownDuration', 'consecutiveLosses'}
+
+
+def _path_parts(path: str) -> List[Any]:
+    """'entryBlocks.0.rules.0.indicator.parameters.period' -> ['entryBlocks', 0, 'rules', 0, ...]"""
+    return [int(part) if part.isdigit() else part for part in path.split('.')]
+
+
+def set_path(obj: Dict[str, Any], path: str, value: Any):
+    """Asigna un valor en la estrategia siguiendo una ruta con puntos"""
+    parts = _path_parts(path)
+    target = obj
+    try:
+        for part in parts[:-1]:
+            target = target[part]
+        if isinstance(target, list) and not isinstance(parts[-1], int):
+            raise KeyError(parts[-1])
+        target[parts[-1]] = value
+    except (KeyError, IndexError, TypeError):
+        raise ValueError(f"Ruta de parámetro inválida: '{path}'")
+
+
+def parameter_values(spec: Dict[str, Any]) -> List[Any]:
+    """
+    Valores de un parámetro: lista explícita ('values') o rango ('start', 'stop', 'step')
+
+    El rango incluye 'stop'. Si todos los extremos son enteros, los valores son enteros.
+    """
+    if 'values' in spec:
+        values = list(spec['values'])
+    elif 'start' in spec and 'stop' in spec:
+        start, stop = spec['start'], spec['stop']
+        step = spec.get('step', 1)
+        if step <= 0:
+            raise ValueError(f"El paso de '{spec.get('path')}' debe ser positivo")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        values = [start + i * step for i in range(max(count, 0))]
+        if all(isinstance(v, int) for v in (start, stop, step)):
+            values = [int(v) for v in values]
+        else:
+            values = [round(v, 10) for v in values]
+    else:
+        raise ValueError(f"El parámetro '{spec.get('path')}' necesita 'values' o 'start'/'stop'")
+
+    if not values:
+        raise ValueError(f"El parámetro '{spec.get('path')}' no tiene valores")
+    return values
+
+
+def expand_grid(parameters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Producto cartesiano de los parámetros: una combinación {ruta: valor} por backtest"""
+    if not parameters:
+        return [{}]
+    paths = [spec['path'] for spec in parameters]
+    value_lists = [parameter_values(spec) for spec in parameters]
+    return [dict(zip(paths, combo)) for combo in itertools.product(*value_lists)]
+
+
+def apply_parameters(strategy: Dict[str, Any], combination: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia de la estrategia con los valores de la combinación aplicados"""
+    variant = copy.deepcopy(strategy)
+    for path, value in combination.items():
+        set_path(variant, path, value)
+    return variant
+
+
+def run_optimization_chunk(strategy: Dict[str, Any], config: Dict[str, Any],
+                           combinations: List[Dict[str, Any]], bars: Union[BarSeries, ArchiveRange],
+                           indicator_cache: Dict[Any, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Ejecuta un lote de combinaciones (se llama dentro de un proceso del pool)
+
+    Las barras (o su ArchiveRange, que se abre aquí con np.memmap) y los indicadores que
+    usan las combinaciones del lote llegan una vez y se comparten entre sus backtests.
+    """
+    from .backtest_engine import BacktestEngine
+
+    if isinstance(bars, ArchiveRange):
+        archive = bars
+        version = archive.version
+        bars = archive.load()
+        if archive.version != version:
+            # Las series recibidas son de la versión anterior del fichero: se recalculan aquí
+            indicator_cache = {}
+    # Solo hacen falta las métricas de cada combinación
+    config = {**config, 'verbose': False, 'monteCarlo': False}
+    rows = []
+    for combination in combinations:
+        engine = BacktestEngine(apply_parameters(strategy, combination), config,
+                                bars=bars, indicator_cache=indicator_cache)
+        result = engine.run()
+        rows.append({'parameters': combination, 'metrics': result['metrics']})
+    return rows
+
+
+def rank_results(rows: List[Dict[str, Any]], sort_by: str = 'netProfit',
+                 ascending: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """Ordena los resultados por una métrica y añade su posición ('rank')"""
+    if ascending is None:
+        ascending = sort_by in ASCENDING_METRICS
+
+    def sort_key(row):
+        value = row['metrics'].get(sort_by)
+        if not isinstance(value, (int, float)):
+            return float('inf')
+        return value if ascending else -value
+
+    ranked = sorted(rows, key=sort_key)
+    return [{'rank': i + 1, **row} for i, row in enumerate(ranked)]
+
+
+class Optimizer:
+    """
+    Optimización por rejilla de una estrategia
+
+    parameters: lista de {'path': ruta en la estrategia, 'values': [...]} o
+        {'path': ..., 'start': a, 'stop': b, 'step': s}, por ejemplo
+        'entryBlocks.0.rules.0.indicator.parameters.period', 'stopLoss.value',
+        'takeProfit.value' o 'positionSizing.value'
+    """
+
+    def __init__(self, strategy: Dict[str, Any], config: Dict[str, Any],
+                 parameters: List[Dict[str, Any]], sort_by: str = 'netProfit',
+                 ascending: Optional[bool] = None, max_combinations: Optional[int] = None):
+        self.strategy = strategy
+        self.config = config
+        self.sort_by = sort_by
+        self.ascending = ascending
+        self.combinations = expand_grid(parameters)
+
+        if max_combinations is None:
+            max_combinations = int(os.getenv('KUMO_OPTIMIZATION_MAX_COMBINATIONS', DEFAULT_MAX_COMBINATIONS))
+        if len(self.combinations) > max_combinations:
+            raise ValueError(
+                f"Demasiadas combinaciones: {len(self.combinations)} (máximo {max_combinations})"
+            )
+        # Validar las rutas antes de cargar datos
+        for combination in self.combinations[:1]:
+            apply_parameters(strategy, combination)
+
+        self.bars: Optional[BarSeries] = None
+        # Lo que se envía a los procesos en lugar de las barras (ArchiveRange si están en caché)
+        self.source: Optional[Union[BarSeries, ArchiveRange]] = None
+        self.indicator_cache: Dict[Any, np.ndarray] = {}
+        # Identificador de las barras en la caché de indicadores (huella del ArchiveRange o del contenido)
+        self.dataset_id: Optional[str] = None
+        # Claves de indicador de cada combinación (cada lote recibe solo las suyas)
+        self.combination_keys: List[tuple] = []
+
+    def prepare(self, bars: Optional[BarSeries] = None):
+        """Carga las barras una vez y calcula cada serie de indicador distinta de la rejilla"""
+        from .backtest_engine import BacktestEngine
+        from .batch import load_run_bars
+
+        source = bars
+        if source is None:
+            source = load_run_bars(self.config)
+            bars = open_bars(source)
+        if bars is None:
+            # Datos insuficientes: las barras simuladas del motor viajan a los procesos
+            bars = source = BacktestEngine(self.strategy, self.config).generate_price_data()
+        self.bars = bars
+        self.source = source
+        # Las series ya calculadas en este proceso (otras peticiones) se reutilizan
+        dataset_id = source.fingerprint() if isinstance(source, ArchiveRange) else None
+        cache = indicator_cache.view(bars, local=self.indicator_cache, dataset_id=dataset_id)
+        self.dataset_id = cache.dataset_id
+        self.combination_keys = [
+            tuple(precompute_indicators(apply_parameters(self.strategy, combination), bars, cache))
+            for combination in self.combinations
+        ]
+        print(f"[OPTIMIZER] {len(self.combinations)} combinaciones, {len(bars)} barras, "
+              f"{len(self.indicator_cache)} series de indicadores")
+
+    def chunks(self, workers: int) -> List[tuple]:
+        """Reparte las combinaciones en un lote por worker (argumentos de run_optimization_chunk)"""
+        if self.bars is None:
+            self.prepare()
+        workers = max(1, min(workers, len(self.combinations)))
+        chunks = []
+        for i in range(workers):
+            keys = set(itertools.chain.from_iterable(self.combination_keys[i::workers]))
+            chunk_cache = {key: self.indicator_cache[key] for key in keys}
+            chunks.append((self.strategy, self.config, self.combinations[i::workers], self.source, chunk_cache))
+        return chunks
+
+    def run(self, executor=None, workers: int = 1) -> Dict[str, Any]:
+        """Ejecuta la rejilla completa (en el executor indicado o en este proceso)"""
+        started = time.time()
+        chunks = self.chunks(workers if executor is not None else 1)
+        if executor is None:
+            chunk_results = [run_optimization_chunk(*args) for args in chunks]
+        else:
+            futures = [executor.submit(run_optimization_chunk, *args) for args in chunks]
+            chunk_results = [future.result() for future in futures]
+        return self.response(chunk_results, time.time() - started)
+
+    def response(self, chunk_results: List[List[Dict[str, Any]]], elapsed: float) -> Dict[str, Any]:
+        """Resultado de la optimización con la tabla ordenada"""
+        # Deshacer el reparto intercalado: los empates quedan en el orden de la rejilla
+        workers = len(chunk_results)
+        rows = [None] * sum(len(rows) for rows in chunk_results)
+        for i, chunk_rows in enumerate(chunk_results):
+            rows[i::workers] = chunk_rows
+        return {
+            'success': True,
+            'strategyName': self.strategy.get('name', 'Strategy'),
+            'symbol': self.config.get('symbol', 'EURUSD'),
+            'timeframe': self.config.get('timeframe', '1h'),
+            'startDate': self.config.get('startDate'),
+            'endDate': self.config.get('endDate'),
+            'totalCombinations': len(self.combinations),
+            'sortBy': self.sort_by,
+            'elapsedSeconds': round(elapsed, 3),
+            'results': rank_results(rows, self.sort_by, self.ascending),
+        }
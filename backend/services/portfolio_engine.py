@@ -0,0 +1,267 @@
+"""
+Motor de backtesting de cartera
+Ejecuta la estrategia sobre varios símbolos a la vez con un único balance y una única
+curva de equity, permitiendo varias posiciones abiertas simultáneamente
+"""
+import heapq
+import itertools
+import os
+import time
+import numpy as np
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .backtest_engine import CANCEL_CHECK_INTERVAL, BacktestEngine, BacktestStopped
+from .equity_curve import DEFAULT_EQUITY_POINTS, downsample_curve
+from .metrics import bar_equity, compute_metrics
+from .trade_ledger import Trade, TradeLedger
+from .signal_engine import LONG, compile_signals
+
+
+class SymbolBook:
+    """Estado de un símbolo dentro de la cartera: barras, señales compiladas y trade abierto"""
+
+    def __init__(self, symbol: str, engine: BacktestEngine):
+        self.symbol = symbol
+        self.engine = engine
+        self.bars = engine.bars
+        self.entry_direction, self.exit_mask = compile_signals(
+            engine.strategy, engine.indicator_values, engine.bars
+        )
+
+    @property
+    def open_trade(self) -> Optional[Trade]:
+        return self.engine.open_trade
+
+    @property
+    def trades(self) -> TradeLedger:
+        """Trades cerrados de este símbolo (índices de barra referidos a sus barras)"""
+        return self.engine.trades
+
+
+def bar_events(times: np.ndarray, book_index: int) -> Iterator[Tuple[int, int, int]]:
+    """Eventos (tiempo, símbolo, barra) de una serie, generados sin materializar una lista"""
+    return zip(times, itertools.repeat(book_index), itertools.count())
+
+
+class PortfolioEngine:
+    """
+    Backtest de cartera sobre varios símbolos con balance compartido
+
+    Las barras de todos los símbolos se recorren en orden temporal con una mezcla k-way
+    (heapq.merge) sobre las columnas de tiempo de cada BarSeries. Cada símbolo usa su
+    propio BacktestEngine para indicadores, señales compiladas y ejecución de stops; el
+    balance, el tamaño de posición y la equity son de la cartera.
+
+    config['symbols']: símbolos de la cartera (por defecto, config['symbol'])
+    config['maxOpenPositions']: posiciones simultáneas máximas (por defecto, una por símbolo)
+    config['maxBars'], ['maxSeconds'], ['maxTrades'] y cancel_token: como en BacktestEngine;
+        maxBars cuenta instantes de la línea de tiempo común
+    """
+
+    def __init__(self, strategy: Dict[str, Any], config: Dict[str, Any], cancel_token: Optional[Any] = None):
+        self.strategy = strategy
+        self.config = config
+        self.symbols = [s.upper() for s in config.get('symbols') or [config.get('symbol', 'EURUSD')]]
+        self.max_open_positions = config.get('maxOpenPositions') or len(self.symbols)
+        self.balance = config.get('initialBalance', 10000)
+        self.initial_balance = self.balance
+        self.commission_rate = config.get('commission', 0.02) / 100
+        self.trades = TradeLedger()
+        self.trade_symbols: List[str] = []  # Símbolo de cada trade del registro
+        self.books: List[SymbolBook] = []
+        self.trade_counter = 0
+        self.open_count = 0
+        # Equity de la cartera en cada instante de la línea de tiempo común (tras run)
+        self.equity_times = np.empty(0, dtype=np.int64)
+        self.bar_equity = np.empty(0)
+
+        # Cancelación cooperativa y límites por ejecución (los mismos que BacktestEngine)
+        self.cancel_token = cancel_token
+        self.max_bars = config.get('maxBars') or 0
+        self.max_trades = config.get('maxTrades') or 0
+        limits = [float(v) for v in (config.get('maxSeconds'), os.getenv('KUMO_BACKTEST_MAX_SECONDS')) if v and float(v) > 0]
+        self.max_seconds = min(limits) if limits else 0
+        self.stop_reason: Optional[str] = None
+        self.bars_processed = 0
+        self._started = 0.0
+        self._last_cancel_check = 0
+
+    def load(self):
+        """Carga barras, indicadores y señales de cada símbolo"""
+        for symbol in self.symbols:
+            engine = BacktestEngine(self.strategy, {**self.config, 'symbol': symbol, 'verbose': False})
+            bars = engine.generate_price_data()
+            engine.precompute_indicators(bars)
+            self.books.append(SymbolBook(symbol, engine))
+            print(f"[PORTFOLIO] {symbol}: {len(bars)} barras")
+
+    def open_positions(self) -> List[SymbolBook]:
+        return [book for book in self.books if book.open_trade is not None]
+
+    def open_position(self, book: SymbolBook, index: int):
+        engine = book.engine
+        # El tamaño de posición se calcula con el balance de la cartera
+        engine.balance = self.balance
+        engine.open_position(index, 'long' if book.entry_direction[index] == LONG else 'short')
+        self.trade_counter += 1
+        engine.open_trade.id = self.trade_counter
+        self.open_count += 1
+
+    def close_position(self, book: SymbolBook, index: int, exit_reason: str, exit_price: float,
+                       commission: bool = True):
+        trade = book.engine.open_trade
+        trade.close(book.bars.time_at(index), exit_price, exit_reason, index)
+        if commission:
+            trade.profit -= abs(trade.profit) * self.commission_rate
+        self.balance += trade.profit
+        self.trades.append(trade)
+        self.trade_symbols.append(book.symbol)
+        book.trades.append(trade)
+        book.engine.open_trade = None
+        self.open_count -= 1
+
+    def check_limits(self, processed: int):
+        """Lanza BacktestStopped si se pidió cancelar o se agotó algún límite ('processed' instantes)"""
+        if self.max_bars and processed >= self.max_bars:
+            raise BacktestStopped('max_bars', processed - 1)
+        if self.max_trades and len(self.trades) >= self.max_trades:
+            raise BacktestStopped('max_trades', processed - 1)
+        if self.max_seconds and time.monotonic() - self._started > self.max_seconds:
+            raise BacktestStopped('max_seconds', processed - 1)
+        if self.cancel_token is not None and processed - self._last_cancel_check >= CANCEL_CHECK_INTERVAL:
+            self._last_cancel_check = processed
+            if self.cancel_token.is_set():
+                raise BacktestStopped('cancelled', processed - 1)
+
+    def process_bar(self, k: int, index: int):
+        """Evalúa salidas o entradas de un símbolo en una de sus barras"""
+        book = self.books[k]
+        engine = book.engine
+        trade = engine.open_trade
+
+        if trade is not None:
+            bars = book.bars
+            sl_price, tp_price = engine.stop_levels(trade)
+            reason, price = engine.resolve_stop_exit(
+                sl_price, tp_price, float(bars.open[index]), float(bars.high[index]),
+                float(bars.low[index]), float(bars.close[index]), index
+            )
+            if reason is None and book.exit_mask[index]:
+                reason, price = 'exit_signal', float(bars.close[index])
+            if reason is not None:
+                self.close_position(book, index, reason, price)
+            return
+
+        if book.entry_direction[index] and self.open_count < self.max_open_positions:
+            self.open_position(book, index)
+
+    def run(self) -> Dict[str, Any]:
+        """Ejecuta el backtest de cartera completo (o hasta alcanzar un límite)"""
+        if not self.books:
+            self.load()
+
+        self._started = time.monotonic()
+        # Mezcla k-way de los eventos de barra de todos los símbolos por tiempo
+        last_index = [-1] * len(self.books)  # Última barra procesada de cada símbolo
+        current_time = None
+        events = heapq.merge(*(bar_events(book.bars.time, k) for k, book in enumerate(self.books)))
+        try:
+            for event_time, k, index in events:
+                if event_time != current_time:
+                    # Los límites se comprueban entre instantes: cada uno se procesa entero
+                    if self.bars_processed:
+                        self.check_limits(self.bars_processed)
+                    self.bars_processed += 1
+                    current_time = event_time
+                last_index[k] = index
+                self.process_bar(k, index)
+        except BacktestStopped as stop:
+            self.stop_reason = stop.reason
+            print(f"[PORTFOLIO] Detenido ({stop.reason}) tras {self.bars_processed} barras")
+
+        # Cerrar posiciones abiertas en la última barra procesada de su símbolo
+        exit_reason = 'Backtest Stopped' if self.stop_reason else 'Backtest End'
+        for k, book in enumerate(self.books):
+            if book.open_trade is not None:
+                index = last_index[k]
+                self.close_position(book, index, exit_reason, float(book.bars.close[index]), commission=False)
+
+        self.equity_times, self.bar_equity = self.merged_equity(last_index)
+        return self.result()
+
+    def merged_equity(self, last_index: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Equity de la cartera en cada instante de la línea de tiempo común (mark-to-market)
+
+        La equity por barra de cada símbolo (bar_equity de sus trades desde 0: realizado más
+        flotante al cierre) se lleva a los instantes comunes con su último valor conocido y se
+        suma al balance inicial, así que drawdown y ratios se miden como con un solo símbolo.
+        """
+        processed = [book.bars.time[:last_index[k] + 1] for k, book in enumerate(self.books)]
+        if not processed:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        times = np.unique(np.concatenate(processed))
+        equity = np.full(len(times), float(self.initial_balance))
+        for book, book_times in zip(self.books, processed):
+            if not len(book_times):
+                continue
+            book_equity = bar_equity(book.bars.close[:len(book_times)], book.trades, 0.0)
+            position = np.searchsorted(book_times, times, side='right') - 1
+            seen = position >= 0
+            equity[seen] += book_equity[position[seen]]
+        return times, equity
+
+    def result(self) -> Dict[str, Any]:
+        """Métricas de la cartera y desglose por símbolo"""
+        # Las métricas se calculan sobre los trades y la equity por instante de la cartera
+        summary = BacktestEngine(self.strategy, self.config)
+        summary.trades = self.trades
+        summary.balance = self.balance
+        if self.trades:
+            metrics = compute_metrics(self.trades, self.initial_balance, self.balance,
+                                      self.bar_equity, self.equity_times)
+        else:
+            metrics = summary.get_empty_metrics()
+
+        profits = self.trades.profit
+        trade_symbols = np.array(self.trade_symbols, dtype=object)
+        breakdown = []
+        for symbol in self.symbols:
+            symbol_profits = profits[trade_symbols == symbol]
+            breakdown.append({
+                'symbol': symbol,
+                'totalTrades': len(symbol_profits),
+                'winningTrades': int((symbol_profits > 0).sum()),
+                'netProfit': round(float(symbol_profits.sum()), 2),
+            })
+
+        return {
+            'success': True,
+            'strategyName': self.strategy.get('name', 'Strategy'),
+            'symbols': self.symbols,
+            'timeframe': self.config.get('timeframe', '1h'),
+            'startDate': self.config.get('startDate'),
+            'endDate': self.config.get('endDate'),
+            'metrics': metrics,
+            'symbolBreakdown': breakdown,
+            'trades': self.trades.to_dicts({'symbol': self.trade_symbols}),
+            'equityCurve': downsample_curve(
+                self.equity_times, self.bar_equity, self.initial_balance,
+                points=int(self.config.get('equityPoints', DEFAULT_EQUITY_POINTS)),
+                method=self.config.get('equityDownsample', 'minmax')
+            ),
+            'monteCarlo': summary.run_monte_carlo(),
+            'stopReason': self.stop_reason,
+            'barsProcessed': self.bars_processed,
+            'barEquity': {
+                'time': self.equity_times,
+                'equity': self.bar_equity,
+                'initialBalance': self.initial_balance,
+            },
+        }
+
+
+def run_portfolio_job(strategy: Dict[str, Any], config: Dict[str, Any],
+                      cancel_token: Optional[Any] = None) -> Dict[str, Any]:
+    """Ejecuta un backtest de cartera (se llama dentro de un proceso del pool)"""
+    return PortfolioEngine(strategy, config, cancel_token).run()
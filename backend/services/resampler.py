@@ -0,0 +1,134 @@
+"""
+Remuestreo de barras a temporalidades mayores
+Agrupa las barras de una serie fina (M1 o la menor disponible) en tramos de tiempo fijos
+con operaciones vectoriales (reduceat por tramo), para derivar H1/H4/D1 de una sola descarga
+"""
+import os
+import re
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+from .bar_archive import ArchiveRange, open_bars
+from .bar_series import BarSeries
+
+
+NS_PER_MINUTE = 60 * 10**9
+DEFAULT_MAX_MB = 128
+
+# Minutos por temporalidad (mismos códigos que acepta el proveedor de datos)
+TIMEFRAME_MINUTES = {
+    '1': 1, '5': 5, '15': 15, '30': 30,
+    '60': 60, '1h': 60, '240': 240, '4h': 240,
+    'D': 1440, '1d': 1440
+}
+
+TIMEFRAME_PATTERN = re.compile(r'^(\d+)\s*(m|min|h|d)$', re.IGNORECASE)
+UNIT_MINUTES = {'m': 1, 'min': 1, 'h': 60, 'd': 1440}
+
+
+def timeframe_minutes(timeframe: str) -> int:
+    """Minutos de una temporalidad ('4h', '15', '15m', '1d'...); ValueError si no se reconoce"""
+    if timeframe in TIMEFRAME_MINUTES:
+        return TIMEFRAME_MINUTES[timeframe]
+    match = TIMEFRAME_PATTERN.match(str(timeframe).strip())
+    if match is None:
+        raise ValueError(f"Temporalidad no soportada: {timeframe}")
+    return int(match.group(1)) * UNIT_MINUTES[match.group(2).lower()]
+
+
+def resample(bars: BarSeries, minutes: int) -> BarSeries:
+    """
+    Barras OHLCV de 'minutes' minutos a partir de una serie ordenada más fina
+
+    Los tramos se alinean a epoch (00:00 UTC), se etiquetan con su hora de inicio y solo
+    existen si contienen alguna barra (los fines de semana no generan barras vacías):
+    open = primera apertura, high/low = extremos, close = último cierre, volume = suma.
+    """
+    if len(bars) == 0:
+        return bars
+    width = minutes * NS_PER_MINUTE
+    bucket = bars.time // width
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    ends = np.append(starts[1:], len(bars)) - 1
+    return BarSeries(
+        bucket[starts] * width,
+        bars.open[starts],
+        np.maximum.reduceat(bars.high, starts),
+        np.minimum.reduceat(bars.low, starts),
+        bars.close[ends],
+        np.add.reduceat(bars.volume, starts)
+    )
+
+
+class Resampler:
+    """
+    Series remuestreadas por (símbolo, temporalidad), con desalojo LRU por bytes
+
+    Cada entrada recuerda de qué serie base salió (intervalo y huella: la versión del fichero
+    .kbar si la base es un ArchiveRange, sin leerlo): si la base cambia (nuevas descargas,
+    también dentro del rango), se vuelve a remuestrear.
+    Tamaño máximo: KUMO_RESAMPLE_CACHE_MAX_MB.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('KUMO_RESAMPLE_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[Tuple[str, int], Tuple[Tuple, BarSeries]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, symbol: str, base_interval: str, base: Union[BarSeries, ArchiveRange], minutes: int) -> BarSeries:
+        """
+        Serie base remuestreada a 'minutes' (de la caché si la base no ha cambiado)
+
+        Con un ArchiveRange la base solo se lee si hay que remuestrear.
+        """
+        key = (symbol.upper(), minutes)
+        token = (base_interval, base.fingerprint())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == token:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        self.misses += 1
+        base_bars = open_bars(base)
+        # Si el fichero cambió al leerlo, la huella es la de la versión leída
+        token = (base_interval, base.fingerprint())
+        bars = resample(base_bars, minutes)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1].nbytes
+            if bars.nbytes <= self.max_bytes:
+                self._entries[key] = (token, bars)
+                self._bytes += bars.nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+        return bars
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Instancia global (una por proceso)
+resampler = Resampler()
@@ -0,0 +1,231 @@
+"""
+Caché de resultados de backtest
+Las peticiones idénticas (misma estrategia normalizada, misma configuración y mismas
+barras) devuelven el resultado guardado sin volver a ejecutar el motor
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from .bar_archive import ArchiveRange
+from .bar_series import BarSeries
+
+
+# Cambiar al modificar el motor de forma que cambien los resultados: invalida la caché
+ENGINE_VERSION = 3
+
+DEFAULT_MAX_MB = 64
+DEFAULT_DISK_MAX_MB = 512
+
+# Campos de la estrategia que no afectan al resultado (nombre y metadatos del diseñador)
+IGNORED_STRATEGY_KEYS = ('id', 'name', 'description', 'createdAt', 'updatedAt')
+
+# Campos de la configuración que no afectan al resultado
+IGNORED_CONFIG_KEYS = ('verbose', 'progressInterval', 'maxSeconds', 'resultCache')
+
+# Resultados incompletos por motivos no reproducibles: no se guardan
+UNCACHEABLE_STOP_REASONS = ('cancelled', 'max_seconds')
+
+
+def canonical_json(value: Any) -> str:
+    """JSON con claves ordenadas y sin espacios: el mismo contenido da el mismo texto"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def result_key(strategy: Dict[str, Any], config: Dict[str, Any], bars: Union[BarSeries, ArchiveRange]) -> str:
+    """
+    Clave de contenido: estrategia normalizada + configuración + versión de datos y motor
+
+    Con un ArchiveRange la versión de los datos sale de los metadatos del fichero, sin leer
+    las barras.
+    """
+    normalized_strategy = {k: v for k, v in strategy.items() if k not in IGNORED_STRATEGY_KEYS}
+    normalized_config = {k: v for k, v in config.items() if k not in IGNORED_CONFIG_KEYS}
+    payload = canonical_json([ENGINE_VERSION, normalized_strategy, normalized_config, bars.fingerprint()])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Caché LRU de resultados por clave de contenido
+
+    Los resultados se guardan como JSON comprimido: en memoria hasta KUMO_RESULT_CACHE_MAX_MB
+    y, si se configura KUMO_RESULT_CACHE_DIR, también en disco (un fichero por clave, hasta
+    KUMO_RESULT_CACHE_DISK_MB, desalojando por fecha de último acceso como BarCache).
+    Como la clave incluye la huella de las barras, una entrada deja de usarse en cuanto
+    cambian los datos.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, cache_dir: Optional[Path] = None,
+                 disk_max_bytes: Optional[int] = None):
+        self.enabled = os.getenv('KUMO_RESULT_CACHE', '1') != '0'
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv('KUMO_RESULT_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024)
+        if disk_max_bytes is None:
+            disk_max_bytes = int(float(os.getenv('KUMO_RESULT_CACHE_DISK_MB', DEFAULT_DISK_MAX_MB)) * 1024 * 1024)
+        cache_dir = cache_dir or os.getenv('KUMO_RESULT_CACHE_DIR')
+        self.max_bytes = max_bytes
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json.z"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Resultado guardado para la clave (None si no está)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is not None:
+                self._entries.move_to_end(key)
+
+        if blob is None and self.cache_dir is not None:
+            path = self._disk_path(key)
+            try:
+                blob = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                blob = None
+            if blob is not None:
+                self._remember(key, blob)
+
+        if blob is None:
+            self.misses += 1
+            return None
+        try:
+            result = json.loads(zlib.decompress(blob))
+        except (zlib.error, ValueError) as e:
+            print(f"[RESULT_CACHE] Entrada corrupta {key[:12]}: {e}")
+            self.invalidate(key)
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Guarda un resultado (salvo los detenidos por cancelación o tiempo)"""
+        if not self.enabled or result.get('stopReason') in UNCACHEABLE_STOP_REASONS:
+            return
+        blob = zlib.compress(json.dumps(result).encode(), 1)
+        self._remember(key, blob)
+
+        if self.cache_dir is not None:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = self._disk_path(key).with_suffix('.tmp')
+                tmp_path.write_bytes(blob)
+                os.replace(tmp_path, self._disk_path(key))
+                self.evict_disk()
+            except OSError as e:
+                print(f"[RESULT_CACHE] No se pudo guardar en disco: {e}")
+
+    def _remember(self, key: str, blob: bytes):
+        """Añade a la memoria y desaloja las entradas menos usadas por encima del máximo"""
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = blob
+            self._bytes += len(blob)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def evict_disk(self):
+        """Desaloja ficheros menos usados hasta respetar el tamaño máximo en disco"""
+        entries = [(path.stat().st_mtime, path.stat().st_size, path) for path in self.cache_dir.glob('*.json.z')]
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            total -= size
+
+    def invalidate(self, key: str):
+        with self._lock:
+            blob = self._entries.pop(key, None)
+            if blob is not None:
+                self._bytes -= len(blob)
+        if self.cache_dir is not None:
+            try:
+                self._disk_path(key).unlink()
+            except OSError:
+                pass
+
+    def clear(self):
+        """Vacía la memoria y el disco"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.cache_dir is not None and self.cache_dir.exists():
+            for path in self.cache_dir.glob('*.json.z'):
+                path.unlink()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'memoryBytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'diskDir': str(self.cache_dir) if self.cache_dir else None,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Instancia global
+result_cache = ResultCache()
+
+
+async def cached_backtest(strategy: Dict[str, Any], config: Dict[str, Any], job_manager) -> Dict[str, Any]:
+    """
+    Ejecuta un backtest en el pool, o devuelve el resultado guardado de una petición idéntica
+
+    Las barras se localizan aquí para calcular la versión de los datos; al pool se envía la
+    referencia al fichero de la caché (o la serie si no está en ella), no los arrays.
+    config['resultCache'] = False fuerza la ejecución.
+    """
+    from .batch import load_run_bars
+    from .equity_curve import equity_store
+    from .job_manager import run_backtest_job
+
+    if not result_cache.enabled or config.get('resultCache') is False:
+        return equity_store.attach(await job_manager.run(run_backtest_job, strategy, config))
+
+    source = await asyncio.to_thread(load_run_bars, config)
+    if source is None:
+        # Datos simulados aleatorios: el resultado no se puede reutilizar
+        return equity_store.attach(await job_manager.run(run_backtest_job, strategy, config))
+    key = await asyncio.to_thread(result_key, strategy, config, source)
+    cached = await asyncio.to_thread(result_cache.get, key)
+    if cached is not None:
+        print(f"[RESULT_CACHE] Resultado en caché: {key[:12]}")
+        # La curva completa puede haber salido del almacén aunque el resultado siga aquí
+        equity_id = key if key in equity_store else None
+        return {**cached, 'strategyName': strategy.get('name', 'Strategy'), 'cached': True, 'equityId': equity_id}
+
+    # El id de la curva es la clave del resultado: los aciertos posteriores la reutilizan
+    result = equity_store.attach(await job_manager.run(run_backtest_job, strategy, config, None, source), key)
+    # Si el fichero cambió mientras corría, el resultado no corresponde a la clave
+    if isinstance(source, ArchiveRange) and not await asyncio.to_thread(source.is_current):
+        print(f"[RESULT_CACHE] Los datos cambiaron durante el backtest, no se guarda: {key[:12]}")
+        return result
+    await asyncio.to_thread(result_cache.put, key, result)
+    return result
@@ -0,0 +1,147 @@
+"""
+Motor de señales compilado
+Convierte las reglas de la estrategia en arrays booleanos de NumPy sobre la serie completa:
+AND entre reglas de un bloque, OR entre bloques
+"""
+import operator
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+from .bar_series import BarSeries
+from .indicators import IndicatorKey, PRICE_FIELDS, spec_key
+
+
+# Condiciones de comparación: válidas tanto para escalares como para arrays
+CONDITION_FUNCTIONS = {
+    'greater_than': operator.gt,
+    'less_than': operator.lt,
+    'equal': lambda a, b: abs(a - b) < 0.0001,
+    'greater_equal': operator.ge,
+    'less_equal': operator.le,
+}
+
+CROSS_CONDITIONS = ('crosses_above', 'crosses_below')
+
+# Dirección de entrada en el array compilado
+LONG = 1
+SHORT = -1
+
+
+def block_direction(block: Dict[str, Any]) -> Optional[str]:
+    """Tipo de entrada ('long'/'short') según las acciones del bloque"""
+    for action in block.get('actions', []):
+        action_type = action.get('type', '')
+        # Mapear acciones del Designer a tipos de entrada
+        if action_type in ['open_long', 'buy_market']:
+            return 'long'
+        elif action_type in ['open_short', 'sell_market']:
+            return 'short'
+    return None
+
+
+def crossed(condition_type: str, value, compare_to, prev_value, prev_compare_to) -> bool:
+    """Cruce entre la barra anterior y la actual (escalares)"""
+    if prev_value is None or prev_compare_to is None:
+        return False
+    if condition_type == 'crosses_above':
+        return prev_value <= prev_compare_to and value > compare_to
+    return prev_value >= prev_compare_to and value < compare_to
+
+
+class SignalCompiler:
+    """Compila las reglas de una estrategia a máscaras booleanas por barra"""
+
+    def __init__(self, indicator_values: Dict[IndicatorKey, np.ndarray], bars: BarSeries):
+        self.indicator_values = indicator_values
+        self.bars = bars
+        self.length = len(bars)
+
+    def series(self, spec: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Serie completa de un indicador configurado (None si no está soportado)"""
+        key = spec_key(spec)
+        if key is None:
+            return None
+        if key[0] in PRICE_FIELDS:
+            return self.bars.column(key[0])
+        return self.indicator_values.get(key)
+
+    def compile_rule(self, rule: Dict[str, Any]) -> np.ndarray:
+        """Máscara booleana de una regla (False donde algún valor no está disponible)"""
+        values = self.series(rule['indicator'])
+        if values is None:
+            return np.zeros(self.length, dtype=bool)
+
+        comparison_value = rule['comparisonValue']
+        if comparison_value['type'] == 'number':
+            compare_to = comparison_value['numericValue']
+        elif comparison_value['type'] == 'indicator':
+            compare_to = self.series(comparison_value['indicatorValue'])
+            if compare_to is None:
+                return np.zeros(self.length, dtype=bool)
+        else:
+            compare_to = 0  # Variables no implementadas aún
+
+        condition_type = rule['condition']
+        with np.errstate(invalid='ignore'):
+            if condition_type in CROSS_CONDITIONS:
+                compare_series = np.broadcast_to(np.asarray(compare_to, dtype=np.float64), values.shape)
+                prev_values = np.concatenate(([np.nan], values[:-1]))
+                prev_compare = np.concatenate(([np.nan], compare_series[:-1]))
+                if condition_type == 'crosses_above':
+                    return (prev_values <= prev_compare) & (values > compare_series)
+                return (prev_values >= prev_compare) & (values < compare_series)
+
+            condition_func = CONDITION_FUNCTIONS.get(condition_type)
+            if condition_func is None:
+                return np.zeros(self.length, dtype=bool)
+            return np.asarray(condition_func(values, compare_to), dtype=bool)
+
+    def compile_block(self, block: Dict[str, Any]) -> Optional[np.ndarray]:
+        """AND lógico de las reglas de un bloque (None si el bloque no aplica)"""
+        if not block.get('enabled', True):
+            return None
+        rules = block.get('rules', [])
+        if not rules:
+            return None
+
+        mask = np.ones(self.length, dtype=bool)
+        for rule in rules:
+            mask &= self.compile_rule(rule)
+        return mask
+
+    def entry_signals(self, entry_blocks) -> np.ndarray:
+        """
+        Dirección de entrada por barra: LONG, SHORT o 0
+
+        Si varios bloques se cumplen en la misma barra gana el primero,
+        igual que en la evaluación barra a barra.
+        """
+        direction = np.zeros(self.length, dtype=np.int8)
+        for block in reversed(entry_blocks):
+            side = block_direction(block)
+            if side is None:
+                continue
+            mask = self.compile_block(block)
+            if mask is None:
+                continue
+            direction[mask] = LONG if side == 'long' else SHORT
+        return direction
+
+    def exit_signals(self, exit_blocks) -> np.ndarray:
+        """OR lógico de los bloques de salida"""
+        exit_mask = np.zeros(self.length, dtype=bool)
+        for block in exit_blocks:
+            mask = self.compile_block(block)
+            if mask is not None:
+                exit_mask |= mask
+        return exit_mask
+
+
+def compile_signals(strategy: Dict[str, Any], indicator_values: Dict[IndicatorKey, np.ndarray],
+                    bars: BarSeries) -> Tuple[np.ndarray, np.ndarray]:
+    """Retorna (dirección de entrada, máscara de salida) para toda la serie"""
+    compiler = SignalCompiler(indicator_values, bars)
+    return (
+        compiler.entry_signals(strategy.get('entryBlocks', [])),
+        compiler.exit_signals(strategy.get('exitBlocks', [])),
+    )
@@ -0,0 +1,146 @@
+"""
+Streaming de backtests
+Lleva los eventos de un backtest (progreso, trades, equity) desde el proceso del pool
+hasta la API mientras corre, para mostrar resultados parciales
+"""
+import asyncio
+import queue
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .backtest_engine import BacktestStopped
+
+
+# Eventos acumulados en el proceso del pool antes de enviarlos a la API
+FLUSH_EVENTS = 256
+
+# Segundos de espera de cada lectura del canal (para comprobar si el trabajo terminó)
+POLL_SECONDS = 0.25
+
+
+class StreamClosed(BacktestStopped):
+    """El cliente dejó de leer el stream: el motor lo trata como una cancelación"""
+
+    def __init__(self):
+        # El motor la relanza con la barra del evento (BacktestEngine.emit)
+        super().__init__('cancelled', -1)
+
+
+class EventChannel:
+    """
+    Canal de eventos entre un proceso del pool y la API
+
+    Usa una cola y un evento de un multiprocessing.Manager, así que se puede pasar como
+    argumento a un trabajo del pool. En el proceso del pool se usa como callback on_event
+    del BacktestEngine: los eventos se agrupan y se envían en bloques (en cada 'progress'
+    o cada FLUSH_EVENTS eventos) para no hacer una llamada entre procesos por trade.
+    Si la API cierra el canal, el siguiente envío lanza StreamClosed y el motor se detiene
+    con stopReason 'cancelled'.
+    """
+
+    def __init__(self, manager):
+        self.queue = manager.Queue()
+        self.closed = manager.Event()
+        self._buffer: List[Dict[str, Any]] = []
+
+    def __getstate__(self):
+        return {'queue': self.queue, 'closed': self.closed}
+
+    def __setstate__(self, state):
+        self.queue = state['queue']
+        self.closed = state['closed']
+        self._buffer = []
+
+    def __call__(self, event: Dict[str, Any]):
+        self._buffer.append(event)
+        if event['type'] == 'progress' or len(self._buffer) >= FLUSH_EVENTS:
+            self.flush()
+
+    def flush(self):
+        """Envía los eventos acumulados (lado del pool)"""
+        if self.closed.is_set():
+            raise StreamClosed()
+        if self._buffer:
+            self.queue.put(self._buffer)
+            self._buffer = []
+
+    def get(self, timeout: float) -> List[Dict[str, Any]]:
+        """Siguiente bloque de eventos, o lista vacía si no llega ninguno (lado de la API)"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Eventos que quedan en la cola sin esperar (lado de la API)"""
+        events = []
+        while True:
+            try:
+                events.extend(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.closed.set()
+
+
+def run_streaming_backtest_job(strategy: Dict[str, Any], config: Dict[str, Any],
+                               channel: EventChannel, cancel_token: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    Ejecuta un backtest enviando sus eventos por el canal (se llama dentro de un proceso del pool)
+
+    El resultado es el de run_backtest_job, para que el trabajo se consulte como cualquier
+    otro en /api/v1/backtest/jobs/{jobId}/result.
+    """
+    from .backtest_engine import BacktestEngine
+
+    engine = BacktestEngine(strategy, config, on_event=channel, cancel_token=cancel_token)
+    result = engine.run()
+    try:
+        channel.flush()
+    except StreamClosed:
+        pass
+    result['barEquity'] = engine.bar_equity_series()
+    return result
+
+
+async def stream_backtest(strategy: Dict[str, Any], config: Dict[str, Any],
+                          job_manager) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Ejecuta un backtest en el pool y emite sus eventos según llegan
+
+    El backtest se registra como un trabajo del job_manager: 'start' lleva su jobId, con
+    el que se consulta o se cancela como los de /api/v1/backtest/jobs.
+    Eventos: 'start', 'progress', 'trade', 'equity' y, al terminar, 'complete' (métricas,
+    Monte Carlo; trades y curva ya se enviaron) o 'error'. Si el consumidor deja de iterar
+    (cliente desconectado), el trabajo se cancela y se detiene en su siguiente evento.
+    """
+    channel = job_manager.channel()
+    job = job_manager.submit_streaming_backtest(strategy, config, channel)
+    try:
+        while not job.done:
+            for event in await asyncio.to_thread(channel.get, POLL_SECONDS):
+                yield _with_job_id(event, job.id)
+        for event in channel.drain():
+            yield _with_job_id(event, job.id)
+
+        if job.future.cancelled():
+            yield {'type': 'error', 'jobId': job.id, 'error': 'Trabajo cancelado antes de empezar'}
+            return
+        if job.error is not None:
+            print(f"[STREAM] Error en backtest: {job.error}")
+            yield {'type': 'error', 'jobId': job.id, 'error': job.error}
+            return
+        # job.result guarda la equity por barra en equity_store (equityId = jobId)
+        complete = {key: value for key, value in job.result.items() if key not in ('trades', 'equityCurve')}
+        yield {'type': 'complete', 'jobId': job.id, **complete}
+    finally:
+        channel.close()
+        if not job.done:
+            job_manager.cancel(job.id)
+
+
+def _with_job_id(event: Dict[str, Any], job_id: str) -> Dict[str, Any]:
+    """El evento 'start' lleva el id del trabajo"""
+    if event['type'] == 'start':
+        return {**event, 'jobId': job_id}
+    return event
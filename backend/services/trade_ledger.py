@@ -0,0 +1,243 @@
+"""
+Registro de trades
+Trade es la operación abierta (un objeto por posición); al cerrarse se copia a un
+TradeLedger, que guarda los trades cerrados en columnas de un array estructurado de NumPy
+para calcular métricas con operaciones vectoriales y convertirlos a diccionarios solo
+al responder a la API
+"""
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from .bar_series import datetime_to_ns, ns_to_datetime
+
+
+TRADE_DTYPE = np.dtype([
+    ('id', 'i8'),
+    ('direction', 'i1'),  # 1 = long, -1 = short
+    ('entry_time', 'i8'),  # ns desde epoch
+    ('exit_time', 'i8'),
+    ('entry_index', 'i8'),  # Barra de entrada / salida (-1 si no se conoce)
+    ('exit_index', 'i8'),
+    ('entry_price', 'f8'),
+    ('exit_price', 'f8'),
+    ('size', 'f8'),
+    ('profit', 'f8'),
+    ('profit_percent', 'f8'),
+    ('pips', 'f8'),
+    ('duration', 'i8'),  # Segundos
+    ('entry_reason', 'i2'),  # Índice en TradeLedger.reasons
+    ('exit_reason', 'i2'),
+])
+
+INITIAL_CAPACITY = 64
+
+
+class Trade:
+    """Representa una operación de trading"""
+    __slots__ = ('id', 'type', 'entry_time', 'entry_price', 'size', 'exit_time', 'exit_price',
+                 'profit', 'profit_percent', 'pips', 'duration', 'entry_reason', 'exit_reason',
+                 'entry_index', 'exit_index')
+
+    def __init__(self, trade_id: int, trade_type: str, entry_time: datetime,
+                 entry_price: float, size: float, entry_index: int = -1):
+        self.id = trade_id
+        self.type = trade_type  # 'long' or 'short'
+        self.entry_time = entry_time
+        self.entry_price = entry_price
+        self.size = size
+        self.exit_time = None
+        self.exit_price = None
+        self.profit = 0
+        self.profit_percent = 0
+        self.pips = 0
+        self.duration = 0
+        self.entry_reason = ""
+        self.exit_reason = ""
+        self.entry_index = entry_index
+        self.exit_index = -1
+
+    def close(self, exit_time: datetime, exit_price: float, exit_reason: str, exit_index: int = -1):
+        """Cierra la operación"""
+        self.exit_time = exit_time
+        self.exit_price = exit_price
+        self.exit_reason = exit_reason
+        self.exit_index = exit_index
+
+        # Calcular duración
+        self.duration = int((exit_time - self.entry_time).total_seconds())
+
+        # Calcular profit
+        if self.type == 'long':
+            self.pips = (exit_price - self.entry_price) * 10000
+            self.profit = (exit_price - self.entry_price) * self.size * 100000  # 1 lote = 100,000 unidades
+        else:
+            self.pips = (self.entry_price - exit_price) * 10000
+            self.profit = (self.entry_price - exit_price) * self.size * 100000
+
+        self.profit_percent = (self.profit / (self.entry_price * self.size * 100000)) * 100
+
+    def to_dict(self) -> Dict:
+        """Convierte el trade a diccionario"""
+        return {
+            'id': self.id,
+            'entryTime': self.entry_time.isoformat(),
+            'exitTime': self.exit_time.isoformat() if self.exit_time else None,
+            'type': self.type,
+            'entryPrice': round(self.entry_price, 5),
+            'exitPrice': round(self.exit_price, 5) if self.exit_price else None,
+            'size': self.size,
+            'profit': round(self.profit, 2),
+            'profitPercent': round(self.profit_percent, 2),
+            'pips': round(self.pips, 1),
+            'duration': self.duration,
+            'entryReason': self.entry_reason,
+            'exitReason': self.exit_reason
+        }
+
+
+class TradeLedger:
+    """
+    Trades cerrados en columnas (array estructurado con TRADE_DTYPE)
+
+    El array se reserva por bloques y crece duplicando su capacidad. Los motivos de
+    entrada/salida se guardan como índices en la lista 'reasons' (pocos valores distintos).
+    Las columnas se leen como arrays: ledger.profit, ledger.duration, ledger.column('pips')...
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self._rows = np.zeros(max(1, capacity), dtype=TRADE_DTYPE)
+        self._count = 0
+        self.reasons: List[str] = []
+        self._reason_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def __getstate__(self):
+        # Solo las filas usadas viajan al serializar (procesos del pool)
+        return {'rows': self.rows, 'reasons': self.reasons}
+
+    def __setstate__(self, state):
+        self._rows = state['rows'].copy() if len(state['rows']) else np.zeros(1, dtype=TRADE_DTYPE)
+        self._count = len(state['rows'])
+        self.reasons = state['reasons']
+        self._reason_codes = {reason: code for code, reason in enumerate(self.reasons)}
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Vista de las filas usadas"""
+        return self._rows[:self._count]
+
+    def column(self, name: str) -> np.ndarray:
+        return self._rows[name][:self._count]
+
+    @property
+    def profit(self) -> np.ndarray:
+        return self.column('profit')
+
+    @property
+    def duration(self) -> np.ndarray:
+        return self.column('duration')
+
+    def _reason_code(self, reason: str) -> int:
+        code = self._reason_codes.get(reason)
+        if code is None:
+            code = self._reason_codes[reason] = len(self.reasons)
+            self.reasons.append(reason)
+        return code
+
+    def append(self, trade: Trade):
+        """Copia un trade cerrado a la siguiente fila"""
+        if self._count == len(self._rows):
+            grown = np.zeros(len(self._rows) * 2, dtype=TRADE_DTYPE)
+            grown[:self._count] = self._rows
+            self._rows = grown
+        self._rows[self._count] = (
+            trade.id, 1 if trade.type == 'long' else -1,
+            datetime_to_ns(trade.entry_time), datetime_to_ns(trade.exit_time),
+            trade.entry_index, trade.exit_index,
+            trade.entry_price, trade.exit_price, trade.size,
+            trade.profit, trade.profit_percent, trade.pips, trade.duration,
+            self._reason_code(trade.entry_reason), self._reason_code(trade.exit_reason),
+        )
+        self._count += 1
+
+    def __getitem__(self, index: int) -> Trade:
+        """Trade de una fila (para inspección; las métricas usan las columnas)"""
+        row = self.rows[index]
+        trade = Trade(int(row['id']), 'long' if row['direction'] > 0 else 'short',
+                      ns_to_datetime(row['entry_time']), float(row['entry_price']), float(row['size']),
+                      int(row['entry_index']))
+        trade.exit_time = ns_to_datetime(row['exit_time'])
+        trade.exit_index = int(row['exit_index'])
+        trade.exit_price = float(row['exit_price'])
+        trade.profit = float(row['profit'])
+        trade.profit_percent = float(row['profit_percent'])
+        trade.pips = float(row['pips'])
+        trade.duration = int(row['duration'])
+        trade.entry_reason = self.reasons[row['entry_reason']]
+        trade.exit_reason = self.reasons[row['exit_reason']]
+        return trade
+
+    def __iter__(self) -> Iterator[Trade]:
+        return (self[i] for i in range(self._count))
+
+    def renumber(self, start: int = 1):
+        """Vuelve a numerar los ids en orden de fila"""
+        self._rows['id'][:self._count] = np.arange(start, start + self._count)
+
+    @classmethod
+    def concatenate(cls, ledgers: Sequence['TradeLedger']) -> 'TradeLedger':
+        """Une varios registros en orden (los motivos se reindexan)"""
+        result = cls(sum(len(ledger) for ledger in ledgers))
+        parts = []
+        for ledger in ledgers:
+            rows = ledger.rows.copy()
+            if len(rows):
+                codes = np.array([result._reason_code(reason) for reason in ledger.reasons], dtype='i2')
+                rows['entry_reason'] = codes[rows['entry_reason']]
+                rows['exit_reason'] = codes[rows['exit_reason']]
+            parts.append(rows)
+        if parts:
+            rows = np.concatenate(parts)
+            result._rows[:len(rows)] = rows
+            result._count = len(rows)
+        return result
+
+    def to_dicts(self, extra: Optional[Dict[str, Sequence]] = None) -> List[Dict]:
+        """
+        Trades como diccionarios para la API (mismo formato que Trade.to_dict)
+
+        'extra': columnas adicionales por trade (ej. {'symbol': [...]}) que se añaden a cada uno
+        """
+        rows = self.rows
+        entry_times = [ns_to_datetime(t).isoformat() for t in rows['entry_time'].tolist()]
+        exit_times = [ns_to_datetime(t).isoformat() for t in rows['exit_time'].tolist()]
+        trades = []
+        for i, row in enumerate(rows.tolist()):
+            (trade_id, direction, _, _, _, _, entry_price, exit_price, size,
+             profit, profit_percent, pips, duration, entry_reason, exit_reason) = row
+            trades.append({
+                'id': trade_id,
+                'entryTime': entry_times[i],
+                'exitTime': exit_times[i],
+                'type': 'long' if direction > 0 else 'short',
+                'entryPrice': round(entry_price, 5),
+                'exitPrice': round(exit_price, 5) if exit_price else None,
+                'size': size,
+                'profit': round(profit, 2),
+                'profitPercent': round(profit_percent, 2),
+                'pips': round(pips, 1),
+                'duration': duration,
+                'entryReason': self.reasons[entry_reason],
+                'exitReason': self.reasons[exit_reason]
+            })
+        if extra:
+            for name, values in extra.items():
+                for trade, value in zip(trades, values):
+                    trade[name] = value
+        return trades
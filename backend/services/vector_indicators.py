@@ -0,0 +1,673 @@
+"""
+Cálculo vectorizado de indicadores con NumPy
+Precalcula la serie completa de cada indicador antes del bucle de barras,
+de modo que el motor solo tiene que indexar arrays
+"""
+import numpy as np
+from typing import Dict, Any, List, Optional
+
+from .bar_series import BarSeries
+from .indicators import COMPONENTS, IndicatorKey, MTF, PRICE_FIELDS, SHIFT, spec_key
+from .jit import kernel_input, parabolic_sar_loop
+from .resampler import NS_PER_MINUTE, resample
+
+
+# Ventanas por bloque en los cálculos por ventanas que se hacen por bloques
+WINDOW_BLOCK = 4096
+
+
+def _nan_array(length: int) -> np.ndarray:
+    return np.full(length, np.nan)
+
+
+def shift_forward(values: np.ndarray, bars: int) -> np.ndarray:
+    """Serie desplazada 'bars' barras hacia delante: cada barra ve el valor de hace 'bars' barras"""
+    if bars <= 0:
+        return values
+    out = _nan_array(len(values))
+    out[bars:] = values[:-bars]
+    return out
+
+
+def forward_fill_valid(values: np.ndarray) -> np.ndarray:
+    """Repite el último valor no NaN en las barras NaN siguientes"""
+    index = np.where(np.isnan(values), -1, np.arange(len(values)))
+    index = np.maximum.accumulate(index) if len(index) else index
+    return np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+
+
+def _after_warmup(values: np.ndarray, func, *args) -> np.ndarray:
+    """Aplica 'func' a la parte de 'values' a partir de su primer valor no NaN"""
+    out = _nan_array(len(values))
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid):
+        out[valid[0]:] = func(values[valid[0]:], *args)
+    return out
+
+
+def _window_sums(values: np.ndarray, period: int) -> np.ndarray:
+    """Suma de cada ventana completa de 'period' valores (len - period + 1 sumas)"""
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    return csum[period:] - csum[:-period]
+
+
+def _window_blocks(length: int, period: int):
+    """Tramos [inicio, fin) de barras con ventana completa, en bloques de WINDOW_BLOCK"""
+    for start in range(period - 1, length, WINDOW_BLOCK):
+        yield start, min(length, start + WINDOW_BLOCK)
+
+
+def linear_recurrence(inputs: np.ndarray, decay: float, initial: float) -> np.ndarray:
+    """
+    Resuelve y[t] = decay * y[t-1] + inputs[t] con y[-1] = initial, sin bucle por barra
+
+    Usa la forma cerrada y[t] = decay^t * (y0 + cumsum(inputs / decay^j)) por bloques,
+    para que las potencias de 'decay' no desborden en series largas.
+    """
+    n = len(inputs)
+    out = np.empty(n)
+    if n == 0:
+        return out
+    if decay <= 0:
+        out[:] = inputs
+        return out
+
+    # Tamaño de bloque tal que decay^-block no supere ~1e150
+    block = n if decay >= 1 else max(1, min(n, int(150 / -np.log10(decay))))
+    powers = decay ** np.arange(1, block + 1)
+    prev = initial
+    for start in range(0, n, block):
+        chunk = inputs[start:start + block]
+        p = powers[:len(chunk)]
+        out[start:start + len(chunk)] = p * (prev + np.cumsum(chunk / p))
+        prev = out[start + len(chunk) - 1]
+    return out
+
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    """Simple Moving Average mediante suma acumulada"""
+    n = len(values)
+    out = _nan_array(n)
+    if period <= 0 or n < period:
+        return out
+    # Los NaN iniciales (calentamiento de otra serie) se saltan: la suma empieza en el
+    # primer valor finito, que además se resta para reducir el error de redondeo
+    start = int(np.argmax(np.isfinite(values)))
+    if not np.isfinite(values[start]) or n - start < period:
+        return out
+    offset = values[start]
+    csum = np.cumsum(values[start:] - offset)
+    window_sums = csum[period - 1:].copy()
+    window_sums[1:] -= csum[:-period]
+    out[start + period - 1:] = window_sums / period + offset
+    return out
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """Exponential Moving Average (semilla = SMA de los primeros 'period' valores)"""
+    n = len(values)
+    out = _nan_array(n)
+    if period <= 0 or n < period:
+        return out
+    multiplier = 2 / (period + 1)
+    seed = values[:period].mean()
+    out[period - 1] = seed
+    out[period:] = linear_recurrence(values[period:] * multiplier, 1 - multiplier, seed)
+    return out
+
+
+def _wilder(values: np.ndarray, period: int) -> np.ndarray:
+    """Suavizado de Wilder (semilla = media simple de los primeros 'period' valores)"""
+    n = len(values)
+    out = _nan_array(n)
+    if period <= 0 or n < period:
+        return out
+    seed = values[:period].mean()
+    out[period - 1] = seed
+    out[period:] = linear_recurrence(values[period:] / period, (period - 1) / period, seed)
+    return out
+
+
+def rsi(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """Relative Strength Index con suavizado de Wilder"""
+    n = len(values)
+    out = _nan_array(n)
+    if n < period + 1:
+        return out
+    changes = np.diff(values)
+    avg_gain = _wilder(np.where(changes > 0, changes, 0.0), period)
+    avg_loss = _wilder(np.where(changes < 0, -changes, 0.0), period)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = 100 - 100 / (1 + avg_gain / avg_loss)
+    result = np.where(avg_loss == 0, 100.0, result)
+    result[np.isnan(avg_gain)] = np.nan
+    out[1:] = result
+    return out
+
+
+def macd(values: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9):
+    """MACD: retorna (línea MACD, línea de señal, histograma)"""
+    macd_line = ema(values, fast) - ema(values, slow)
+    signal_line = _after_warmup(macd_line, ema, signal)
+    return macd_line, signal_line, macd_line - signal_line
+
+
+def stochastic(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+               period: int = 14, smooth_k: int = 3, smooth_d: int = 3):
+    """Stochastic Oscillator: retorna (%K, %D)"""
+    n = len(closes)
+    k = _nan_array(n)
+    d = _nan_array(n)
+    if n < period:
+        return k, d
+
+    window_high = rolling_max(highs, period)[period - 1:]
+    window_low = rolling_min(lows, period)[period - 1:]
+    window_range = window_high - window_low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw_k = (closes[period - 1:] - window_low) / window_range * 100
+    raw_k = np.where(window_range == 0, 50.0, raw_k)  # Evitar división por cero
+
+    k[period - 1:] = sma(raw_k, smooth_k)
+    return k, _after_warmup(k, sma, smooth_d)
+
+
+def rolling_max(values: np.ndarray, period: int) -> np.ndarray:
+    """Máximo de cada ventana de 'period' barras"""
+    return _rolling_extreme(values, period, np.maximum)
+
+
+def rolling_min(values: np.ndarray, period: int) -> np.ndarray:
+    """Mínimo de cada ventana de 'period' barras"""
+    return _rolling_extreme(values, period, np.minimum)
+
+
+def _rolling_extreme(values: np.ndarray, period: int, reduce) -> np.ndarray:
+    """
+    Extremo por ventanas en O(N) (algoritmo de van Herk/Gil-Werman)
+
+    Se parte la serie en bloques de 'period' barras y se acumula el extremo de cada bloque
+    hacia delante y hacia atrás: cada ventana cubre el final de un bloque y el principio
+    del siguiente, así que su extremo sale de un valor de cada acumulado.
+    """
+    n = len(values)
+    out = _nan_array(n)
+    if period <= 0 or n < period:
+        return out
+    blocks = -(-n // period)
+    padded = np.concatenate((values, np.full(blocks * period - n, values[-1])))
+    shaped = padded.reshape(blocks, period)
+    prefix = reduce.accumulate(shaped, axis=1).ravel()
+    suffix = reduce.accumulate(shaped[:, ::-1], axis=1)[:, ::-1].ravel()
+    out[period - 1:] = reduce(suffix[:n - period + 1], prefix[period - 1:n])
+    return out
+
+
+def lwma(values: np.ndarray, period: int) -> np.ndarray:
+    """
+    Linear Weighted Moving Average (pesos 1..period, el mayor en la barra actual)
+
+    Por bloques: con sumas acumuladas de x y de i*x relativas al bloque, el numerador de
+    cada ventana es sum(i*x) - (i0 - 1) * sum(x), sin perder precisión en series largas.
+    """
+    n = len(values)
+    out = _nan_array(n)
+    if period <= 0 or n < period:
+        return out
+    weights_total = period * (period + 1) / 2
+    for start, end in _window_blocks(n, period):
+        chunk = values[start - period + 1:end]
+        offset = chunk[0]
+        centered = chunk - offset
+        sums = _window_sums(centered, period)
+        weighted_sums = _window_sums(centered * np.arange(len(chunk)), period)
+        first_index = np.arange(end - start)  # Índice (en el bloque) de la primera barra de cada ventana
+        out[start:end] = (weighted_sums - (first_index - 1) * sums) / weights_total + offset
+    return out
+
+
+def moving_average(values: np.ndarray, period: int, method: str = 'SMA') -> np.ndarray:
+    """Media móvil según ma_method: SMA, EMA, SMMA (suavizado de Wilder) o LWMA"""
+    if method == 'EMA':
+        return ema(values, period)
+    if method == 'SMMA':
+        return _wilder(values, period)
+    if method == 'LWMA':
+        return lwma(values, period)
+    return sma(values, period)
+
+
+def rolling_deviation(values: np.ndarray, period: int, center: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Desviación típica (poblacional) de cada ventana respecto a 'center' (por defecto, su media)
+
+    Por bloques centrados en la media del bloque, para que sum(x²) - sum(x)² no pierda
+    precisión cuando el precio está lejos de cero.
+    """
+    n = len(values)
+    out = _nan_array(n)
+    if period <= 0 or n < period:
+        return out
+    for start, end in _window_blocks(n, period):
+        chunk = values[start - period + 1:end]
+        offset = chunk.mean()
+        centered = chunk - offset
+        mean = _window_sums(centered, period) / period
+        mean_squares = _window_sums(centered * centered, period) / period
+        reference = mean if center is None else center[start:end] - offset
+        variance = mean_squares - 2 * reference * mean + reference * reference
+        out[start:end] = np.sqrt(np.maximum(variance, 0.0))
+    return out
+
+
+def mean_deviation(values: np.ndarray, period: int, center: np.ndarray) -> np.ndarray:
+    """
+    Desviación media absoluta de cada ventana respecto a 'center' (CCI)
+
+    El valor absoluto impide usar sumas acumuladas: es O(N * period), por bloques para
+    no materializar todas las ventanas a la vez.
+    """
+    n = len(values)
+    out = _nan_array(n)
+    if period <= 0 or n < period:
+        return out
+    for start, end in _window_blocks(n, period):
+        windows = np.lib.stride_tricks.sliding_window_view(values[start - period + 1:end], period)
+        out[start:end] = np.abs(windows - center[start:end, None]).mean(axis=1)
+    return out
+
+
+def applied_price(bars: BarSeries, price: str) -> np.ndarray:
+    """Serie de precio de entrada de un indicador (parámetro applied_price)"""
+    if price == 'median':
+        return (bars.high + bars.low) / 2
+    if price == 'typical':
+        return (bars.high + bars.low + bars.close) / 3
+    if price == 'weighted':
+        return (bars.high + bars.low + 2 * bars.close) / 4
+    return bars.column(price)
+
+
+def true_range(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray) -> np.ndarray:
+    """Rango verdadero: máximo de high-low y de la distancia de high/low al cierre anterior"""
+    tr = highs - lows
+    if len(tr) > 1:
+        prev_close = closes[:-1]
+        tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(highs[1:] - prev_close), np.abs(lows[1:] - prev_close)))
+    return tr
+
+
+def atr(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, period: int = 14) -> np.ndarray:
+    """Average True Range con suavizado de Wilder"""
+    return _wilder(true_range(highs, lows, closes), period)
+
+
+def adx(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, period: int = 14):
+    """Average Directional Index de Wilder: retorna (ADX, +DI, -DI)"""
+    n = len(closes)
+    adx_line, plus_di, minus_di = _nan_array(n), _nan_array(n), _nan_array(n)
+    if n < period + 1:
+        return adx_line, plus_di, minus_di
+    up = np.diff(highs)
+    down = -np.diff(lows)
+    plus_dm = np.where((up > down) & (up > 0), up, 0.0)
+    minus_dm = np.where((down > up) & (down > 0), down, 0.0)
+    smoothed_tr = _wilder(true_range(highs, lows, closes)[1:], period)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus = np.where(smoothed_tr > 0, 100 * _wilder(plus_dm, period) / smoothed_tr, 0.0)
+        minus = np.where(smoothed_tr > 0, 100 * _wilder(minus_dm, period) / smoothed_tr, 0.0)
+        dx = np.where(plus + minus > 0, 100 * np.abs(plus - minus) / (plus + minus), 0.0)
+    plus[np.isnan(smoothed_tr)] = np.nan
+    minus[np.isnan(smoothed_tr)] = np.nan
+    dx[np.isnan(smoothed_tr)] = np.nan
+
+    plus_di[1:] = plus
+    minus_di[1:] = minus
+    adx_line[1:] = _after_warmup(dx, _wilder, period)
+    return adx_line, plus_di, minus_di
+
+
+def bollinger(values: np.ndarray, period: int = 20, deviation: float = 2.0):
+    """Bandas de Bollinger: retorna (media, banda superior, banda inferior)"""
+    middle = sma(values, period)
+    width = deviation * rolling_deviation(values, period)
+    return middle, middle + width, middle - width
+
+
+def envelopes(values: np.ndarray, period: int = 14, method: str = 'SMA', deviation: float = 0.1):
+    """Envelopes: media móvil ± 'deviation' %; retorna (media, superior, inferior)"""
+    middle = moving_average(values, period, method)
+    return middle, middle * (1 + deviation / 100), middle * (1 - deviation / 100)
+
+
+def stddev(values: np.ndarray, period: int = 20, method: str = 'SMA') -> np.ndarray:
+    """Desviación típica del precio respecto a su media móvil"""
+    return rolling_deviation(values, period, moving_average(values, period, method))
+
+
+def cci(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """Commodity Channel Index: (precio - SMA) / (0.015 * desviación media)"""
+    average = sma(values, period)
+    deviation = mean_deviation(values, period, average)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (values - average) / (0.015 * deviation)
+    return np.where(deviation == 0, 0.0, result)
+
+
+def momentum(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """Momentum: precio actual en % del de hace 'period' barras"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * values / shift_forward(values, period)
+
+
+def williams_r(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray, period: int = 14) -> np.ndarray:
+    """Williams' Percent Range (de -100 a 0)"""
+    highest = rolling_max(highs, period)
+    lowest = rolling_min(lows, period)
+    window_range = highest - lowest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = -100 * (highest - closes) / window_range
+    return np.where(window_range == 0, -50.0, result)
+
+
+def demarker(highs: np.ndarray, lows: np.ndarray, period: int = 14) -> np.ndarray:
+    """DeMarker: media de subidas de máximos frente a subidas + bajadas de mínimos (0 a 1)"""
+    out = _nan_array(len(highs))
+    if len(highs) < 2:
+        return out
+    de_max = sma(np.maximum(np.diff(highs), 0.0), period)
+    de_min = sma(np.maximum(-np.diff(lows), 0.0), period)
+    total = de_max + de_min
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[1:] = np.where(total == 0, 0.5, de_max / total)
+    out[1:][np.isnan(total)] = np.nan
+    return out
+
+
+def rvi(bars: BarSeries, period: int = 10):
+    """Relative Vigor Index: retorna (línea principal, señal)"""
+    def symmetric_weighted(values):
+        # Media ponderada 1-2-2-1 de las últimas cuatro barras
+        out = _nan_array(len(values))
+        out[3:] = (values[3:] + 2 * values[2:-1] + 2 * values[1:-2] + values[:-3]) / 6
+        return out
+
+    if len(bars) < 4:
+        return _nan_array(len(bars)), _nan_array(len(bars))
+    numerator = sma(symmetric_weighted(bars.close - bars.open)[3:], period)
+    denominator = sma(symmetric_weighted(bars.high - bars.low)[3:], period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(denominator == 0, 0.0, numerator / denominator)
+    ratio[np.isnan(denominator)] = np.nan
+    main = np.concatenate((_nan_array(3), ratio))
+    return main, symmetric_weighted(main)
+
+
+def money_flow_index(bars: BarSeries, period: int = 14) -> np.ndarray:
+    """Money Flow Index: RSI del precio típico ponderado por volumen"""
+    out = _nan_array(len(bars))
+    if len(bars) < period + 1:
+        return out
+    typical = applied_price(bars, 'typical')
+    flow = (typical * bars.volume)[1:]
+    change = np.diff(typical)
+    positive = _window_sums(np.where(change > 0, flow, 0.0), period)
+    negative = _window_sums(np.where(change < 0, flow, 0.0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[period:] = np.where(negative == 0, 100.0, 100 - 100 / (1 + positive / negative))
+    return out
+
+
+def on_balance_volume(values: np.ndarray, volumes: np.ndarray) -> np.ndarray:
+    """On Balance Volume: volumen acumulado con el signo del cambio de precio"""
+    out = np.zeros(len(values))
+    out[1:] = np.cumsum(np.sign(np.diff(values)) * volumes[1:])
+    return out
+
+
+def accumulation_distribution(bars: BarSeries) -> np.ndarray:
+    """Accumulation/Distribution: volumen acumulado ponderado por la posición del cierre en el rango"""
+    bar_range = bars.high - bars.low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        location = ((bars.close - bars.low) - (bars.high - bars.close)) / bar_range
+    return np.cumsum(np.where(bar_range == 0, 0.0, location) * bars.volume)
+
+
+def chaikin(bars: BarSeries, fast: int = 3, slow: int = 10) -> np.ndarray:
+    """Chaikin Oscillator: diferencia de EMAs de Accumulation/Distribution"""
+    line = accumulation_distribution(bars)
+    return ema(line, fast) - ema(line, slow)
+
+
+def force_index(values: np.ndarray, volumes: np.ndarray, period: int = 13, method: str = 'SMA') -> np.ndarray:
+    """Force Index: media móvil de cambio de precio por volumen"""
+    out = _nan_array(len(values))
+    if len(values) > 1:
+        out[1:] = moving_average(np.diff(values) * volumes[1:], period, method)
+    return out
+
+
+def awesome_oscillator(bars: BarSeries) -> np.ndarray:
+    """Awesome Oscillator: SMA(5) - SMA(34) del precio medio"""
+    median = applied_price(bars, 'median')
+    return sma(median, 5) - sma(median, 34)
+
+
+def accelerator_oscillator(bars: BarSeries) -> np.ndarray:
+    """Accelerator Oscillator: AO menos su SMA(5)"""
+    ao = awesome_oscillator(bars)
+    return ao - _after_warmup(ao, sma, 5)
+
+
+def alligator(values: np.ndarray, jaw_period: int = 13, jaw_shift: int = 8, teeth_period: int = 8,
+              teeth_shift: int = 5, lips_period: int = 5, lips_shift: int = 3, method: str = 'SMMA'):
+    """Alligator de Bill Williams: retorna (mandíbula, dientes, labios), cada una desplazada"""
+    return (
+        shift_forward(moving_average(values, jaw_period, method), jaw_shift),
+        shift_forward(moving_average(values, teeth_period, method), teeth_shift),
+        shift_forward(moving_average(values, lips_period, method), lips_shift),
+    )
+
+
+def gator(values: np.ndarray, *args):
+    """Gator Oscillator: retorna (|mandíbula - dientes|, -|dientes - labios|) del Alligator"""
+    jaw, teeth, lips = alligator(values, *args)
+    return np.abs(jaw - teeth), -np.abs(teeth - lips)
+
+
+def fractals(highs: np.ndarray, lows: np.ndarray):
+    """
+    Fractales de Bill Williams: retorna (último fractal superior, último fractal inferior)
+
+    Un fractal superior es un máximo mayor que los dos anteriores y los dos siguientes;
+    solo se conoce dos barras después, así que su nivel aparece en esa barra y se mantiene
+    hasta el siguiente fractal (NaN antes del primero).
+    """
+    n = len(highs)
+    upper, lower = _nan_array(n), _nan_array(n)
+    if n < 5:
+        return upper, lower
+    center = slice(2, n - 2)
+    is_upper = ((highs[center] > highs[:n - 4]) & (highs[center] > highs[1:n - 3])
+                & (highs[center] > highs[3:n - 1]) & (highs[center] > highs[4:]))
+    is_lower = ((lows[center] < lows[:n - 4]) & (lows[center] < lows[1:n - 3])
+                & (lows[center] < lows[3:n - 1]) & (lows[center] < lows[4:]))
+    upper[4:] = np.where(is_upper, highs[center], np.nan)
+    lower[4:] = np.where(is_lower, lows[center], np.nan)
+    return forward_fill_valid(upper), forward_fill_valid(lower)
+
+
+def market_facilitation_index(bars: BarSeries) -> np.ndarray:
+    """Market Facilitation Index de Bill Williams: rango de la barra por unidad de volumen"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(bars.volume > 0, (bars.high - bars.low) / bars.volume, np.nan)
+
+
+def parabolic_sar(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                  step: float = 0.02, maximum: float = 0.2) -> np.ndarray:
+    """
+    Parabolic SAR de Wilder
+
+    Depende de la tendencia y el punto extremo de la barra anterior, así que es un bucle
+    secuencial (services/jit.py, compilado si numba está instalado); la tendencia inicial
+    la da el cierre de la segunda barra.
+    """
+    n = len(closes)
+    out = _nan_array(n)
+    if n < 2:
+        return out
+    out[:] = parabolic_sar_loop(kernel_input(highs), kernel_input(lows), bool(closes[1] >= closes[0]),
+                                step, maximum, kernel_input(out))
+    return out
+
+
+def ichimoku(highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+             tenkan_period: int = 9, kijun_period: int = 26, senkou_period: int = 52):
+    """
+    Ichimoku Kinko Hyo: retorna (tenkan, kijun, senkou A, senkou B, chikou)
+
+    Las senkou se proyectan 'kijun_period' barras hacia delante (cada barra ve la nube
+    dibujada sobre ella). La chikou se dibuja hacia atrás: su último punto es el cierre
+    actual, que es lo que se retorna (sin mirar al futuro).
+    """
+    def midpoint(period):
+        return (rolling_max(highs, period) + rolling_min(lows, period)) / 2
+
+    tenkan = midpoint(tenkan_period)
+    kijun = midpoint(kijun_period)
+    senkou_a = shift_forward((tenkan + kijun) / 2, kijun_period)
+    senkou_b = shift_forward(midpoint(senkou_period), kijun_period)
+    return tenkan, kijun, senkou_a, senkou_b, closes
+
+
+def bar_width(times: np.ndarray) -> int:
+    """Duración de una barra en ns (menor separación entre barras consecutivas)"""
+    gaps = np.diff(times)
+    gaps = gaps[gaps > 0]
+    return int(gaps.min()) if len(gaps) else 0
+
+
+def forward_fill(values: np.ndarray, times: np.ndarray, base_times: np.ndarray,
+                 width: int, base_width: int) -> np.ndarray:
+    """
+    Lleva una serie de temporalidad mayor a la línea de tiempo base sin mirar al futuro
+
+    Cada barra base ve el valor de la última barra mayor que ya había cerrado al cierre
+    de la barra base (fin de tramo <= cierre de la barra); antes de la primera, NaN.
+    """
+    closed_bucket = (base_times + base_width) // width - 1
+    index = np.searchsorted(times // width, closed_bucket, side='right') - 1
+    return np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+
+
+def compute_mtf(minutes: int, key: IndicatorKey, bars: BarSeries) -> np.ndarray:
+    """Indicador calculado en barras de 'minutes' minutos y proyectado sobre 'bars'"""
+    width = minutes * NS_PER_MINUTE
+    base_width = bar_width(bars.time)
+    if width <= base_width:
+        return compute_indicator(key, bars)
+    higher = resample(bars, minutes)
+    return forward_fill(compute_indicator(key, higher), higher.time, bars.time, width, base_width)
+
+
+# Serie(s) de cada indicador a partir de las barras y los argumentos de su clave
+# (los de varias líneas retornan una tupla en el orden de COMPONENTS)
+INDICATOR_FUNCTIONS = {
+    'sma': lambda bars, period, price: sma(applied_price(bars, price), period),
+    'ema': lambda bars, period, price: ema(applied_price(bars, price), period),
+    'smma': lambda bars, period, price: _wilder(applied_price(bars, price), period),
+    'lwma': lambda bars, period, price: lwma(applied_price(bars, price), period),
+    'rsi': lambda bars, period, price: rsi(applied_price(bars, price), period),
+    'momentum': lambda bars, period, price: momentum(applied_price(bars, price), period),
+    'macd': lambda bars, fast, slow, signal, price: macd(applied_price(bars, price), fast, slow, signal),
+    'osma': lambda bars, fast, slow, signal, price: macd(applied_price(bars, price), fast, slow, signal)[2],
+    'stochastic': lambda bars, *args: stochastic(bars.high, bars.low, bars.close, *args),
+    'bollinger': lambda bars, period, deviation, price: bollinger(applied_price(bars, price), period, deviation),
+    'envelopes': lambda bars, period, method, price, deviation: envelopes(
+        applied_price(bars, price), period, method, deviation),
+    'stddev': lambda bars, period, method, price: stddev(applied_price(bars, price), period, method),
+    'atr': lambda bars, period: atr(bars.high, bars.low, bars.close, period),
+    'adx': lambda bars, period: adx(bars.high, bars.low, bars.close, period),
+    'cci': lambda bars, period, price: cci(applied_price(bars, price), period),
+    'wpr': lambda bars, period: williams_r(bars.high, bars.low, bars.close, period),
+    'mfi': lambda bars, period: money_flow_index(bars, period),
+    'demarker': lambda bars, period: demarker(bars.high, bars.low, period),
+    'force': lambda bars, period, method, price: force_index(
+        applied_price(bars, price), bars.volume, period, method),
+    'bears': lambda bars, period, price: bars.low - ema(applied_price(bars, price), period),
+    'bulls': lambda bars, period, price: bars.high - ema(applied_price(bars, price), period),
+    'rvi': lambda bars, period: rvi(bars, period),
+    'chaikin': lambda bars, fast, slow: chaikin(bars, fast, slow),
+    'obv': lambda bars, price: on_balance_volume(applied_price(bars, price), bars.volume),
+    'ad': lambda bars: accumulation_distribution(bars),
+    'volumes': lambda bars: bars.volume,
+    'ao': lambda bars: awesome_oscillator(bars),
+    'ac': lambda bars: accelerator_oscillator(bars),
+    'bw_mfi': lambda bars: market_facilitation_index(bars),
+    'sar': lambda bars, step, maximum: parabolic_sar(bars.high, bars.low, bars.close, step, maximum),
+    'ichimoku': lambda bars, *args: ichimoku(bars.high, bars.low, bars.close, *args),
+    'alligator': lambda bars, *args: alligator(applied_price(bars, args[-1]), *args[:-1]),
+    'gator': lambda bars, *args: gator(applied_price(bars, args[-1]), *args[:-1]),
+    'fractals': lambda bars: fractals(bars.high, bars.low),
+}
+
+
+def compute_indicator(key: IndicatorKey, bars: BarSeries) -> np.ndarray:
+    """Calcula la serie completa de un indicador normalizado (la línea 'component' si tiene varias)"""
+    name, args = key
+    if name == MTF:
+        return compute_mtf(*args, bars)
+    if name == SHIFT:
+        bars_back, inner_key = args
+        return shift_forward(compute_indicator(inner_key, bars), bars_back)
+    if name in PRICE_FIELDS:
+        return bars.column(name)
+    function = INDICATOR_FUNCTIONS.get(name)
+    if function is None:
+        raise ValueError(f"Indicador no soportado: {name}")
+    if name not in COMPONENTS:
+        return function(bars, *args)
+    *args, component = args
+    return function(bars, *args)[COMPONENTS[name].index(component)]
+
+
+def collect_indicator_keys(strategy: Dict[str, Any]) -> List[IndicatorKey]:
+    """Recorre los bloques de la estrategia y retorna los indicadores distintos que usa"""
+    keys: List[IndicatorKey] = []
+    blocks = strategy.get('entryBlocks', []) + strategy.get('exitBlocks', [])
+    for block in blocks:
+        for rule in block.get('rules', []):
+            specs = [rule.get('indicator', {})]
+            comparison_value = rule.get('comparisonValue', {})
+            if comparison_value.get('type') == 'indicator':
+                specs.append(comparison_value.get('indicatorValue', {}))
+
+            for spec in specs:
+                key = spec_key(spec)
+                if key is not None and key not in keys:
+                    keys.append(key)
+    return keys
+
+
+def precompute_indicators(strategy: Dict[str, Any], bars: BarSeries,
+                          cache: Optional[Dict[IndicatorKey, np.ndarray]] = None) -> Dict[IndicatorKey, np.ndarray]:
+    """
+    Precalcula todos los indicadores de la estrategia sobre la serie completa
+
+    Los valores aún no disponibles (periodo de calentamiento) quedan como NaN.
+    Si se pasa 'cache' (series ya calculadas sobre las mismas barras), se reutilizan
+    sus series y las nuevas se añaden a él.
+    """
+    values: Dict[IndicatorKey, np.ndarray] = {}
+    for key in collect_indicator_keys(strategy):
+        if key[0] in PRICE_FIELDS:
+            continue
+        if cache is not None and key in cache:
+            values[key] = cache[key]
+            continue
+        values[key] = compute_indicator(key, bars)
+        if cache is not None:
+            cache[key] = values[key]
+    return values
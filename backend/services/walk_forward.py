@@ -0,0 +1,231 @@
+"""
+Análisis walk-forward
+Divide el rango de fechas en ventanas móviles de entrenamiento/prueba, optimiza en cada
+ventana de entrenamiento y valida la mejor combinación en la ventana de prueba siguiente
+"""
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .bar_archive import ArchiveRange, open_bars
+from .bar_series import BarSeries
+from .indicator_cache import indicator_cache
+from .optimizer import Optimizer, apply_parameters, rank_results, run_optimization_chunk
+from .vector_indicators import compute_indicator
+from .trade_ledger import TradeLedger
+
+
+NS_PER_DAY = 86400 * 10**9
+
+# Barras mínimas de una ventana de entrenamiento (calentamiento de indicadores)
+MIN_TRAIN_BARS = 50
+
+
+def split_windows(times: np.ndarray, train_days: float, test_days: float,
+                  step_days: Optional[float] = None, anchored: bool = False) -> List[Tuple[int, int, int]]:
+    """
+    Ventanas (inicio de entrenamiento, inicio de prueba, fin de prueba) como índices de barra
+
+    Las ventanas avanzan 'step_days' (por defecto, la duración de la prueba), de modo que las
+    pruebas no se solapan. Con 'anchored' el entrenamiento empieza siempre en la primera barra.
+    """
+    if train_days <= 0 or test_days <= 0:
+        raise ValueError("trainDays y testDays deben ser positivos")
+    step_ns = int((step_days or test_days) * NS_PER_DAY)
+    train_ns = int(train_days * NS_PER_DAY)
+    test_ns = int(test_days * NS_PER_DAY)
+    if len(times) == 0:
+        return []
+
+    first_time = int(times[0])
+    windows = []
+    offset = 0
+    while True:
+        train_start_ns = first_time if anchored else first_time + offset
+        test_start_ns = first_time + offset + train_ns
+        test_end_ns = test_start_ns + test_ns
+
+        train_start = int(np.searchsorted(times, train_start_ns, side='left'))
+        test_start = int(np.searchsorted(times, test_start_ns, side='left'))
+        test_end = int(np.searchsorted(times, test_end_ns, side='left'))
+        if test_start >= len(times):
+            break
+        if test_start - train_start >= MIN_TRAIN_BARS and test_end > test_start:
+            windows.append((train_start, test_start, test_end))
+        offset += step_ns
+    return windows
+
+
+def window_indicators(bars: BarSeries, dataset_id: str, keys: List[Any]) -> Dict[Any, np.ndarray]:
+    """
+    Series de indicadores de la serie completa para las claves indicadas
+
+    Salen de la caché de indicadores del proceso (o de la memoria compartida) con la misma
+    clave que en el proceso principal; las que falten se calculan aquí una vez y sirven a
+    las siguientes ventanas que lleguen a este proceso.
+    """
+    cache = indicator_cache.view(bars, dataset_id=dataset_id)
+    for key in keys:
+        if key not in cache:
+            cache[key] = compute_indicator(key, bars)
+    return cache.local
+
+
+def run_walk_forward_window(strategy: Dict[str, Any], config: Dict[str, Any],
+                            combinations: List[Dict[str, Any]], source: Union[BarSeries, ArchiveRange],
+                            dataset_id: str, keys: List[Any], window: Tuple[int, int, int],
+                            sort_by: str, ascending: Optional[bool]) -> Dict[str, Any]:
+    """
+    Optimiza en la parte de entrenamiento y repite la ganadora en la de prueba
+    (se llama dentro de un proceso del pool)
+
+    'source' es la serie completa (o su ArchiveRange, que se abre aquí con np.memmap) y
+    'window' los índices (inicio de entrenamiento, inicio de prueba, fin de prueba); los
+    indicadores se toman de la serie completa, así que la prueba no pierde barras de
+    calentamiento.
+    """
+    from .backtest_engine import BacktestEngine
+
+    train_start, test_start, test_end = window
+    bars = open_bars(source)
+    if isinstance(source, ArchiveRange):
+        # Si el fichero cambió desde que se localizó, las series son las de la versión leída
+        dataset_id = source.fingerprint()
+    series = window_indicators(bars, dataset_id, keys)
+
+    train_bars = bars.slice(train_start, test_start)
+    test_bars = bars.slice(test_start, test_end)
+    train_cache = {key: values[train_start:test_start] for key, values in series.items()}
+    test_cache = {key: values[test_start:test_end] for key, values in series.items()}
+
+    rows = run_optimization_chunk(strategy, config, combinations, train_bars, train_cache)
+    best = rank_results(rows, sort_by, ascending)[0]
+
+    engine = BacktestEngine(apply_parameters(strategy, best['parameters']),
+                            {**config, 'verbose': False, 'monteCarlo': False},
+                            bars=test_bars, indicator_cache=test_cache)
+    result = engine.run()
+    return {
+        'trainStart': train_bars.time_at(0).isoformat(),
+        'trainEnd': train_bars.time_at(len(train_bars) - 1).isoformat(),
+        'testStart': test_bars.time_at(0).isoformat(),
+        'testEnd': test_bars.time_at(len(test_bars) - 1).isoformat(),
+        'bestParameters': best['parameters'],
+        'trainMetrics': best['metrics'],
+        'testMetrics': result['metrics'],
+        'trades': engine.trades,
+        'equityCurve': result['equityCurve'],
+    }
+
+
+class WalkForwardAnalysis:
+    """
+    Walk-forward sobre la rejilla de parámetros de un Optimizer
+
+    Las barras y los indicadores de todas las combinaciones se calculan una sola vez sobre
+    el rango completo. Cada ventana recibe la fuente de las barras (el ArchiveRange si están
+    en la caché .kbar), sus índices y las claves de indicador que usa la rejilla, no copias
+    de los tramos; las ventanas corren en paralelo.
+    """
+
+    def __init__(self, optimizer: Optimizer, train_days: float, test_days: float,
+                 step_days: Optional[float] = None, anchored: bool = False):
+        self.optimizer = optimizer
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days
+        self.anchored = anchored
+        self.windows: List[Tuple[int, int, int]] = []
+
+    def prepare(self):
+        """Carga barras e indicadores compartidos y calcula las ventanas"""
+        if self.optimizer.bars is None:
+            self.optimizer.prepare()
+        self.windows = split_windows(self.optimizer.bars.time, self.train_days, self.test_days,
+                                     self.step_days, self.anchored)
+        if not self.windows:
+            raise ValueError("El rango de fechas no da para ninguna ventana de entrenamiento/prueba")
+        print(f"[WALK_FORWARD] {len(self.windows)} ventanas")
+
+    def window_args(self) -> List[tuple]:
+        """Argumentos de run_walk_forward_window para cada ventana"""
+        if not self.windows:
+            self.prepare()
+        optimizer = self.optimizer
+        # Todas las ventanas optimizan la rejilla completa: usan las claves de todas las combinaciones
+        keys = sorted(set(itertools.chain.from_iterable(optimizer.combination_keys)), key=repr)
+        return [
+            (optimizer.strategy, optimizer.config, optimizer.combinations, optimizer.source,
+             optimizer.dataset_id, keys, window, optimizer.sort_by, optimizer.ascending)
+            for window in self.windows
+        ]
+
+    def run(self, executor=None) -> Dict[str, Any]:
+        """Ejecuta todas las ventanas (en el executor indicado o en este proceso)"""
+        started = time.time()
+        args = self.window_args()
+        if executor is None:
+            window_results = [run_walk_forward_window(*window) for window in args]
+        else:
+            futures = [executor.submit(run_walk_forward_window, *window) for window in args]
+            window_results = [future.result() for future in futures]
+        return self.response(window_results, time.time() - started)
+
+    def response(self, window_results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        """Une las ventanas de prueba en un único resultado fuera de muestra"""
+        from .backtest_engine import BacktestEngine
+
+        optimizer = self.optimizer
+        initial_balance = optimizer.config.get('initialBalance', 10000)
+        balance = initial_balance
+        max_equity = initial_balance
+        equity_curve = []
+        windows = []
+
+        for index, window in enumerate(window_results):
+            # Cada ventana empieza con el balance inicial: se desplaza por el beneficio acumulado
+            offset = balance - initial_balance
+            for point in window['equityCurve']:
+                equity = point['equity'] + offset
+                max_equity = max(max_equity, equity)
+                drawdown = (max_equity - equity) / max_equity * 100 if max_equity > 0 else 0
+                equity_curve.append({
+                    'time': point['time'],
+                    'equity': round(equity, 2),
+                    'drawdown': round(drawdown, 2),
+                    'window': index
+                })
+            balance += float(window['trades'].profit.sum())
+
+            windows.append({
+                'index': index,
+                **{key: value for key, value in window.items() if key not in ('trades', 'equityCurve')}
+            })
+
+        trades = TradeLedger.concatenate([window['trades'] for window in window_results])
+        trades.renumber()
+
+        # Métricas del tramo fuera de muestra completo
+        engine = BacktestEngine(optimizer.strategy, optimizer.config)
+        engine.trades = trades
+        engine.equity_curve = equity_curve
+        engine.balance = balance
+
+        return {
+            'success': True,
+            'strategyName': optimizer.strategy.get('name', 'Strategy'),
+            'symbol': optimizer.config.get('symbol', 'EURUSD'),
+            'timeframe': optimizer.config.get('timeframe', '1h'),
+            'startDate': optimizer.config.get('startDate'),
+            'endDate': optimizer.config.get('endDate'),
+            'totalCombinations': len(optimizer.combinations),
+            'sortBy': optimizer.sort_by,
+            'elapsedSeconds': round(elapsed, 3),
+            'windows': windows,
+            'metrics': engine.calculate_metrics(),
+            'trades': trades.to_dicts(),
+            'equityCurve': equity_curve,
+            'monteCarlo': engine.run_monte_carlo(),
+        }
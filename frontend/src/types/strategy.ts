@@ -17,6 +17,7 @@ export interface IndicatorParameters {
   k_period?: NumericValue;         // %K período (Stochastic)
   d_period?: NumericValue;         // %D período (Stochastic)
   slowing?: NumericValue;          // Ralentización (Stochastic)
+  component?: string;              // Línea de un indicador con varias (ej: 'signal', 'upper', 'kijun')
   [key: string]: any;              // Otros parámetros personalizados
 }
 